@@ -1,40 +1,34 @@
 import tkinter as tk
 from tkinter import ttk, messagebox
-import sqlite3
 from tkcalendar import Calendar
-from datetime import datetime, timedelta
+from datetime import datetime
 from pystray import Icon, MenuItem as item, Menu  # type: ignore
 from PIL import Image  # type: ignore
+import sys
 import threading
+from refsys.instance import SingleInstance
+from refsys.storage import (ChangeWatcher, add_matches_to_db, connect, init_db, notify_matches_changed,
+                            update_db_structure, write_transaction)
+from refsys.conflicts import calculate_end_time, check_time_conflict
+from refsys.stats import STATS_ENGINE
 
-# Initialize or connect to the database
-def init_db():
-    conn = sqlite3.connect('matches.db')
-    cursor = conn.cursor()
-    cursor.execute('''CREATE TABLE IF NOT EXISTS matches
-                      (id INTEGER PRIMARY KEY, league TEXT, role TEXT, subject TEXT, content TEXT, date TEXT, start_time TEXT, end_time TEXT, location TEXT, amount REAL)''')
-    conn.commit()
-    conn.close()
+# One window per matches.db: a second launch brings the running one back (from the tray too) and exits
+instance = SingleInstance("tk")
+if not instance.acquire():
+    instance.send({"action": "show"})
+    sys.exit(0)
 
-# Update the database structure to add the 'amount' column
-def update_db_structure():
-    conn = sqlite3.connect('matches.db')
-    cursor = conn.cursor()
-    try:
-        cursor.execute('ALTER TABLE matches ADD COLUMN amount REAL')
-        conn.commit()
-    except sqlite3.OperationalError:
-        pass
-    conn.close()
+tray_icon = None
 
 def minimize_to_tray():
+    global tray_icon
+
     def quit_window(icon, item):
         window.destroy()
         icon.stop()
 
     def show_window(icon, item):
-        window.deiconify()
-        icon.stop()
+        restore_window()
 
     # Hide the window
     window.withdraw()
@@ -42,30 +36,31 @@ def minimize_to_tray():
     # Create an icon for system tray
     image = Image.open("icon.png")  # You need to have an icon.png in the same directory
     menu = Menu(item('Show', show_window), item('Quit', quit_window))
-    icon = Icon("Referee Management System", image, menu=menu)
+    tray_icon = Icon("Referee Management System", image, menu=menu)
 
     # Start the icon in a separate thread
-    threading.Thread(target=icon.run).start()
-
-# Check for time conflicts before adding a new match
-def check_time_conflict(date, start_time, end_time):
-    conn = sqlite3.connect('matches.db')
-    cursor = conn.cursor()
-    cursor.execute("SELECT start_time, end_time FROM matches WHERE date=?", (date,))
-    existing_matches = cursor.fetchall()
-    conn.close()
-
-    new_start_time = datetime.strptime(start_time, '%H:%M')
-    new_end_time = datetime.strptime(end_time, '%H:%M')
-
-    for match in existing_matches:
-        existing_start = datetime.strptime(match[0], '%H:%M')
-        existing_end = datetime.strptime(match[1], '%H:%M')
+    threading.Thread(target=tray_icon.run).start()
+
+def restore_window():
+    global tray_icon
+    if tray_icon is not None:
+        tray_icon.stop()
+        tray_icon = None
+    window.deiconify()
+    window.lift()
+    window.focus_force()
+
+# Requests from later launches, and writes from other processes (CLI, server, sync, other windows)
+def poll_outside_changes():
+    if instance.pending():
+        restore_window()
+    if watcher.poll():
+        notify_matches_changed()
+        mark_dates_with_matches()
+        show_matches_for_date()
+        update_statistics()
+    window.after(1000, poll_outside_changes)
 
-        if (new_start_time < existing_end and new_end_time > existing_start):
-            return True  # Conflict found
-    return False  # No conflict
-    
 # Add a new match to the database
 def add_new_match():
     new_date = match_date_entry.get()
@@ -92,34 +87,28 @@ def add_new_match():
         messagebox.showerror("Error", "Time conflict detected with another match!")
         return
 
-    conn = sqlite3.connect('matches.db')
-    cursor = conn.cursor()
-    cursor.execute('INSERT INTO matches (league, role, subject, content, date, start_time, end_time, location, amount) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
-                   (new_league, new_role, new_match_name, f"{new_match_name} match details", new_date, new_start_time, new_end_time, new_location, new_amount))
-    conn.commit()
-    conn.close()
+    add_matches_to_db([{
+        "league": new_league, "role": new_role, "match_name": new_match_name, "date": new_date,
+        "start_time": new_start_time, "end_time": new_end_time, "location": new_location, "amount": new_amount,
+    }])
     messagebox.showinfo("Success", "Match added successfully!")
     mark_dates_with_matches()
     show_matches_for_date()
     update_statistics()
 
-# Calculate match end time
-def calculate_end_time(start_time, match_duration=90, break_time=10):
-    start_time_obj = datetime.strptime(start_time, '%H:%M')
-    total_duration = match_duration + break_time
-    end_time_obj = start_time_obj + timedelta(minutes=total_duration)
-    return end_time_obj.strftime('%H:%M')
-
 # Delete a match from the database
 def delete_match():
     selected_item = match_tree.selection()
     if selected_item:
         match_id = match_tree.item(selected_item, "values")[0]
-        conn = sqlite3.connect('matches.db')
-        cursor = conn.cursor()
-        cursor.execute("DELETE FROM matches WHERE id=?", (match_id,))
-        conn.commit()
-        conn.close()
+
+        def delete_row(conn):
+            deleted = conn.execute("SELECT date FROM matches WHERE id=?", (match_id,)).fetchone()
+            conn.execute("DELETE FROM matches WHERE id=?", (match_id,))
+            return deleted
+
+        deleted = write_transaction(delete_row)
+        notify_matches_changed(*(deleted or ()))
         messagebox.showinfo("Success", "Match deleted successfully!")
         mark_dates_with_matches()  
         show_matches_for_date()
@@ -129,27 +118,17 @@ def delete_match():
 
 # Update statistics based on the matches
 def update_statistics():
-    conn = sqlite3.connect('matches.db')
-    cursor = conn.cursor()
-
-    cursor.execute('''SELECT strftime('%Y-%W', date) AS week, SUM(amount) FROM matches GROUP BY week ORDER BY week''')
-    weekly_income = cursor.fetchall()
-
+    periods = STATS_ENGINE.periods()
     weekly_tree.delete(*weekly_tree.get_children())
-    for week, total_income in weekly_income:
-        total_income = total_income if total_income is not None else 0
-        weekly_tree.insert('', 'end', values=(week, f'${total_income:.2f}'))
-
-    cursor.execute('''SELECT strftime('%Y-%m', date) AS month, SUM(amount) FROM matches GROUP BY month ORDER BY month''')
-    monthly_income = cursor.fetchall()
+    for week_start, total_income, games in zip(periods.week_starts, periods.week_totals, periods.week_counts):
+        if games:
+            weekly_tree.insert('', 'end', values=(str(week_start), f'${total_income:.2f}'))
 
+    frame = STATS_ENGINE.frame()
     monthly_tree.delete(*monthly_tree.get_children())
-    for month, total_income in monthly_income:
-        total_income = total_income if total_income is not None else 0
+    for month, total_income in zip(frame.months, frame.month_totals):
         monthly_tree.insert('', 'end', values=(month, f'${total_income:.2f}'))
 
-    conn.close()
-
 # Show matches for the selected date
 def show_matches_for_date():
     selected_date = cal.get_date()
@@ -168,7 +147,7 @@ def show_matches_for_date():
 
 # Load matches for the selected date
 def load_matches(date):
-    conn = sqlite3.connect('matches.db')
+    conn = connect()
     cursor = conn.cursor()
     cursor.execute("SELECT * FROM matches WHERE date=?", (date,))
     rows = cursor.fetchall()
@@ -177,7 +156,7 @@ def load_matches(date):
 
 # Mark dates with matches in the calendar
 def mark_dates_with_matches():
-    conn = sqlite3.connect('matches.db')
+    conn = connect()
     cursor = conn.cursor()
     cursor.execute("SELECT date, COUNT(*) FROM matches GROUP BY date")
     dates_with_matches = cursor.fetchall()
@@ -193,10 +172,13 @@ def mark_dates_with_matches():
 
 # Edit match information window with save functionality
 def edit_match_window(match_id):
-    conn = sqlite3.connect('matches.db')
+    conn = connect()
     cursor = conn.cursor()
     cursor.execute("SELECT * FROM matches WHERE id=?", (match_id,))
     match = cursor.fetchone()
+    # saving only goes ahead if nobody else changed the match in the meantime
+    cursor.execute("SELECT row_version FROM matches WHERE id=?", (match_id,))
+    row_version = (cursor.fetchone() or (None,))[0]
     conn.close()
 
     if not match:
@@ -258,14 +240,18 @@ def edit_match_window(match_id):
             return
 
         # Update match information in the database
-        conn = sqlite3.connect('matches.db')
-        cursor = conn.cursor()
-        cursor.execute('''UPDATE matches 
-                          SET league=?, role=?, subject=?, date=?, start_time=?, location=?, amount=? 
-                          WHERE id=?''', 
-                       (new_league, new_role, new_subject, new_date, new_start_time, new_location, new_amount, match_id))
-        conn.commit()
-        conn.close()
+        saved = write_transaction(lambda conn: conn.execute(
+            '''UPDATE matches
+               SET league=?, role=?, subject=?, date=?, start_time=?, location=?, amount=?
+               WHERE id=? AND row_version IS ?''',
+            (new_league, new_role, new_subject, new_date, new_start_time, new_location, new_amount, match_id,
+             row_version)).rowcount)
+        if not saved:
+            messagebox.showerror("Error", "This match was changed or deleted elsewhere. Open it again to edit.")
+            edit_window.destroy()
+            show_matches_for_date()
+            return
+        notify_matches_changed(match[5], new_date)
         messagebox.showinfo("Success", "Match information updated!")
         edit_window.destroy()
         mark_dates_with_matches()  
@@ -377,9 +363,12 @@ monthly_tree.pack(pady=10, padx=10, fill="x")
 # Initialize database and mark dates with matches
 init_db()
 update_db_structure()
+watcher = ChangeWatcher(skip_own=True)
 mark_dates_with_matches()
 update_statistics()
 # To minimize the window, bind the minimize event
 window.protocol('WM_DELETE_WINDOW', minimize_to_tray)
+window.after(1000, poll_outside_changes)
 # Main loop
 window.mainloop()
+instance.close()
@@ -1,42 +1,35 @@
 import tkinter as tk
 from tkinter import ttk, messagebox
-import sqlite3
 from tkcalendar import Calendar
-from datetime import datetime, timedelta
+from datetime import datetime
 from pystray import Icon, MenuItem as item, Menu
 from PIL import Image
+import sys
 import threading
-import re
-import dateparser
+from refsys.instance import SingleInstance, handoff_files
+from refsys.storage import (ChangeWatcher, add_matches_to_db, connect, init_db, notify_matches_changed,
+                            update_db_structure, write_transaction)
+from refsys.conflicts import calculate_end_time, match_problem
+from refsys.parsing import parse_text_to_match_data
+from refsys.stats import STATS_ENGINE
 
-# Initialize or connect to the database
-def init_db():
-    conn = sqlite3.connect('matches.db')
-    cursor = conn.cursor()
-    cursor.execute('''CREATE TABLE IF NOT EXISTS matches
-                      (id INTEGER PRIMARY KEY, league TEXT, role TEXT, subject TEXT, content TEXT, date TEXT, start_time TEXT, end_time TEXT, location TEXT, amount REAL)''')
-    conn.commit()
-    conn.close()
+# One window per matches.db: a second launch brings the running one back (from the tray too) and exits
+instance = SingleInstance("tk")
+if not instance.acquire():
+    instance.send({"action": "show", "files": handoff_files(sys.argv[1:])})
+    sys.exit(0)
 
-# Update the database structure to add the 'amount' column
-def update_db_structure():
-    conn = sqlite3.connect('matches.db')
-    cursor = conn.cursor()
-    try:
-        cursor.execute('ALTER TABLE matches ADD COLUMN amount REAL')
-        conn.commit()
-    except sqlite3.OperationalError:
-        pass
-    conn.close()
+tray_icon = None
 
 def minimize_to_tray():
+    global tray_icon
+
     def quit_window(icon, item):
         window.destroy()
         icon.stop()
 
     def show_window(icon, item):
-        window.deiconify()
-        icon.stop()
+        restore_window()
 
     # Hide the window
     window.withdraw()
@@ -44,227 +37,60 @@ def minimize_to_tray():
     # Create an icon for system tray
     image = Image.open("C:/Users/kyosh/Desktop/Project/RefSys/icon.png")
     menu = Menu(item('Show', show_window), item('Quit', quit_window))
-    icon = Icon("Referee Management System", image, menu=menu)
+    tray_icon = Icon("Referee Management System", image, menu=menu)
 
     # Start the icon in a separate thread
-    threading.Thread(target=icon.run).start()
-
-# Check for time conflicts before adding a new match
-def check_time_conflict(date, start_time, end_time):
-    conn = sqlite3.connect('matches.db')
-    cursor = conn.cursor()
-    cursor.execute("SELECT start_time, end_time FROM matches WHERE date=?", (date,))
-    existing_matches = cursor.fetchall()
-    conn.close()
-
-    new_start_time = datetime.strptime(start_time, '%H:%M')
-    new_end_time = datetime.strptime(end_time, '%H:%M')
-
-    for match in existing_matches:
-        existing_start = datetime.strptime(match[0], '%H:%M')
-        existing_end = datetime.strptime(match[1], '%H:%M')
-
-        if new_start_time < existing_end and new_end_time > existing_start:
-            return True
-    return False
-
-def parse_spappz_format(text):
-    try:
-        name = re.search(r"Name:\s*(.*)", text).group(1)
-        role = re.search(r"Role:\s*(.*)", text).group(1)
-        division = re.search(r"Division:\s*(.*)", text).group(1)
-        schedule = re.search(r"Schedule date/time:\s*(.*)", text).group(1)
-        field_name = re.search(r"Field Name:\s*(.*)", text).group(1)
-        city = re.search(r"City:\s*(.*)", text).group(1)
-        home_team = re.search(r"Home Team:\s*(.*)", text).group(1)
-        visiting_team = re.search(r"Visiting Team:\s*(.*)", text).group(1)
-
-        date_time = dateparser.parse(schedule)
-        date = date_time.strftime("%Y-%m-%d")
-        start_time = date_time.strftime("%H:%M")
-        match_name = f"{home_team} vs {visiting_team}"
-
-        if "Assistant Referee" in role:
-            role = "AR"
-
-        return {
-            "league": division,
-            "role": role,
-            "match_name": match_name,
-            "date": date,
-            "start_time": start_time,
-            "location": f"{field_name}, {city}"
-        }
-    except Exception as e:
-        messagebox.showerror("Error", f"Failed to parse Spappz format: {e}")
-        return None
-
-def parse_comet_format(text):
-    try:
-        role_match = re.search(r"appointed as (.*?) of the match", text)
-        match_teams = re.search(r"of the match (.*?) and the status", text)
-        match_date = re.search(r"Match Date:\s*(\d{2}\.\d{2}\.\d{4}) (\d{2}:\d{2})", text)
-        stadium = re.search(r"Stadium:\s*(.*?)\s*\(", text)
-        city = re.search(r"Stadium:.*\((.*?)\)", text)
-        field = re.search(r"Field:\s*(.*?)\n", text)
-        competition = re.search(r"Competition:\s*(.*?)\n", text)
-
-        role_raw = role_match.group(1).strip().lower()
-        if "4th official" in role_raw:
-            role = "4th"
-        elif "assistant referee" in role_raw:
-            role = "AR"
-        elif "referee" in role_raw:
-            role = "Referee"
-        else:
-            role = "Official"
-
-        teams = match_teams.group(1).strip().split(" - ")
-        home_team = teams[0].strip()
-        away_team = teams[1].strip() if len(teams) > 1 else "TBD"
-        match_name = f"{home_team} vs {away_team}"
-
-        date = datetime.strptime(match_date.group(1), "%d.%m.%Y").strftime("%Y-%m-%d")
-        start_time = match_date.group(2)
-
-        location_parts = [stadium.group(1).strip()]
-        if city:
-            location_parts.append(city.group(1).strip())
-        if field:
-            location_parts.append(field.group(1).strip())
-        location = ", ".join(location_parts)
-
-        league = competition.group(1).strip()
-
-        return {
-            "league": league,
-            "role": role,
-            "match_name": match_name,
-            "date": date,
-            "start_time": start_time,
-            "location": location
-        }
-
-    except Exception as e:
-        messagebox.showerror("Error", f"Failed to parse Comet format: {e}")
-        return None
-
-def parse_assignr_format(text):
-    try:
-        matches = []
-        role_lines = re.findall(r"(Referee|Assistant Referee(?: \d)?):\s*(.*?)\s*@\s*(.*?)", text)
-        description_lines = re.findall(r"#(.*)", text)
-
-        for i, (role_label, datetime_str, location) in enumerate(role_lines):
-            if i >= len(description_lines):
-                continue  # 防止描述缺失时越界
-            details = description_lines[i].strip()
-
-            # role 判断
-            if "Assistant Referee" in role_label:
-                role = "AR"
-            elif "Referee" in role_label:
-                role = "Referee"
-            else:
-                role = "Official"
-
-            # 时间解析
-            dt = dateparser.parse(datetime_str)
-            date = dt.strftime("%Y-%m-%d")
-            start_time = dt.strftime("%H:%M")
-
-            location = location.strip()
-
-            # 更鲁棒的年龄组识别（U16 D2 / U16M / U13 / U18A 等）
-            age_group_match = re.search(r"U\d{2}(?:\s*[A-Z0-9]*)", details, re.IGNORECASE)
-            if age_group_match:
-                age_group = age_group_match.group(0).replace(" ", "").upper()
-            else:
-                age_group = "Unknown"
-            league = f"BCCSL {age_group}"
-
-            # 比赛时长识别
-            duration_match = re.search(r"Two x (\d{2})min/(\d{1,2})min", details)
-            if duration_match:
-                half_minutes = int(duration_match.group(1))
-                break_minutes = int(duration_match.group(2))
-                total_minutes = half_minutes * 2 + break_minutes
-            else:
-                total_minutes = 90 + 10
-
-            end_time_obj = dt + timedelta(minutes=total_minutes)
-            end_time = end_time_obj.strftime('%H:%M')
-
-            match_name = f"{role} @ {league}"
-
-            matches.append({
-                "league": league,
-                "role": role,
-                "match_name": match_name,
-                "date": date,
-                "start_time": start_time,
-                "end_time": end_time,
-                "location": location
-            })
-
-        return matches
-
-    except Exception as e:
-        messagebox.showerror("Error", f"Failed to parse Assignr format: {e}")
-        return []
-
-
-def parse_text_to_match_data(text):
-    try:
-        if "Schedule date/time" in text:
-            return [parse_spappz_format(text)]
-        elif "appointed as" in text and "Match Date" in text:
-            return [parse_comet_format(text)]
-        elif "Referee:" in text or "Assistant Referee" in text:
-            return parse_assignr_format(text)
-        else:
-            raise ValueError("Unrecognized text format.")
-    except Exception as e:
-        messagebox.showerror("Error", f"Failed to parse match data: {e}")
-        return []
-# Parse match details from text for the Auto tab
-def parse_text_to_match_data(text):
+    threading.Thread(target=tray_icon.run).start()
+
+def restore_window():
+    global tray_icon
+    if tray_icon is not None:
+        tray_icon.stop()
+        tray_icon = None
+    window.deiconify()
+    window.lift()
+    window.focus_force()
+
+# Put a file's text in the Auto tab, ready to parse
+def load_auto_text(path):
     try:
-        if "Schedule date/time" in text:
-            return [parse_spappz_format(text)]
-        elif "appointed as" in text and "Match Date" in text:
-            return [parse_comet_format(text)]
-        elif "Referee:" in text or "Assistant Referee" in text:
-            return parse_assignr_format(text)
-        else:
-            raise ValueError("Unrecognized text format.")
-    except Exception as e:
-        messagebox.showerror("Error", f"Failed to parse match data: {e}")
-        return []
+        with open(path, encoding="utf-8") as f:
+            text = f.read()
+    except (OSError, UnicodeDecodeError):
+        return
+    auto_text.delete("1.0", "end")
+    auto_text.insert("1.0", text)
+    notebook.select(auto_frame)
+
+# Requests from later launches, and writes from other processes (CLI, server, sync, other windows)
+def poll_outside_changes():
+    for message in instance.pending():
+        restore_window()
+        for path in message.get("files", ()):
+            load_auto_text(path)
+    if watcher.poll():
+        notify_matches_changed()
+        mark_dates_with_matches()
+        show_matches_for_date()
+        update_statistics()
+    window.after(1000, poll_outside_changes)
+
 # Add parsed match data to database
 def auto_add_match():
     text = auto_text.get("1.0", "end-1c")
     match_data_list = parse_text_to_match_data(text)
 
+    if not match_data_list:
+        messagebox.showerror("Error", "Failed to parse match data: unrecognized text format.")
+        return
+
     for match_data in match_data_list:
-        league = match_data["league"]
-        role = match_data["role"]
-        match_name = match_data["match_name"]
-        date = match_data["date"]
-        start_time = match_data["start_time"]
-        end_time = match_data.get("end_time") or calculate_end_time(start_time)
-        location = match_data["location"]
-
-        if check_time_conflict(date, start_time, end_time):
-            messagebox.showerror("Error", f"Time conflict detected for {match_name}!")
+        match_data["end_time"] = match_data.get("end_time") or calculate_end_time(match_data["start_time"])
+        problem = match_problem(match_data)
+        if problem:
+            messagebox.showerror("Error", f"Can't add {match_data['match_name']}: {problem}")
             continue
-
-        conn = sqlite3.connect('matches.db')
-        cursor = conn.cursor()
-        cursor.execute('INSERT INTO matches (league, role, subject, content, date, start_time, end_time, location, amount) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
-                       (league, role, match_name, f"{match_name} details", date, start_time, end_time, location, 0))
-        conn.commit()
-        conn.close()
+        add_matches_to_db([match_data])
 
     messagebox.showinfo("Success", "Match(es) added successfully!")
     mark_dates_with_matches()
@@ -272,23 +98,19 @@ def auto_add_match():
     update_statistics()
 
 
-# Calculate match end time
-def calculate_end_time(start_time, match_duration=90, break_time=10):
-    start_time_obj = datetime.strptime(start_time, '%H:%M')
-    total_duration = match_duration + break_time
-    end_time_obj = start_time_obj + timedelta(minutes=total_duration)
-    return end_time_obj.strftime('%H:%M')
-
 # Delete a match from the database
 def delete_match():
     selected_item = match_tree.selection()
     if selected_item:
         match_id = match_tree.item(selected_item, "values")[0]
-        conn = sqlite3.connect('matches.db')
-        cursor = conn.cursor()
-        cursor.execute("DELETE FROM matches WHERE id=?", (match_id,))
-        conn.commit()
-        conn.close()
+
+        def delete_row(conn):
+            deleted = conn.execute("SELECT date FROM matches WHERE id=?", (match_id,)).fetchone()
+            conn.execute("DELETE FROM matches WHERE id=?", (match_id,))
+            return deleted
+
+        deleted = write_transaction(delete_row)
+        notify_matches_changed(*(deleted or ()))
         messagebox.showinfo("Success", "Match deleted successfully!")
         mark_dates_with_matches()
         show_matches_for_date()
@@ -298,27 +120,17 @@ def delete_match():
 
 # Update statistics based on the matches
 def update_statistics():
-    conn = sqlite3.connect('matches.db')
-    cursor = conn.cursor()
-
-    cursor.execute('''SELECT strftime('%Y-%W', date) AS week, SUM(amount) FROM matches GROUP BY week ORDER BY week''')
-    weekly_income = cursor.fetchall()
-
+    periods = STATS_ENGINE.periods()
     weekly_tree.delete(*weekly_tree.get_children())
-    for week, total_income in weekly_income:
-        total_income = total_income if total_income is not None else 0
-        weekly_tree.insert('', 'end', values=(week, f'${total_income:.2f}'))
-
-    cursor.execute('''SELECT strftime('%Y-%m', date) AS month, SUM(amount) FROM matches GROUP BY month ORDER BY month''')
-    monthly_income = cursor.fetchall()
+    for week_start, total_income, games in zip(periods.week_starts, periods.week_totals, periods.week_counts):
+        if games:
+            weekly_tree.insert('', 'end', values=(str(week_start), f'${total_income:.2f}'))
 
+    frame = STATS_ENGINE.frame()
     monthly_tree.delete(*monthly_tree.get_children())
-    for month, total_income in monthly_income:
-        total_income = total_income if total_income is not None else 0
+    for month, total_income in zip(frame.months, frame.month_totals):
         monthly_tree.insert('', 'end', values=(month, f'${total_income:.2f}'))
 
-    conn.close()
-
 # Show matches for the selected date
 def show_matches_for_date():
     selected_date = cal.get_date()
@@ -337,7 +149,7 @@ def show_matches_for_date():
 
 # Load matches for the selected date
 def load_matches(date):
-    conn = sqlite3.connect('matches.db')
+    conn = connect()
     cursor = conn.cursor()
     cursor.execute("SELECT * FROM matches WHERE date=?", (date,))
     rows = cursor.fetchall()
@@ -346,7 +158,7 @@ def load_matches(date):
 
 # Mark dates with matches in the calendar
 def mark_dates_with_matches():
-    conn = sqlite3.connect('matches.db')
+    conn = connect()
     cursor = conn.cursor()
     cursor.execute("SELECT date, COUNT(*) FROM matches GROUP BY date")
     dates_with_matches = cursor.fetchall()
@@ -362,10 +174,13 @@ def mark_dates_with_matches():
 
 # Edit match information window with save functionality
 def edit_match_window(match_id):
-    conn = sqlite3.connect('matches.db')
+    conn = connect()
     cursor = conn.cursor()
     cursor.execute("SELECT * FROM matches WHERE id=?", (match_id,))
     match = cursor.fetchone()
+    # saving only goes ahead if nobody else changed the match in the meantime
+    cursor.execute("SELECT row_version FROM matches WHERE id=?", (match_id,))
+    row_version = (cursor.fetchone() or (None,))[0]
     conn.close()
 
     if not match:
@@ -425,14 +240,18 @@ def edit_match_window(match_id):
             messagebox.showerror("Error", "Please enter a valid amount!")
             return
 
-        conn = sqlite3.connect('matches.db')
-        cursor = conn.cursor()
-        cursor.execute('''UPDATE matches 
-                          SET league=?, role=?, subject=?, date=?, start_time=?, location=?, amount=? 
-                          WHERE id=?''', 
-                       (new_league, new_role, new_subject, new_date, new_start_time, new_location, new_amount, match_id))
-        conn.commit()
-        conn.close()
+        saved = write_transaction(lambda conn: conn.execute(
+            '''UPDATE matches
+               SET league=?, role=?, subject=?, date=?, start_time=?, location=?, amount=?
+               WHERE id=? AND row_version IS ?''',
+            (new_league, new_role, new_subject, new_date, new_start_time, new_location, new_amount, match_id,
+             row_version)).rowcount)
+        if not saved:
+            messagebox.showerror("Error", "This match was changed or deleted elsewhere. Open it again to edit.")
+            edit_window.destroy()
+            show_matches_for_date()
+            return
+        notify_matches_changed(match[5], new_date)
         messagebox.showinfo("Success", "Match information updated!")
         edit_window.destroy()
         mark_dates_with_matches()  
@@ -553,7 +372,12 @@ parse_button.pack(pady=10)
 # Initialize database and start program
 init_db()
 update_db_structure()
+watcher = ChangeWatcher(skip_own=True)
 mark_dates_with_matches()
 update_statistics()
+for path in handoff_files(sys.argv[1:]):
+    load_auto_text(path)
 window.protocol('WM_DELETE_WINDOW', minimize_to_tray)
+window.after(1000, poll_outside_changes)
 window.mainloop()
+instance.close()
@@ -1,408 +1,158 @@
-from pathlib import Path
+import time
+_PROCESS_START = time.perf_counter()
+
 import sys
-import sqlite3
-from datetime import datetime, timedelta
-import re
-import dateparser
+from startup_profile import ImportProfiler, StartupProfile
+STARTUP = StartupProfile(_PROCESS_START)
+if "--profile-startup" in sys.argv:
+    STARTUP.imports = ImportProfiler.install()
+
+from pathlib import Path
+import json
+from datetime import datetime
+import threading
+import bisect
+import logging
+import importlib.util
+import os
+from collections import OrderedDict
+import numpy as np
 from PySide6.QtWidgets import (
     QApplication, QWidget, QVBoxLayout, QLabel, QTextEdit, QPushButton, QMessageBox,
     QTabWidget, QLineEdit, QTableWidget, QTableWidgetItem, QHeaderView,
     QCalendarWidget, QFormLayout, QToolTip, QAbstractItemView, QCalendarWidget,
-    QDoubleSpinBox, QCheckBox, QHBoxLayout, QComboBox, QTimeEdit, QSizePolicy
+    QDoubleSpinBox, QCheckBox, QHBoxLayout, QComboBox, QTimeEdit, QSizePolicy, QTableView,
+    QListView, QDateEdit
 )
 from PySide6.QtGui import QCursor
-from qt_material import apply_stylesheet
-from PySide6.QtGui import QTextCharFormat, QHelpEvent, QColor, QFont
-from PySide6.QtCore import  QRect, QModelIndex, QPoint, QDate, Qt, QLocale
-from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
-from matplotlib.figure import Figure
-
-# === Referee Payment Rates ===
-BCCR_RATES = {
-    "BCCSL": {
-        "Referee": {
-            "U8": 20, "U9": 23, "U10": 25,
-            "U11D3": 30, "U12D3": 30,
-            "U11": 35, "U12": 35, "U13": 40,
-            "U14": 65, "U15": 65, "U16": 65,
-            "U17": 75, "U18": 75,
-        },
-        "AR": {
-            "U14": 40, "U15": 40, "U16": 40,
-            "U17": 45, "U18": 45,
-        }
-    },
-    "BCSPL": {
-        "Referee": {
-            "U14": 65, "U15": 65, "U16": 65,
-            "U17": 75, "U18": 75,
-        },
-        "AR": {
-            "U14": 40, "U15": 40, "U16": 40,
-            "U17": 50, "U18": 50,
-        }
-    }
-}
-
-# ---------- Database ----------
-def init_db():
-    conn = sqlite3.connect('matches.db')
-    cursor = conn.cursor()
-    cursor.execute('''CREATE TABLE IF NOT EXISTS matches
-                      (id INTEGER PRIMARY KEY, league TEXT, role TEXT, subject TEXT, content TEXT,
-                      date TEXT, start_time TEXT, end_time TEXT, location TEXT, amount REAL)''')
-    conn.commit()
-    conn.close()
-
-def update_db_structure():
-    conn = sqlite3.connect('matches.db')
-    cursor = conn.cursor()
-    try:
-        cursor.execute('ALTER TABLE matches ADD COLUMN amount REAL')
-    except sqlite3.OperationalError:
-        pass
-    try:
-        cursor.execute('ALTER TABLE matches ADD COLUMN division TEXT')
-    except sqlite3.OperationalError:
-        pass
-    conn.commit()
-    conn.close()
-
-def check_time_conflict(date, start_time, end_time):
-    conn = sqlite3.connect('matches.db')
-    cursor = conn.cursor()
-    cursor.execute("SELECT start_time, end_time FROM matches WHERE date=?", (date,))
-    existing_matches = cursor.fetchall()
-    conn.close()
-
-    new_start = datetime.strptime(start_time, '%H:%M')
-    new_end = datetime.strptime(end_time, '%H:%M')
-
-    for existing_start_str, existing_end_str in existing_matches:
-        existing_start = datetime.strptime(existing_start_str, '%H:%M')
-        existing_end = datetime.strptime(existing_end_str, '%H:%M')
-        if new_start < existing_end and new_end > existing_start:
+from PySide6.QtGui import (
+    QTextCharFormat, QHelpEvent, QColor, QFont, QImage, QPixmap, QFontDatabase, QGuiApplication, QPalette
+)
+from PySide6.QtCore import (
+    QRect, QModelIndex, QPoint, QDate, QDir, Qt, QLocale, QObject, Signal, QRunnable, QThreadPool,
+    QAbstractTableModel, QAbstractListModel, QTimer
+)
+from refsys import storage
+from refsys.storage import (
+    ChangeWatcher, add_matches_to_db, connect, init_db, list_referees, load_month_summary,
+    notify_matches_changed, on_matches_changed, update_db_structure, write_transaction
+)
+from refsys.instance import SingleInstance, handoff_files
+from refsys.conflicts import match_problem
+from refsys.parsing import parse_text_to_match_data
+from refsys.pricing import run_reprice_cli
+from refsys.stats import CUBE_DIMENSIONS, EARNINGS_CUBE, STATS_ENGINE, season_start_year
+STARTUP.add("imports", _PROCESS_START)
+
+logger = logging.getLogger("refsys")
+
+def configure_logging():
+    # REFSYS_LOG_LEVEL=DEBUG for hover / parser diagnostics; the windowed exe has no stderr at all
+    if sys.stderr is None:
+        logger.addHandler(logging.NullHandler())
+        return
+    logging.basicConfig(format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    logger.setLevel(os.environ.get("REFSYS_LOG_LEVEL", "WARNING").upper())
+
+# ---------- Month summaries ----------
+class MonthSummaryCache:
+    """Small thread-safe LRU of per-month summaries keyed (year, month, referee_id), invalidated month by month."""
+
+    def __init__(self, capacity=12):
+        self.capacity = capacity
+        self._lock = threading.Lock()
+        self._months = OrderedDict()
+        self._generations = {}
+        self._epoch = 0  # bumped by clear(), so loads started before it are dropped too
+
+    def get(self, key):
+        with self._lock:
+            summary = self._months.get(key)
+            if summary is not None:
+                self._months.move_to_end(key)
+            return summary
+
+    def generation(self, key):
+        with self._lock:
+            return self._epoch, self._generations.get(key[:2], 0)
+
+    def put(self, key, summary, generation=None):
+        with self._lock:
+            # a write landed while this month was being loaded, the result is already stale
+            if generation is not None and generation != (self._epoch, self._generations.get(key[:2], 0)):
+                return False
+            self._months[key] = summary
+            self._months.move_to_end(key)
+            while len(self._months) > self.capacity:
+                self._months.popitem(last=False)
             return True
-    return False
-
-def add_matches_to_db(matches):
-    conn = sqlite3.connect("matches.db")
-    cursor = conn.cursor()
-    for match in matches:
-        amount = match.get('amount', 0.0)  # auto amount
-        cursor.execute(
-            '''INSERT INTO matches (league, role, subject, content, date, start_time, end_time, location, amount, division)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''',
-            (match['league'], match['role'], match['match_name'], f"{match['match_name']} details",
-            match['date'], match['start_time'], match['end_time'], match['location'], match.get('amount', 0.0), match.get('division', ''))
-        )
-    conn.commit()
-    conn.close()
-
-# ---------- Parsers ----------
-def parse_text_to_match_data(text):
-    if "Schedule date/time" in text:
-        return [parse_spappz_format(text)]
-    elif "appointed as" in text and "Match Date" in text:
-        return parse_comet_format(text)
-    elif "Referee:" in text or "Assistant Referee" in text:
-        return parse_assignr_format(text)
-    #elif "Game #" in text and "-v-" in text and ("BC Assignments" in text or "Canwest" in text):
-    #    return parse_refcenter_format(text)
-    return []
-
-def parse_refcenter_format(text):       
-    lines = [line.strip() for line in text.strip().splitlines() if line.strip()]
-    merged_lines = []
-    if len(lines) == 1:
-        line = lines[0]
-        try:
-            #  League name
-            league_match = re.search(r"(BC Assignments\s+)?(Canwest Women|BC Soccer)", line)
-            league = league_match.group(2).strip() if league_match else "League"
-
-            # match name
-            match_match = re.search(r"Game #\d+\s+(.+?)\s+-v-\s+(.+?)\s+(.*?)\s+(?:Jan|Feb|Mar|Apr|May|Jun|Jul|Aug|Sep|Oct|Nov|Dec)", line)
-            if not match_match:
-                raise ValueError("Match pattern not found")
-            team1 = match_match.group(1).strip()
-            team2 = match_match.group(2).strip()
-            location = match_match.group(3).strip()
-
-            # time
-            date_match = re.search(r"(Jan|Feb|Mar|Apr|May|Jun|Jul|Aug|Sep|Oct|Nov|Dec)\s+\d{1,2},\s+\d{4}\s+at\s+\d{1,2}:\d{2}", line)
-            dt_str = date_match.group(0) if date_match else None
-            dt = dateparser.parse(dt_str)
-
-            return [{
-                "league": league,
-                "role": "",
-                "match_name": f"{team1} -v- {team2}",
-                "date": dt.strftime("%Y-%m-%d"),
-                "start_time": dt.strftime("%H:%M"),
-                "end_time": (dt + timedelta(minutes=100)).strftime("%H:%M"),
-                "location": location
-            }]
-        except Exception as e:
-            print("❌ RefCenter parsing failed:", e)
-            return []
-    matches = []
-    block = []
-    for line in lines:
-        if "Game #" in line and block:
-            matches.append(block)
-            block = []
-        block.append(line)
-    if block:
-        matches.append(block)
-
-    parsed = []
-    for block in matches:
-        try:
-            if len(block) < 6:
-                raise ValueError("Block too short")
-
-            league = block[1].strip()
-            match_name = block[3].strip()
-            location = block[4].strip()
-            dt = dateparser.parse(block[5].strip())
-
-            parsed.append({
-                "league": league,
-                "role": "",
-                "match_name": match_name,
-                "date": dt.strftime("%Y-%m-%d"),
-                "start_time": dt.strftime("%H:%M"),
-                "end_time": (dt + timedelta(minutes=100)).strftime("%H:%M"),
-                "location": location
-            })
-        except Exception as e:
-            print("❌ RefCenter parsing error:", e, block)
-
-    return parsed
-
-def parse_spappz_format(text):
-    role = re.search(r"Role:\s*(.*)", text).group(1)
-    division = re.search(r"Division:\s*(.*)", text).group(1).strip()
-    schedule = re.search(r"Schedule date/time:\s*(.*)", text).group(1)
-    field_name = re.search(r"Field Name:\s*(.*)", text).group(1)
-    city = re.search(r"City:\s*(.*)", text).group(1)
-    home_team = re.search(r"Home Team:\s*(.*)", text).group(1)
-    visiting_team = re.search(r"Visiting Team:\s*(.*)", text).group(1)
-    dt = dateparser.parse(schedule)
-    date = dt.strftime("%Y-%m-%d")
-    start_time = dt.strftime("%H:%M")
-    end_time = (dt + timedelta(minutes=100)).strftime("%H:%M")
-    match_name = f"{home_team} vs {visiting_team}"
-    role_clean = "AR" if "Assistant" in role else "Referee"
-    # 🏷️ League
-    if "Metro Women's Soccer League" in text or "MWSL" in text:
-        league = "MWSL"
-    elif "Fraser Valley Soccer League" in text or "FVSL" in text:
-        league = "FVSL"
-    elif "Vancouver Metro Soccer League" in text or "VMSL" in text :
-        league = "VMSL"
-    else:
-        league = "League"
-    if any(kw in division for kw in ["Premier", "Imperial Cup", "Prime"]):
-        amount = 110 if role_clean == "Referee" else 70
-    else:
-        amount = 100 if role_clean == "Referee" else 60
-    return {
-        "league": league,
-        "division": division,
-        "role": role_clean,
-        "match_name": match_name,
-        "date": date,
-        "start_time": start_time,
-        "end_time": end_time,
-        "location": f"{field_name}, {city}",
-        "amount": amount
-    }
 
-def parse_comet_format(text):
-    try:
-        text = text.replace('\xa0', ' ').replace('\u200b', '').replace('\r\n', '\n')
-        print("Text:", text)
-        role_match = re.search(r"appointed as (.*?) of the match", text)
-        match_teams = re.search(r"of the match (.*?) and the status", text)
-        match_date = re.search(r"Match Date:\s*(\d{2}\.\d{2}\.\d{4}) (\d{2}:\d{2})", text)
-        stadium = re.search(r"Stadium:\s*(.*?)\s*\(", text)
-        city = re.search(r"Stadium:.*\((.*?)\)", text)
-        league_match = re.search(r"Competition:\s*(.*)", text)
-        amount = 0.0  
-        text = text.replace('\xa0', ' ').replace('\u200b', '').replace('\r\n', '\n')
-
-        if not all([role_match, match_teams, match_date, stadium, city, league_match]):
-            print("❌ Some parts missing in COMET match.")
-            return []
-
-        league_match = re.search(r"Competition:\s*(.*?)(?:\s*Comment:|$)", text)
-        league_raw = league_match.group(1).strip()
-        known_leagues = ["BCSPL", "BCCSL", "VMSL", "MWSL", "FVSL", "BC Soccer"]
-        parts = league_raw.split()
-        if len(parts) >= 2:
-            candidate_league = " ".join(parts[:2])
-            if candidate_league in known_leagues:
-                league = candidate_league
-                division = " ".join(parts[2:]).strip()
-            elif parts[0] in known_leagues:
-                league = parts[0]
-                division = " ".join(parts[1:]).strip()
-            else:
-                league = league_raw
-                division = ""
-        else:
-            league = league_raw
-            division = ""
-
-        # ✅ role
-        role_raw = role_match.group(1).strip().lower()
-        if "4th official" in role_raw:
-            role = "4th"
-        elif "assistant" in role_raw:
-            role = "AR"
-        elif "referee" in role_raw:
-            role = "Referee"
-        else:
-            role = "Official"
-
-        # ✅ match info 
-        teams = match_teams.group(1).strip().split(" - ")
-        match_name = f"{teams[0].strip()} vs {teams[1].strip() if len(teams) > 1 else 'TBD'}"
-
-        # ✅ date and time
-        date = datetime.strptime(match_date.group(1), "%d.%m.%Y").strftime("%Y-%m-%d")
-        start_time = match_date.group(2)
-        end_time = (datetime.strptime(start_time, "%H:%M") + timedelta(minutes=100)).strftime("%H:%M")
-
-        # ✅ amount
-        if "BC Soccer" in league and "Cup" in division:
-            amount = 100 if role == "Referee" else 60
-        elif "BCSPL" in league:
-            division = league_raw.split()[-1]  # 例如 U16
-            amount = infer_match_amount("BCSPL", role, division)
-
-        return [{
-            "league": league,
-            "division": division,
-            "role": role,
-            "match_name": match_name,
-            "date": date,
-            "start_time": start_time,
-            "end_time": end_time,
-            "location": f"{stadium.group(1).strip()}, {city.group(1).strip()}",
-            "amount": amount
-        }]
-
-    except Exception as e:
-        print("❌ parse_comet_format error:", e)
-        return []
-
-def parse_assignr_format(text):
-    import re
-    matches = []
-    lines = [line.strip() for line in text.strip().splitlines() if line.strip()]
-    blocks = []
-    current_block = []
-
-    for line in lines:
-        if re.match(r"(Referee|Assistant Referee(?: \d*)?):", line):
-            if current_block:
-                blocks.append(current_block)
-                current_block = []
-        current_block.append(line)
-    if current_block:
-        blocks.append(current_block)
-
-    for block in blocks:
-        try:
-            header = block[0]
-            desc_line = next((l for l in block if l.startswith("#")), "")
-            details = desc_line.replace("#", "").strip()
+    def invalidate(self, month):
+        # month is (year, month); every referee filter's copy goes
+        with self._lock:
+            for key in [k for k in self._months if k[:2] == month]:
+                del self._months[key]
+            self._generations[month] = self._generations.get(month, 0) + 1
+
+    def clear(self):
+        with self._lock:
+            self._months.clear()
+            self._epoch += 1
+
+    def invalidate_dates(self, *dates):
+        if not dates:
+            # a write from another process: which months it touched is unknown
+            self.clear()
+        for date_str in dates:
+            try:
+                day = datetime.strptime(date_str, "%Y-%m-%d")
+            except (TypeError, ValueError):
+                continue
+            self.invalidate((day.year, day.month))
 
-            print("🧪 Raw details:", details)
+MONTH_CACHE = MonthSummaryCache()
 
-            role_match = re.match(r"(Referee|Assistant Referee(?: \d*)?):\s*(.*?)\s*@\s*(.+)", header)
-            if not role_match:
-                print("❌ Invalid header:", header)
-                continue
+class QueryMemo:
+    """Results of read queries, kept until the next write."""
 
-            role_label, dt_str, location = role_match.groups()
-            dt = dateparser.parse(dt_str)
-            if not dt:
-                print("❌ Invalid datetime:", dt_str)
-                continue
+    def __init__(self, capacity=64):
+        self.capacity = capacity
+        self._results = OrderedDict()
 
-            # ⏱️ time
-            half_duration = 45
-            halftime_break = 10
-            duration_match = re.search(r"Two x (\d+)min/(\d+)min HT", details)
-            if duration_match:
-                half_duration = int(duration_match.group(1))
-                halftime_break = int(duration_match.group(2))
-
-            total_minutes = 2 * half_duration + halftime_break
-            start_time = dt.strftime("%H:%M")
-            end_time = (dt + timedelta(minutes=total_minutes)).strftime("%H:%M")
-            date = dt.strftime("%Y-%m-%d")
-
-            role = "AR" if "Assistant" in role_label else "Referee"
-
-            # BCCSL / BCSPL / League
-            if "Cup" in details:
-                cup_match = re.search(r"([ABC]) Cup", details)
-                cup = cup_match.group(1) if cup_match else "Unknown"
-                league = "BCCSL"
-            else:
-                league_match = re.search(r"\b([A-Z]+SPL|BCCSL)\b", details)
-                league = league_match.group(1) if league_match else "League"
-
-            div_match = re.search(r"U\s*(\d{2})\s*([A-Z0-9]+)?", details, re.IGNORECASE)
-            if div_match:
-                age = div_match.group(1)
-                level = div_match.group(2) or ''
-                level = re.sub(r'\W+', '', level)
-                division = f"U{age}{level}"
-            else:
-                print("🧪 Division match: No match")
-                division = "Unknown"
+    def get(self, key, compute):
+        if key in self._results:
+            self._results.move_to_end(key)
+            return self._results[key]
+        result = compute()
+        self._results[key] = result
+        while len(self._results) > self.capacity:
+            self._results.popitem(last=False)
+        return result
 
-            if "Cup" in details:
-                match_name = f"{league} {cup} Cup ({division})"
-            else:
-                match_name = f"{league} ({division})"
-            amount = infer_match_amount(league, role, division)
-            matches.append({
-                "league": league,
-                "division": division,
-                "role": role,
-                "match_name": match_name,
-                "date": date,
-                "start_time": start_time,
-                "end_time": end_time,
-                "location": location.strip(),
-                "amount": amount
-            })
+    def clear(self):
+        self._results.clear()
 
-        except Exception as e:
-            print("❌ Assignr parsing failed:", e, block)
+QUERY_MEMO = QueryMemo()
 
-    return matches
+on_matches_changed(MONTH_CACHE.invalidate_dates)
+on_matches_changed(lambda *dates: QUERY_MEMO.clear())
 
-def infer_match_amount(league, role, division):
-    league = league.upper()
-    role = role if role in ["Referee", "AR"] else "Referee"
-    age_match = re.search(r"U(\d{2})", division.upper())
-    if not age_match:
-        return 0.0
-    age = f"U{age_match.group(1)}"
-    if "D3" in division.upper():
-        age = age + "D3"
+class MonthPrefetchSignals(QObject):
+    loaded = Signal(int, int)
+
+class MonthPrefetchTask(QRunnable):
+    def __init__(self, year, month, referee_id, signals):
+        super().__init__()
+        self.year = year
+        self.month = month
+        self.referee_id = referee_id
+        self.signals = signals
+        self.generation = MONTH_CACHE.generation((year, month))
 
-    rates = BCCR_RATES.get(league, {})
-    role_rates = rates.get(role, {})
-    return float(role_rates.get(age, 0.0))
+    def run(self):
+        summary = load_month_summary(self.year, self.month, self.referee_id)
+        if MONTH_CACHE.put((self.year, self.month, self.referee_id), summary, self.generation):
+            self.signals.loaded.emit(self.year, self.month)
 
 # ---------- Tabs ----------
 class AutoTab(QWidget):
@@ -416,16 +166,22 @@ class AutoTab(QWidget):
         layout.addWidget(self.text_input)
         layout.addWidget(self.button)
 
+    def load_file(self, path):
+        # a file given on the command line (or handed over by a second launch), ready to parse
+        try:
+            with open(path, encoding="utf-8") as f:
+                self.text_input.setPlainText(f.read())
+        except (OSError, UnicodeDecodeError) as e:
+            logger.warning("Can't load %s: %s", path, e)
+            return False
+        return True
+
     def parse_and_add(self):
         text = self.text_input.toPlainText().strip()
         if not text:
             QMessageBox.warning(self, "Warning", "No text provided.")
             return
 
-        text = text.replace('\xa0', ' ')
-        text = text.replace('\u200b', '')
-        text = text.replace('\r\n', '\n')
-
         matches = parse_text_to_match_data(text)
         if not matches:
             QMessageBox.critical(self, "Error", "Failed to parse match info.")
@@ -433,8 +189,10 @@ class AutoTab(QWidget):
 
         added = 0
         for match in matches:
-            if check_time_conflict(match['date'], match['start_time'], match['end_time']):
-                QMessageBox.warning(self, "Conflict", f"Time conflict for {match['match_name']}")
+            problem = match_problem(match)
+            if problem:
+                who = f" ({match['referee']})" if match.get('referee') else ""
+                QMessageBox.warning(self, "Conflict", f"{match['match_name']}{who}: {problem}")
                 continue
             add_matches_to_db([match])
             added += 1
@@ -450,7 +208,8 @@ class AddMatchTab(QWidget):
         super().__init__()
         layout = QFormLayout(self)
         self.inputs = {}
-        for label in ["League", "Role", "Match Name", "Date (YYYY-MM-DD)", "Start Time", "End Time", "Location", "Amount"]:
+        for label in ["League", "Role", "Match Name", "Date (YYYY-MM-DD)", "Start Time", "End Time", "Location", "Amount",
+                      "Referee"]:
             if "Time" in label and "Date" not in label:  # 区分掉日期字段
                 entry = QTimeEdit()
                 entry.setDisplayFormat("HH:mm")
@@ -476,20 +235,24 @@ class AddMatchTab(QWidget):
             if not date.isValid():
                 QMessageBox.critical(self, "Error", f"Invalid date format: {date_str}")
                 return
-            # ✅ conflict check
-            if check_time_conflict(data["Date (YYYY-MM-DD)"], data["Start Time"], data["End Time"]):
-                QMessageBox.warning(self, "Conflict", "Time conflict detected.")
+            match = {
+                "league": data["League"],
+                "role": data["Role"],
+                "match_name": data["Match Name"],
+                "date": date_str,
+                "start_time": data["Start Time"],
+                "end_time": data["End Time"],
+                "location": data["Location"],
+                "amount": float(data["Amount"] or 0),
+                "referee": data["Referee"],
+            }
+            # ✅ conflict / workload check: this referee's games and the unassigned ones
+            problem = match_problem(match)
+            if problem:
+                QMessageBox.warning(self, "Conflict", f"Can't add: {problem}.")
                 return
             # ✅ into database
-            conn = sqlite3.connect("matches.db")
-            cur = conn.cursor()
-            cur.execute('''INSERT INTO matches (league, role, subject, content, date, start_time, end_time, location, amount)
-                        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)''',
-                        (data["League"], data["Role"], data["Match Name"], data["Match Name"] + " details",
-                        data["Date (YYYY-MM-DD)"], data["Start Time"], data["End Time"], data["Location"],
-                        float(data["Amount"] or 0)))
-            conn.commit()
-            conn.close()
+            add_matches_to_db([match])
             QMessageBox.information(self, "Success", "Match added.")
             if hasattr(self, 'calendar_tab'):
                 self.calendar_tab.highlight_match_dates()
@@ -499,31 +262,58 @@ class AddMatchTab(QWidget):
             QMessageBox.critical(self, "Error", f"Failed to add match:\n{e}")
 
 class CustomCalendar(QCalendarWidget):
+    _tooltip_font = None
+
     def __init__(self):
         super().__init__()
         self._last_tooltip_text = ''
+        self._last_hover_cell = None
+        self._cell_dates = {}
+        self._tooltip_cache = {}
         self.marked_dates = {}
         self.setMouseTracking(True)
         self.view = self.findChild(QAbstractItemView, "qt_calendar_calendarview")
         if self.view:
-            print("✅ Calendar view found:", self.view)
-        else:
-            print("❌ Failed to find calendar view")
-        if self.view:
+            logger.debug("Calendar view found: %s", self.view)
             self.view.setMouseTracking(True)
-            print("Mouse tracking enabled on calendar view")
+        else:
+            logger.warning("Failed to find calendar view")
+        self.currentPageChanged.connect(self._rebuild_cell_map)
+        self._rebuild_cell_map(self.yearShown(), self.monthShown())
+
     def enterEvent(self, event):
-        print("Mouse entered calendar!")
+        logger.debug("Mouse entered calendar")
         super().enterEvent(event)
+
+    def _rebuild_cell_map(self, year, month):
+        # (row, col) -> QDate for the 6x7 grid of the shown page
+        first = QDate(year, month, 1)
+        first = first.addDays(-(first.dayOfWeek() % 7))  # Sun=7 → 0 offset, Mon=1 → 1 offset
+        self._cell_dates = {(row, col): first.addDays((row - 1) * 7 + col)
+                            for row in range(1, 7) for col in range(7)}
+        self._last_hover_cell = None
+
     def mark_dates(self, dates_dict):
+        # {julian day: [(role, league, division), ...]}
         self.marked_dates = dates_dict
+        self._tooltip_cache = {}
+        self._last_hover_cell = None
         self.updateCells()
 
+    def tooltip_for(self, jd):
+        tooltip = self._tooltip_cache.get(jd)
+        if tooltip is None:
+            lines = []
+            for role, league, division in self.marked_dates[jd]:
+                division_display = division if division and division.lower() != "none" else ""
+                lines.append(f"{role or '':<8} | {league or '':<12} | {division_display}")
+            tooltip = self._tooltip_cache[jd] = "\n".join(lines)
+        return tooltip
+
     def paintCell(self, painter, rect, date):
         super().paintCell(painter, rect, date)
 
-        date_str = date.toString("yyyy-MM-dd")
-        if date_str in self.marked_dates:
+        if date.toJulianDay() in self.marked_dates:
             painter.setBrush(QColor("#ff4444"))
             painter.setPen(Qt.NoPen)
             radius = 4
@@ -540,27 +330,28 @@ class CustomCalendar(QCalendarWidget):
         except AttributeError:
             pos_in_calendar = event.pos()
             global_pos = event.globalPos()
-        pos_in_view = self.view.viewport().mapFrom(self, pos_in_calendar)
-        index = self.view.indexAt(pos_in_view)
-        print("🧪 Hover index:", index.row(), index.column(), index.isValid())
-        if index.isValid():
-            date = self.dateForCell(index.row(), index.column())
-            if date:
-                date_str = date.toString("yyyy-MM-dd")
-                print("📅 Inferred date:", date_str)
-                if date_str in self.marked_dates:
-                    matches = self.marked_dates[date_str]
-                    tooltip = "\n".join(matches)
-                    if getattr(self, '_last_tooltip_text', '') != tooltip:
-                        font = QFont("Courier New") 
-                        QToolTip.setFont(font)
-                        QToolTip.showText(global_pos + QPoint(10, 20), tooltip, self.view)
-                        self._last_tooltip_text = tooltip
-                    return
-
-                QToolTip.hideText()
-                self._last_tooltip_text = ''
-                super().mouseMoveEvent(event)
+        index = self.view.indexAt(self.view.viewport().mapFrom(self, pos_in_calendar))
+        cell = (index.row(), index.column()) if index.isValid() else None
+        # only a change of cell can change the tooltip
+        if cell == self._last_hover_cell:
+            return super().mouseMoveEvent(event)
+        self._last_hover_cell = cell
+
+        date = self._cell_dates.get(cell)
+        if date is not None and date.toJulianDay() in self.marked_dates:
+            tooltip = self.tooltip_for(date.toJulianDay())
+            if self._last_tooltip_text != tooltip:
+                if CustomCalendar._tooltip_font is None:
+                    CustomCalendar._tooltip_font = QFont("Courier New")
+                    QToolTip.setFont(CustomCalendar._tooltip_font)
+                QToolTip.showText(global_pos + QPoint(10, 20), tooltip, self.view)
+                self._last_tooltip_text = tooltip
+            return
+
+        if self._last_tooltip_text:
+            QToolTip.hideText()
+            self._last_tooltip_text = ''
+        super().mouseMoveEvent(event)
 
     def dateAt(self, pos: QPoint):
         if not hasattr(self, 'view') or self.view is None:  
@@ -577,11 +368,7 @@ class CustomCalendar(QCalendarWidget):
         return None
 
     def dateForCell(self, row, col):
-        if row < 1:
-            return None 
-        first_date = self.monthShownFirstDate()
-        days_offset = (row - 1) * 7 + col
-        return first_date.addDays(days_offset)
+        return self._cell_dates.get((row, col))
 
     def monthShownFirstDate(self):
         year = self.yearShown()
@@ -597,18 +384,375 @@ class CustomCalendar(QCalendarWidget):
         return (self.height() - self.calendarHeaderHeight()) // 6
 
 
+REFEREE_NAME_SQL = "(SELECT name FROM referees WHERE referees.id=matches.referee_id)"
+
+class MatchTableModel(QAbstractTableModel):
+    """Matches in a date range, fetched a page at a time with keyset pagination."""
+
+    PAGE_SIZE = 200
+    # header, column, sort expressions (id is always the final tie-breaker); never NULL, or the keyset
+    # comparison in fetchMore is never true past a NULL and the rest of the rows go missing
+    COLUMNS = [
+        ("League", "league", ("COALESCE(league, '')",)),
+        ("Division", "division", ("COALESCE(division, '')",)),
+        ("Role", "role", ("COALESCE(role, '')",)),
+        ("Match", "subject", ("COALESCE(subject, '')",)),
+        ("Date", "date", ("COALESCE(date, '')", "COALESCE(start_time, '')")),
+        ("Start", "start_time", ("COALESCE(start_time, '')", "COALESCE(date, '')")),
+        ("End", "end_time", ("COALESCE(end_time, '')", "COALESCE(date, '')")),
+        ("Location", "location", ("COALESCE(location, '')",)),
+        ("Amount", "amount", ("COALESCE(amount, 0)",)),
+        ("Referee", REFEREE_NAME_SQL, (f"COALESCE({REFEREE_NAME_SQL}, '')",)),
+    ]
+    AMOUNT_COLUMN = 8
+    DATE_COLUMN = 4
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._rows = []
+        self._exhausted = True
+        self._filters = ("", "", None, None, None)
+        self._sort_column = self.DATE_COLUMN
+        self._sort_order = Qt.AscendingOrder
+
+    def set_filters(self, date_from, date_to, role=None, league=None, referee_id=None):
+        self._filters = (date_from, date_to, role, league, referee_id)
+        self.reload()
+
+    def reload(self):
+        self.beginResetModel()
+        self._rows = []
+        self._exhausted = False
+        self.endResetModel()
+        if self.canFetchMore(QModelIndex()):
+            self.fetchMore(QModelIndex())
+
+    def _where(self):
+        date_from, date_to, role, league, referee_id = self._filters
+        clauses = ["date BETWEEN ? AND ?"]
+        params = [date_from, date_to]
+        if referee_id is not None:
+            clauses.append("referee_id=?")
+            params.append(referee_id)
+        if role:
+            clauses.append("role=?")
+            params.append(role)
+        if league:
+            clauses.append("league=?")
+            params.append(league)
+        return " AND ".join(clauses), params
+
+    def total_count(self):
+        def count():
+            where, params = self._where()
+            conn = connect()
+            total = conn.execute(f"SELECT COUNT(*) FROM matches WHERE {where}", params).fetchone()[0]
+            conn.close()
+            return total
+        return QUERY_MEMO.get(("count",) + self._filters, count)
+
+    def canFetchMore(self, parent):
+        return not parent.isValid() and not self._exhausted
+
+    def fetchMore(self, parent):
+        if parent.isValid() or self._exhausted:
+            return
+        sort_exprs = list(self.COLUMNS[self._sort_column][2]) + ["id"]
+        direction = "ASC" if self._sort_order == Qt.AscendingOrder else "DESC"
+        columns = ", ".join(column for _, column, _ in self.COLUMNS)
+        where, params = self._where()
+        if self._rows:
+            # continue after the last row we already hold
+            op = ">" if direction == "ASC" else "<"
+            keys = self._rows[-1][1]
+            where += f" AND ({', '.join(sort_exprs)}) {op} ({', '.join('?' * len(keys))})"
+            params = params + list(keys)
+        query = (f"SELECT id, {columns}, {', '.join(sort_exprs)} FROM matches WHERE {where} "
+                 f"ORDER BY {', '.join(f'{expr} {direction}' for expr in sort_exprs)} LIMIT ?")
+
+        def fetch():
+            conn = connect()
+            result = conn.execute(query, params + [self.PAGE_SIZE]).fetchall()
+            conn.close()
+            return result
+        if self._rows:
+            fetched = fetch()
+        else:
+            # the first page is what every filter or date change shows, remember it
+            fetched = QUERY_MEMO.get(("page",) + self._filters + (self._sort_column, direction), fetch)
+
+        width = len(self.COLUMNS)
+        page = [(row[0], row[1 + width:], row[1:1 + width]) for row in fetched]
+        if len(page) < self.PAGE_SIZE:
+            self._exhausted = True
+        if page:
+            first = len(self._rows)
+            self.beginInsertRows(QModelIndex(), first, first + len(page) - 1)
+            self._rows.extend(page)
+            self.endInsertRows()
+
+    def sort(self, column, order=Qt.AscendingOrder):
+        self._sort_column = column
+        self._sort_order = order
+        self.reload()
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self._rows)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.COLUMNS)
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if orientation == Qt.Horizontal and role == Qt.DisplayRole:
+            return self.COLUMNS[section][0]
+        return None
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        match_id, _, values = self._rows[index.row()]
+        if role == Qt.UserRole:
+            return match_id
+        if role == Qt.DisplayRole:
+            value = values[index.column()]
+            if index.column() == self.AMOUNT_COLUMN:
+                return f"${value or 0:.2f}"
+            return "" if value is None else str(value)
+        return None
+
+    def match_id(self, row):
+        return self._rows[row][0]
+
+    def match_date(self, row):
+        return self._rows[row][2][self.DATE_COLUMN]
+
+def range_for_scope(date, scope):
+    # (first, last) QDates of the Day / Week / Month / Season containing date
+    if scope == "Week":
+        first = date.addDays(1 - date.dayOfWeek())
+        return first, first.addDays(6)
+    if scope == "Month":
+        first = QDate(date.year(), date.month(), 1)
+        return first, first.addMonths(1).addDays(-1)
+    if scope == "Season":
+        start_year = season_start_year(date.year(), date.month())
+        return QDate(start_year, 9, 1), QDate(start_year + 1, 6, 30)
+    return date, date
+
+class AgendaModel(QAbstractListModel):
+    """Day headers and matches in start order, paged on a (start_ts, id) keyset cursor.
+
+    Pages far from the last one touched drop their rows and are re-read from
+    their start key when scrolled back into view, so memory stays bounded.
+    """
+
+    PAGE_SIZE = 100
+    KEEP_PAGES = 3
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._filters = ("", "", None, None, None)
+        self._pages = []
+        self._offsets = []
+        self._exhausted = True
+
+    def set_filters(self, date_from, date_to, role=None, league=None, division=None):
+        self._filters = (date_from, date_to, role, league, division)
+        self.reload()
+
+    def reload(self):
+        self.beginResetModel()
+        self._pages = []
+        self._offsets = []
+        self._exhausted = False
+        self.endResetModel()
+        self.fetchMore(QModelIndex())
+
+    def _query_page(self, after_key):
+        date_from, date_to, role, league, division = self._filters
+        clauses = ["date BETWEEN ? AND ?"]
+        params = [date_from, date_to]
+        for column, value in (("role", role), ("league", league), ("division", division)):
+            if value:
+                clauses.append(f"{column}=?")
+                params.append(value)
+        if after_key:
+            clauses.append("(start_ts, id) > (?, ?)")
+            params.extend(after_key)
+        conn = connect()
+        rows = conn.execute(
+            f"""SELECT start_ts, id, date, start_time, end_time, role, league, division, subject, location, amount
+                FROM matches WHERE {' AND '.join(clauses)} ORDER BY start_ts, id LIMIT ?""",
+            params + [self.PAGE_SIZE]).fetchall()
+        conn.close()
+        return rows
+
+    def _build_items(self, rows, prev_date):
+        items = []
+        for row in rows:
+            if row[2] != prev_date:
+                items.append(("day", row[2]))
+                prev_date = row[2]
+            items.append(("match", row))
+        return items
+
+    def canFetchMore(self, parent):
+        return not parent.isValid() and not self._exhausted
+
+    def fetchMore(self, parent):
+        if parent.isValid() or self._exhausted:
+            return
+        last = self._pages[-1] if self._pages else None
+        start_key = last["last_key"] if last else None
+        prev_date = last["last_date"] if last else None
+        rows = self._query_page(start_key)
+        if len(rows) < self.PAGE_SIZE:
+            self._exhausted = True
+        if not rows:
+            return
+        items = self._build_items(rows, prev_date)
+        page = {
+            "start_key": start_key, "prev_date": prev_date,
+            "last_key": (rows[-1][0], rows[-1][1]), "last_date": rows[-1][2],
+            "count": len(items), "items": items,
+        }
+        first = self._offsets[-1] + self._pages[-1]["count"] if self._pages else 0
+        self.beginInsertRows(QModelIndex(), first, first + len(items) - 1)
+        self._pages.append(page)
+        self._offsets.append(first)
+        self.endInsertRows()
+        self._evict_far_from(len(self._pages) - 1)
+
+    def _evict_far_from(self, page_index):
+        for i, page in enumerate(self._pages):
+            if abs(i - page_index) > self.KEEP_PAGES:
+                page["items"] = None
+
+    def _item(self, row):
+        page_index = bisect.bisect_right(self._offsets, row) - 1
+        page = self._pages[page_index]
+        if page["items"] is None:
+            page["items"] = self._build_items(self._query_page(page["start_key"]), page["prev_date"])
+            self._evict_far_from(page_index)
+        items = page["items"]
+        offset = row - self._offsets[page_index]
+        # the page can come back shorter if rows were deleted behind our back
+        return items[offset] if offset < len(items) else ("day", "")
+
+    def rowCount(self, parent=QModelIndex()):
+        if parent.isValid() or not self._pages:
+            return 0
+        return self._offsets[-1] + self._pages[-1]["count"]
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        kind, value = self._item(index.row())
+        if kind == "day":
+            if role == Qt.DisplayRole:
+                day = QDate.fromString(value, "yyyy-MM-dd")
+                return day.toString("dddd, MMMM d, yyyy") if day.isValid() else value
+            if role == Qt.FontRole:
+                font = QFont()
+                font.setBold(True)
+                return font
+            if role == Qt.BackgroundRole:
+                return QColor("#e0e0e0")
+            return None
+        _, match_id, _, start, end, match_role, league, division, subject, location, amount = value
+        if role == Qt.DisplayRole:
+            division_display = division if division and division.lower() != "none" else ""
+            return (f"   {start or ''}–{end or ''}   {match_role or '':<8} {league or ''} {division_display}"
+                    f"   {subject or ''} @ {location or ''}   ${amount or 0:.2f}")
+        if role == Qt.UserRole:
+            return match_id
+        return None
+
+class AgendaTab(QWidget):
+    def __init__(self):
+        super().__init__()
+        layout = QVBoxLayout(self)
+        filter_layout = QHBoxLayout()
+        today = QDate.currentDate()
+        self.date_from = QDateEdit(today.addDays(1 - today.dayOfWeek()))
+        self.date_to = QDateEdit(today.addMonths(3))
+        for edit in (self.date_from, self.date_to):
+            edit.setCalendarPopup(True)
+            edit.setDisplayFormat("yyyy-MM-dd")
+            edit.dateChanged.connect(self.refresh)
+        self.role_filter = QComboBox()
+        self.role_filter.addItems(["All Roles", "Referee", "AR"])
+        self.league_filter = QComboBox()
+        self.league_filter.addItem("All Leagues")
+        self.division_filter = QComboBox()
+        self.division_filter.addItem("All Divisions")
+        for combo in (self.role_filter, self.league_filter, self.division_filter):
+            combo.currentTextChanged.connect(self.refresh)
+        filter_layout.addWidget(QLabel("From:"))
+        filter_layout.addWidget(self.date_from)
+        filter_layout.addWidget(QLabel("To:"))
+        filter_layout.addWidget(self.date_to)
+        filter_layout.addWidget(self.role_filter)
+        filter_layout.addWidget(self.league_filter)
+        filter_layout.addWidget(self.division_filter)
+        layout.addLayout(filter_layout)
+
+        self.model = AgendaModel(self)
+        self.list = QListView()
+        self.list.setUniformItemSizes(True)
+        self.list.setModel(self.model)
+        layout.addWidget(self.list)
+
+    def showEvent(self, event):
+        self.update_filter_choices()
+        self.refresh()
+        super().showEvent(event)
+
+    def update_filter_choices(self):
+        conn = connect()
+        leagues = [row[0] for row in conn.execute(
+            "SELECT DISTINCT league FROM matches WHERE league IS NOT NULL AND league != '' ORDER BY league")]
+        divisions = [row[0] for row in conn.execute(
+            "SELECT DISTINCT division FROM matches WHERE division IS NOT NULL AND division != '' ORDER BY division")]
+        conn.close()
+        for combo, label, values in ((self.league_filter, "All Leagues", leagues),
+                                     (self.division_filter, "All Divisions", divisions)):
+            current = combo.currentText()
+            combo.blockSignals(True)
+            combo.clear()
+            combo.addItem(label)
+            combo.addItems(values)
+            combo.setCurrentText(current)
+            combo.blockSignals(False)
+
+    def refresh(self):
+        role = self.role_filter.currentText()
+        league = self.league_filter.currentText()
+        division = self.division_filter.currentText()
+        self.model.set_filters(
+            self.date_from.date().toString("yyyy-MM-dd"),
+            self.date_to.date().toString("yyyy-MM-dd"),
+            role if role != "All Roles" else None,
+            league if league != "All Leagues" else None,
+            division if division != "All Divisions" else None)
+
 class CalendarTab(QWidget):
     def __init__(self):
         super().__init__()
         layout = QVBoxLayout(self)
         self.calendar = CustomCalendar()
         self.calendar.setVerticalHeaderFormat(QCalendarWidget.NoVerticalHeader)
-        self.table = QTableWidget(0, 8)  
-        self.table.setHorizontalHeaderLabels(["League", "Division", "Role", "Match", "Start", "End", "Location", "Amount"])
+        self.model = MatchTableModel(self)
+        self.table = QTableView()
+        self.table.setModel(self.model)
+        self.table.setSelectionBehavior(QAbstractItemView.SelectRows)
+        self.table.setSelectionMode(QAbstractItemView.SingleSelection)
+        self.table.setSortingEnabled(True)
+        self.table.horizontalHeader().setSortIndicator(MatchTableModel.DATE_COLUMN, Qt.AscendingOrder)
         header = self.table.horizontalHeader()
         header.setSectionResizeMode(QHeaderView.Interactive) 
         header.setStretchLastSection(True)
-        self.table.cellDoubleClicked.connect(self.edit_match_dialog)
+        self.table.doubleClicked.connect(self.edit_match_dialog)
         layout.addWidget(self.calendar)
         layout.addWidget(self.table)
         self.calendar.setLocale(QLocale(QLocale.English))
@@ -619,60 +763,109 @@ class CalendarTab(QWidget):
         self.status_label.setStyleSheet("font-weight: bold; padding: 4px;")
         layout.addWidget(self.status_label)
         filter_layout = QHBoxLayout()
+        self.scope_filter = QComboBox()
+        self.scope_filter.addItems(["Day", "Week", "Month", "Season"])
+        self.scope_filter.currentTextChanged.connect(self.schedule_refresh)
         self.role_filter = QComboBox()
         self.role_filter.addItem("All Roles")
         self.role_filter.addItem("Referee")
         self.role_filter.addItem("AR")
-        self.role_filter.currentTextChanged.connect(self.refresh_table)
+        self.role_filter.currentTextChanged.connect(self.schedule_refresh)
         self.league_filter = QComboBox()
         self.league_filter.addItem("All Leagues")
-        self.league_filter.currentTextChanged.connect(self.refresh_table)
+        self.league_filter.currentTextChanged.connect(self.schedule_refresh)
+        self.referee_filter = QComboBox()
+        self.referee_filter.addItem("All Referees", None)
+        self.referee_filter.currentIndexChanged.connect(self.on_referee_changed)
+        filter_layout.addWidget(QLabel("Show:"))
+        filter_layout.addWidget(self.scope_filter)
         filter_layout.addWidget(QLabel("Filter by Role:"))
         filter_layout.addWidget(self.role_filter)
         filter_layout.addWidget(QLabel("Filter by League:"))
         filter_layout.addWidget(self.league_filter)
+        filter_layout.addWidget(QLabel("Referee:"))
+        filter_layout.addWidget(self.referee_filter)
         layout.addLayout(filter_layout)
         self.setLayout(layout)
-        self.calendar.selectionChanged.connect(self.refresh_table)
+        self.calendar.selectionChanged.connect(self.schedule_refresh)
+        self.calendar.currentPageChanged.connect(self.highlight_match_dates)
+        self._refresh_pending = False
+        self._league_choices = ()
+        self._referee_choices = ()
+        self._shown_page = (self.calendar.yearShown(), self.calendar.monthShown())
+        self._pending_months = set()
+        self._prefetch_signals = MonthPrefetchSignals()
+        self._prefetch_signals.loaded.connect(self.on_month_prefetched)
+
+    def selected_range(self):
+        first, last = range_for_scope(self.calendar.selectedDate(), self.scope_filter.currentText())
+        return first.toString("yyyy-MM-dd"), last.toString("yyyy-MM-dd")
+
+    def schedule_refresh(self):
+        # a date click plus filter changes in the same event-loop turn refresh once
+        if not self._refresh_pending:
+            self._refresh_pending = True
+            QTimer.singleShot(0, self.refresh_table)
 
     def refresh_table(self):
-        date = self.calendar.selectedDate().toString("yyyy-MM-dd")
+        self._refresh_pending = False
+        date_from, date_to = self.selected_range()
         role_filter = self.role_filter.currentText()
         league_filter = self.league_filter.currentText()
-        conn = sqlite3.connect("matches.db")
-        cur = conn.cursor()
-        query = "SELECT league, division, role, subject, start_time, end_time, location, amount FROM matches WHERE date=?"
-        params = [date]
+        self.model.set_filters(
+            date_from, date_to,
+            role_filter if role_filter != "All Roles" else None,
+            league_filter if league_filter != "All Leagues" else None,
+            self.referee_id())
+        self.table.resizeColumnsToContents()
+        count = self.model.total_count()
+        if date_from == date_to:
+            self.status_label.setText(f"{count} match(es) on {date_from}")
+        else:
+            self.status_label.setText(f"{count} match(es) from {date_from} to {date_to}")
+        self.update_league_filter(date_from, date_to)
+        self.update_referee_filter()
 
-        if role_filter != "All Roles":
-            query += " AND role=?"
-            params.append(role_filter)
+    def referee_id(self):
+        return self.referee_filter.currentData()
 
-        if league_filter != "All Leagues":
-            query += " AND league=?"
-            params.append(league_filter)
+    def on_referee_changed(self):
+        self.highlight_match_dates()
+        self.schedule_refresh()
 
-        cur.execute(query, params)
-        rows = cur.fetchall()
-        conn.close()
-        self.table.setRowCount(0)
-        for row in rows:
-            row_pos = self.table.rowCount()
-            self.table.insertRow(row_pos)
-            for i, val in enumerate(row):
-                if i == 7:
-                    val = f"${val:.2f}"
-                self.table.setItem(row_pos, i, QTableWidgetItem(str(val)))
-        self.table.resizeColumnsToContents()
-        self.status_label.setText(f"{len(rows)} match(es) on {date}")
-        self.update_league_filter(date)
+    def update_referee_filter(self):
+        def load_referees():
+            conn = connect()
+            referees = tuple(list_referees(conn))
+            conn.close()
+            return referees
+        referees = QUERY_MEMO.get(("referees",), load_referees)
+        if referees == self._referee_choices:
+            return
+        self._referee_choices = referees
+
+        current = self.referee_id()
+        self.referee_filter.blockSignals(True)
+        self.referee_filter.clear()
+        self.referee_filter.addItem("All Referees", None)
+        for referee_id, name in referees:
+            self.referee_filter.addItem(name, referee_id)
+        index = self.referee_filter.findData(current)
+        self.referee_filter.setCurrentIndex(max(index, 0))
+        self.referee_filter.blockSignals(False)
     
-    def update_league_filter(self, date):
-        conn = sqlite3.connect("matches.db")
-        cur = conn.cursor()
-        cur.execute("SELECT DISTINCT league FROM matches WHERE date=?", (date,))
-        leagues = sorted(set(row[0] for row in cur.fetchall()))
-        conn.close()
+    def update_league_filter(self, date_from, date_to):
+        def load_leagues():
+            conn = connect()
+            cur = conn.cursor()
+            cur.execute("SELECT DISTINCT league FROM matches WHERE date BETWEEN ? AND ?", (date_from, date_to))
+            leagues = tuple(sorted(set(row[0] for row in cur.fetchall() if row[0])))
+            conn.close()
+            return leagues
+        leagues = QUERY_MEMO.get(("leagues", date_from, date_to), load_leagues)
+        if leagues == self._league_choices:
+            return
+        self._league_choices = leagues
 
         current = self.league_filter.currentText()
         self.league_filter.blockSignals(True)
@@ -683,42 +876,68 @@ class CalendarTab(QWidget):
         self.league_filter.setCurrentText(current)
         self.league_filter.blockSignals(False)
 
-    def highlight_match_dates(self):
-        conn = sqlite3.connect("matches.db")
-        cur = conn.cursor()
-        cur.execute("SELECT date, league, role, division FROM matches")
-        rows = cur.fetchall()
-        conn.close()
+    def highlight_match_dates(self, year=None, month=None):
+        # the shown month plus one either side, served from MONTH_CACHE
+        if year is None:
+            year, month = self.calendar.yearShown(), self.calendar.monthShown()
+        self._shown_page = (year, month)
+        shown = QDate(year, month, 1)
+        referee_id = self.referee_id()
 
         match_dict = {}
-        for date_str, league, role, division in rows:
-            division_display = division if division and division.lower() != "none" else ""
-            line = f"{role:<8} | {league:<12} | {division_display}"
-            match_dict.setdefault(date_str, []).append(line)
+        for offset in (-1, 0, 1):
+            page = shown.addMonths(offset)
+            key = (page.year(), page.month(), referee_id)
+            summary = MONTH_CACHE.get(key)
+            if summary is None and offset == 0:
+                summary = load_month_summary(*key)
+                MONTH_CACHE.put(key, summary)
+            if summary is None:
+                self.prefetch_month(*key[:2])
+                continue
+            match_dict.update(summary)
         self.calendar.mark_dates(match_dict)
 
+        # warm the months the next flip will need
+        for offset in (-2, 2):
+            page = shown.addMonths(offset)
+            self.prefetch_month(page.year(), page.month())
+
+    def prefetch_month(self, year, month):
+        key = (year, month, self.referee_id())
+        if key in self._pending_months or MONTH_CACHE.get(key) is not None:
+            return
+        self._pending_months.add(key)
+        QThreadPool.globalInstance().start(MonthPrefetchTask(*key, self._prefetch_signals))
+
+    def on_month_prefetched(self, year, month):
+        self._pending_months = {key for key in self._pending_months if key[:2] != (year, month)}
+        shown_year, shown_month = self._shown_page
+        distance = (year - shown_year) * 12 + (month - shown_month)
+        if abs(distance) <= 1:
+            self.highlight_match_dates(shown_year, shown_month)
+
     def delete_selected(self):
-        selected = self.table.currentRow()
-        if selected == -1:
+        selected = self.table.currentIndex()
+        if not selected.isValid():
             QMessageBox.warning(self, "No selection", "Select a match to delete.")
             return
-        match = self.table.item(selected, 3).text()  # ✅ Match now at column 3
-        date = self.calendar.selectedDate().toString("yyyy-MM-dd")
-        conn = sqlite3.connect("matches.db")
-        cur = conn.cursor()
-        cur.execute("DELETE FROM matches WHERE subject=? AND date=?", (match, date))
-        conn.commit()
-        conn.close()
+        match_id = self.model.match_id(selected.row())
+        date = self.model.match_date(selected.row())
+        write_transaction(lambda conn: conn.execute("DELETE FROM matches WHERE id=?", (match_id,)))
+        notify_matches_changed(date)
         self.refresh_table()
         self.highlight_match_dates()
     
-    def edit_match_dialog(self, row, column):
-        match_name = self.table.item(row, 3).text()
-        date = self.calendar.selectedDate().toString("yyyy-MM-dd")
-        conn = sqlite3.connect("matches.db")
+    def edit_match_dialog(self, index):
+        match_id = self.model.match_id(index.row())
+        conn = connect()
         cur = conn.cursor()
-        cur.execute("SELECT * FROM matches WHERE subject=? AND date=?", (match_name, date))
+        cur.execute("SELECT * FROM matches WHERE id=?", (match_id,))
         match = cur.fetchone()
+        # saving only goes ahead if nobody else changed the match in the meantime
+        cur.execute("SELECT row_version FROM matches WHERE id=?", (match_id,))
+        row_version = (cur.fetchone() or (None,))[0]
         conn.close()
         if not match:
             QMessageBox.warning(self, "Error", "Match not found.")
@@ -764,14 +983,19 @@ class CalendarTab(QWidget):
             except ValueError:
                 QMessageBox.warning(dialog, "Error", "Amount must be a number.")
                 return
-            conn = sqlite3.connect("matches.db")
-            cur = conn.cursor()
-            cur.execute('''UPDATE matches SET league=?, role=?, subject=?, date=?, start_time=?,
-                        end_time=?, location=?, amount=? WHERE id=?''',
-                        (data["League"], data["Role"], data["Subject"], data["Date"],
-                        data["Start Time"], data["End Time"], data["Location"], data["Amount"], match[0]))
-            conn.commit()
-            conn.close()
+            saved = write_transaction(lambda conn: conn.execute(
+                '''UPDATE matches SET league=?, role=?, subject=?, date=?, start_time=?,
+                   end_time=?, location=?, amount=? WHERE id=? AND row_version IS ?''',
+                (data["League"], data["Role"], data["Subject"], data["Date"],
+                 data["Start Time"], data["End Time"], data["Location"], data["Amount"], match[0],
+                 row_version)).rowcount)
+            if not saved:
+                QMessageBox.warning(dialog, "Changed elsewhere",
+                                    "This match was changed or deleted in another window. Open it again to edit.")
+                dialog.close()
+                self.refresh_table()
+                return
+            notify_matches_changed(match[5], data["Date"])
             self.refresh_table()
             self.highlight_match_dates()
             if hasattr(self, 'stats_tab'):
@@ -787,6 +1011,361 @@ class CalendarTab(QWidget):
         dialog.show()
     
     
+class ChartComponent:
+    """A figure rendered with plain Agg; only ever touched from the chart worker thread."""
+
+    def __init__(self, name, dpi=100, adjust=None):
+        # matplotlib is only imported once the statistics tab is first opened
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+        from matplotlib.figure import Figure
+        self.name = name
+        self.figure = Figure(dpi=dpi)
+        self.canvas = FigureCanvasAgg(self.figure)
+        if adjust:
+            self.figure.subplots_adjust(**adjust)
+        self.ax = self.figure.add_subplot(111)
+        self._data_key = None
+
+    def update(self, labels, values):
+        raise NotImplementedError
+
+    def render(self, labels, values, width, height, ratio=1.0):
+        self.update(labels, values)
+        dpi = self.figure.get_dpi()
+        self.figure.set_size_inches(width * ratio / dpi, height * ratio / dpi)
+        self.canvas.draw()
+        w, h = self.canvas.get_width_height()
+        image = QImage(bytes(self.canvas.buffer_rgba()), w, h, QImage.Format_RGBA8888).copy()
+        image.setDevicePixelRatio(ratio)
+        return image
+
+class BarChart(ChartComponent):
+    """Bar chart whose artists survive refreshes; same categories only move bar heights."""
+
+    def __init__(self, name, title, xlabel, ylabel, color, horizontal=False, adjust=None):
+        super().__init__(name, adjust=adjust)
+        self.title = title
+        self.xlabel = xlabel
+        self.ylabel = ylabel
+        self.color = color
+        self.horizontal = horizontal
+        self._labels = None
+        self._bars = None
+
+    def update(self, labels, values):
+        labels = tuple(labels)
+        values = [float(v) for v in values]
+        data_key = (labels, tuple(round(v, 2) for v in values))
+        if data_key == self._data_key:
+            return
+        self._data_key = data_key
+
+        if self._bars is not None and labels == self._labels:
+            for bar, value in zip(self._bars, values):
+                if self.horizontal:
+                    bar.set_width(value)
+                else:
+                    bar.set_height(value)
+            self.ax.relim()
+            self.ax.autoscale_view()
+        else:
+            self._build(labels, values)
+
+    def _build(self, labels, values):
+        ax = self.ax
+        ax.cla()
+        if self.horizontal:
+            self._bars = ax.barh(labels, values, color=self.color)
+            ax.invert_yaxis()  # 从高到低显示
+        else:
+            self._bars = ax.bar(labels, values, color=self.color, width=0.6)
+            ax.tick_params(axis='x', rotation=45)
+            ax.margins(x=0.1)
+        self._labels = labels
+        ax.set_title(self.title, fontsize=10)
+        ax.set_xlabel(self.xlabel, fontsize=9)
+        ax.set_ylabel(self.ylabel, fontsize=9)
+        ax.tick_params(axis='x', labelsize=8)
+        ax.tick_params(axis='y', labelsize=8)
+
+class PieChart(ChartComponent):
+    """Pie chart that re-angles its existing wedges when only the values change."""
+
+    START_ANGLE = 90
+    PCT_DISTANCE = 0.6
+
+    def __init__(self, name, title, legend_title):
+        super().__init__(name)
+        self.title = title
+        self.legend_title = legend_title
+        self._labels = None
+        self._wedges = None
+        self._autotexts = None
+
+    def update(self, labels, values):
+        data = [(label, float(value)) for label, value in zip(labels, values) if label and value]
+        labels = tuple(label for label, _ in data)
+        values = [value for _, value in data]
+        data_key = (labels, tuple(round(v, 2) for v in values))
+        if data_key == self._data_key:
+            return
+        self._data_key = data_key
+
+        if self._wedges is not None and labels and labels == self._labels:
+            total = sum(values)
+            theta = self.START_ANGLE
+            for wedge, autotext, value in zip(self._wedges, self._autotexts, values):
+                sweep = 360.0 * value / total
+                wedge.set_theta1(theta)
+                wedge.set_theta2(theta + sweep)
+                middle = np.deg2rad(theta + sweep / 2)
+                autotext.set_position((self.PCT_DISTANCE * np.cos(middle), self.PCT_DISTANCE * np.sin(middle)))
+                autotext.set_text(f"{100.0 * value / total:.1f}%")
+                theta += sweep
+        else:
+            self._build(labels, values)
+
+    def _build(self, labels, values):
+        ax = self.ax
+        ax.cla()
+        self._labels = labels
+        if not labels:
+            self._wedges = self._autotexts = None
+            ax.set_axis_off()
+            return
+        self._wedges, _, self._autotexts = ax.pie(
+            values,
+            labels=None,  # 不直接在图上画 label，避免重叠
+            autopct='%1.1f%%',
+            pctdistance=self.PCT_DISTANCE,
+            startangle=self.START_ANGLE,
+            textprops={'fontsize': 8}
+        )
+        ax.set_title(self.title, pad=10, fontsize=10)
+        # ✅ 设置图例在右侧、字体小、水平分布
+        ax.legend(
+            self._wedges,
+            [r if len(r) < 10 else r[:8] + "…" for r in labels],
+            loc="lower center",
+            bbox_to_anchor=(0.5, -0.15),  # 适当微调
+            ncol=len(labels),
+            fontsize=9,
+            title=self.legend_title
+        )
+
+class TrendChart(ChartComponent):
+    """Weekly bars with rolling-average lines; values are [bars, line, line, ...]."""
+
+    def __init__(self, name, title, ylabel, color, lines):
+        super().__init__(name, adjust=dict(bottom=0.25))
+        self.title = title
+        self.ylabel = ylabel
+        self.color = color
+        self.lines = lines  # ((label, color), ...) for values[1:]
+        self._labels = None
+        self._bars = None
+        self._artists = None
+
+    def update(self, labels, values):
+        labels = tuple(labels)
+        series = [[float(v) for v in s] for s in values]
+        data_key = (labels, tuple(tuple(round(v, 2) for v in s) for s in series))
+        if data_key == self._data_key:
+            return
+        self._data_key = data_key
+
+        if self._bars is not None and labels == self._labels:
+            for bar, value in zip(self._bars, series[0]):
+                bar.set_height(value)
+            for line, ys in zip(self._artists, series[1:]):
+                line.set_ydata(ys)
+            self.ax.relim()
+            self.ax.autoscale_view()
+        else:
+            self._build(labels, series)
+
+    def _build(self, labels, series):
+        ax = self.ax
+        ax.cla()
+        x = list(range(len(labels)))
+        self._bars = ax.bar(x, series[0], color=self.color, width=0.8, label="Weekly")
+        self._artists = [ax.plot(x, ys, color=color, linewidth=1.5, label=label)[0]
+                         for (label, color), ys in zip(self.lines, series[1:])]
+        step = max(1, len(labels) // 12)
+        ax.set_xticks(x[::step])
+        ax.set_xticklabels(labels[::step], rotation=45, fontsize=8)
+        self._labels = labels
+        ax.set_title(self.title, fontsize=10)
+        ax.set_ylabel(self.ylabel, fontsize=9)
+        ax.tick_params(axis='y', labelsize=8)
+        if x:
+            ax.legend(fontsize=7, loc="upper left")
+
+class ChartCache:
+    """Rendered pixmaps keyed by (chart, filter, data version, size)."""
+
+    def __init__(self, capacity=24):
+        self.capacity = capacity
+        self._pixmaps = OrderedDict()
+
+    def get(self, key):
+        pixmap = self._pixmaps.get(key)
+        if pixmap is not None:
+            self._pixmaps.move_to_end(key)
+        return pixmap
+
+    def put(self, key, pixmap):
+        self._pixmaps[key] = pixmap
+        self._pixmaps.move_to_end(key)
+        while len(self._pixmaps) > self.capacity:
+            self._pixmaps.popitem(last=False)
+
+CHART_CACHE = ChartCache()
+_chart_pool = None
+
+def chart_pool():
+    # a single worker so each Figure is only ever used from one thread
+    global _chart_pool
+    if _chart_pool is None:
+        _chart_pool = QThreadPool()
+        _chart_pool.setMaxThreadCount(1)
+    return _chart_pool
+
+class ChartRenderSignals(QObject):
+    rendered = Signal(object, QImage)
+
+class ChartRenderTask(QRunnable):
+    def __init__(self, chart, labels, values, size, key, signals):
+        super().__init__()
+        self.chart = chart
+        self.labels = labels
+        self.values = values
+        self.size = size
+        self.key = key
+        self.signals = signals
+
+    def run(self):
+        try:
+            image = self.chart.render(self.labels, self.values, *self.size)
+        except Exception:
+            logger.exception("Rendering %s failed", self.chart.name)
+            return
+        self.signals.rendered.emit(self.key, image)
+
+class ChartView(QLabel):
+    """Shows a ChartComponent rasterized off the GUI thread; re-renders only on resize or new data."""
+
+    def __init__(self, chart, min_width=0, min_height=0):
+        super().__init__()
+        self.chart = chart
+        self.setAlignment(Qt.AlignCenter)
+        self.setSizePolicy(QSizePolicy.Ignored, QSizePolicy.Ignored)
+        self.setMinimumSize(min_width, min_height)
+        self._data = None
+        self._pending = None
+        self._signals = ChartRenderSignals()
+        self._signals.rendered.connect(self.on_rendered)
+        self._resize_timer = QTimer(self)
+        self._resize_timer.setSingleShot(True)
+        self._resize_timer.setInterval(120)
+        self._resize_timer.timeout.connect(self.request_render)
+
+    def set_data(self, labels, values, data_key):
+        # values are a flat list, or one list per series for multi-series charts
+        self._data = (list(labels), np.asarray(values, dtype=float).tolist(), data_key)
+        self.request_render()
+
+    def resizeEvent(self, event):
+        super().resizeEvent(event)
+        self._resize_timer.start()
+
+    def request_render(self):
+        if self._data is None or self.width() <= 1 or self.height() <= 1:
+            return
+        labels, values, data_key = self._data
+        ratio = self.devicePixelRatioF()
+        size = (self.width(), self.height(), ratio)
+        key = (self.chart.name, data_key, size)
+        pixmap = CHART_CACHE.get(key)
+        if pixmap is not None:
+            self._pending = None
+            self.setPixmap(pixmap)
+            return
+        if key == self._pending:
+            return
+        self._pending = key
+        chart_pool().start(ChartRenderTask(self.chart, labels, values, size, key, self._signals))
+
+    def on_rendered(self, key, image):
+        pixmap = QPixmap.fromImage(image)
+        CHART_CACHE.put(key, pixmap)
+        if key == self._pending:
+            self._pending = None
+            self.setPixmap(pixmap)
+
+class PivotWidget(QWidget):
+    def __init__(self):
+        super().__init__()
+        layout = QVBoxLayout(self)
+        layout.setContentsMargins(0, 0, 0, 0)
+        controls = QHBoxLayout()
+        self.row_dim = QComboBox()
+        self.row_dim.addItems(CUBE_DIMENSIONS)
+        self.row_dim.setCurrentText("month")
+        self.col_dim = QComboBox()
+        self.col_dim.addItem("(none)")
+        self.col_dim.addItems(CUBE_DIMENSIONS)
+        self.col_dim.setCurrentText("role")
+        self.measure = QComboBox()
+        self.measure.addItems(["Total", "Count"])
+        self.filter_edit = QLineEdit()
+        self.filter_edit.setPlaceholderText("role=AR; division=U16; league=BCSPL; weekday=Sun; year=2024; referee=Jane Doe")
+        for combo in (self.row_dim, self.col_dim, self.measure):
+            combo.currentTextChanged.connect(self.refresh)
+        self.filter_edit.editingFinished.connect(self.refresh)
+        controls.addWidget(QLabel("Rows:"))
+        controls.addWidget(self.row_dim)
+        controls.addWidget(QLabel("Columns:"))
+        controls.addWidget(self.col_dim)
+        controls.addWidget(self.measure)
+        controls.addWidget(self.filter_edit)
+        layout.addLayout(controls)
+        self.table = QTableWidget()
+        self.table.setMinimumHeight(200)
+        layout.addWidget(self.table)
+
+    def parse_filters(self):
+        filters = {}
+        for part in self.filter_edit.text().split(";"):
+            if "=" not in part:
+                continue
+            dim, value = (x.strip() for x in part.split("=", 1))
+            if dim in CUBE_DIMENSIONS:
+                filters.setdefault(dim, []).append(value)
+        return filters
+
+    def refresh(self):
+        row_dim = self.row_dim.currentText()
+        col_dim = self.col_dim.currentText()
+        group_by = (row_dim,) if col_dim in ("(none)", row_dim) else (row_dim, col_dim)
+        cells = EARNINGS_CUBE.query(group_by, self.parse_filters())
+        use_total = self.measure.currentText() == "Total"
+
+        rows = sorted({key[0] for key in cells})
+        cols = sorted({key[1] for key in cells}) if len(group_by) == 2 else ["Total" if use_total else "Count"]
+        self.table.clear()
+        self.table.setRowCount(len(rows))
+        self.table.setColumnCount(len(cols))
+        self.table.setHorizontalHeaderLabels([c or "—" for c in cols])
+        self.table.setVerticalHeaderLabels([r or "—" for r in rows])
+        row_pos = {r: i for i, r in enumerate(rows)}
+        col_pos = {c: i for i, c in enumerate(cols)}
+        for key, (count, total) in cells.items():
+            col = col_pos[key[1]] if len(group_by) == 2 else 0
+            text = f"${total:.2f}" if use_total else str(count)
+            self.table.setItem(row_pos[key[0]], col, QTableWidgetItem(text))
+        self.table.resizeColumnsToContents()
+
 class StatisticsTab(QWidget):
     def __init__(self):
         super().__init__()
@@ -797,7 +1376,8 @@ class StatisticsTab(QWidget):
         self.monthly = QTableWidget()
         self.monthly.setFixedHeight(200)
         self.monthly.setMaximumWidth(350)
-        self.monthly_chart = FigureCanvas(Figure(figsize=(5.5, 3.2)))
+        self.monthly_chart = ChartView(BarChart("monthly", "Monthly Income", "Month", "Total ($)", 'cornflowerblue'),
+                                       550, 320)
         monthly_layout = QHBoxLayout()
         monthly_layout.setSpacing(20)
         monthly_layout.setAlignment(Qt.AlignLeft)
@@ -809,16 +1389,24 @@ class StatisticsTab(QWidget):
         # 📌 年份选择 + 摘要
         self.year_selector = QComboBox()
         self.year_selector.currentTextChanged.connect(self.refresh)
+        self.referee_selector = QComboBox()
+        self.referee_selector.addItem("All Referees", None)
+        self.referee_selector.currentIndexChanged.connect(self.refresh)
         self.summary_label = QLabel()
         layout.addWidget(QLabel("📌 Select Year:"))
         layout.addWidget(self.year_selector)
+        layout.addWidget(QLabel("🧑‍⚖️ Referee:"))
+        layout.addWidget(self.referee_selector)
         layout.addWidget(self.summary_label)
 
         # 💰 League 表格 + 图表（缩窄表格、左对齐）
         self.league_table = QTableWidget()
         self.league_table.setMinimumHeight(120)
         self.league_table.setMaximumWidth(350)
-        self.league_chart = FigureCanvas(Figure(figsize=(5.5, 3.2)))
+        self.league_chart = ChartView(BarChart("league", "Top Leagues by Income", "Total ($)", "League",
+                                               'lightskyblue', horizontal=True,
+                                               adjust=dict(left=0.2, right=0.95, top=0.85, bottom=0.2)),
+                                      550, 320)
         league_layout = QHBoxLayout()
         league_layout.setSpacing(20)
         league_layout.setAlignment(Qt.AlignLeft)
@@ -835,9 +1423,7 @@ class StatisticsTab(QWidget):
         self.role_table.setSizePolicy(QSizePolicy.Expanding, QSizePolicy.Expanding)  # ✅ 添加
         self.role_table.setMaximumHeight(1000)  # ✅ 添加
 
-        self.role_chart = FigureCanvas(Figure(figsize=(5, 5)))
-        self.role_chart.setMinimumHeight(400)
-        self.role_chart.setSizePolicy(QSizePolicy.Expanding, QSizePolicy.Expanding)
+        self.role_chart = ChartView(PieChart("role", "Income by Role", "Role"), 400, 300)
 
         role_container = QWidget()
         role_layout = QHBoxLayout(role_container)
@@ -851,6 +1437,42 @@ class StatisticsTab(QWidget):
         layout.addWidget(self.bold_label("🎭 By Role"))
         layout.addWidget(role_container)
 
+        # 📈 Weekly income with rolling 4 / 12 week averages
+        self.weekly_table = QTableWidget()
+        self.weekly_table.setMaximumWidth(520)
+        self.weekly_table.setFixedHeight(260)
+        self.weekly_chart = ChartView(TrendChart("weekly", "Weekly Income", "Total ($)", 'cornflowerblue',
+                                                 (("4-week avg", 'darkorange'), ("12-week avg", 'seagreen'))),
+                                      550, 320)
+        weekly_layout = QHBoxLayout()
+        weekly_layout.setSpacing(20)
+        weekly_layout.setAlignment(Qt.AlignLeft)
+        weekly_layout.addWidget(self.weekly_table)
+        weekly_layout.addWidget(self.weekly_chart)
+        layout.addWidget(self.bold_label("📈 Weekly"))
+        layout.addLayout(weekly_layout)
+
+        # 🍂 Seasons (Sep–Jun) and year over year
+        self.season_table = QTableWidget()
+        self.year_table = QTableWidget()
+        periods_layout = QHBoxLayout()
+        periods_layout.setSpacing(20)
+        periods_layout.setAlignment(Qt.AlignLeft)
+        for title, table in (("🍂 By Season (Sep–Jun)", self.season_table), ("📅 Year over Year", self.year_table)):
+            column = QVBoxLayout()
+            column.addWidget(self.bold_label(title))
+            column.addWidget(table)
+            periods_layout.addLayout(column)
+        layout.addLayout(periods_layout)
+
+        # 🧊 Pivot over the earnings cube
+        layout.addWidget(self.bold_label("🧊 Pivot"))
+        self.pivot = PivotWidget()
+        layout.addWidget(self.pivot)
+
+        self._stale = True
+        self._shown_key = None
+
         self.refresh()
 
     def auto_resize_table_height(self, table, row_height=30, max_height=300):
@@ -865,193 +1487,154 @@ class StatisticsTab(QWidget):
         return lbl
 
     def load_years(self):
-        conn = sqlite3.connect("matches.db")
-        cur = conn.cursor()
-        cur.execute("SELECT DISTINCT strftime('%Y', date) FROM matches")
-        years = sorted(set(row[0] for row in cur.fetchall() if row[0]))
-        conn.close()
+        def distinct_years():
+            conn = connect()
+            cur = conn.cursor()
+            cur.execute("SELECT DISTINCT strftime('%Y', date) FROM matches")
+            years = sorted(set(row[0] for row in cur.fetchall() if row[0]))
+            conn.close()
+            return years
+        years = QUERY_MEMO.get(("years",), distinct_years)
 
+        current = self.year_selector.currentText()
         self.year_selector.blockSignals(True)
         self.year_selector.clear()
         self.year_selector.addItem("All")  # 默认值
         self.year_selector.addItems(years)
+        if current in years:
+            self.year_selector.setCurrentText(current)
         self.year_selector.blockSignals(False)
 
+    def load_referees(self):
+        def referees():
+            conn = connect()
+            rows = list_referees(conn)
+            conn.close()
+            return rows
+        rows = QUERY_MEMO.get(("referees",), referees)
+
+        current = self.referee_selector.currentData()
+        self.referee_selector.blockSignals(True)
+        self.referee_selector.clear()
+        self.referee_selector.addItem("All Referees", None)
+        for referee_id, name in rows:
+            self.referee_selector.addItem(name, referee_id)
+        self.referee_selector.setCurrentIndex(max(self.referee_selector.findData(current), 0))
+        self.referee_selector.blockSignals(False)
+
     def get_year_filter(self):
         year = self.year_selector.currentText()
-        if year == "All":
-            return "", []
-        else:
-            return " AND strftime('%Y', date)=?", [year]
-    
+        return None if year in ("", "All") else year
 
     def load_summary(self):
-        year_filter, params = self.get_year_filter()
-        conn = sqlite3.connect("matches.db")
-        cur = conn.cursor()
-        cur.execute(f"SELECT COUNT(*), SUM(amount) FROM matches WHERE 1=1 {year_filter}", params)
-        row = cur.fetchone()
-        count = row[0] or 0
-        total = row[1] or 0.0
-        avg = (total / count) if count else 0.0
-        self.summary_label.setText(f"📊 Total Matches: <b>{count}</b> | Total: <b>${total:.2f}</b> | Avg: <b>${avg:.2f}</b>")
-        conn.close()
+        frame = self.frame
+        self.summary_label.setText(f"📊 Total Matches: <b>{frame.count}</b> | Total: <b>${frame.total:.2f}</b> | Avg: <b>${frame.average:.2f}</b>")
     
     def auto_resize_table_height(self, table, row_height=32, max_height=1000):
         rows = table.rowCount()
         height = min(row_height * rows + table.horizontalHeader().height() + 4, max_height)
-        print(f"🪄 Final resize: {rows} rows -> height={height}")
+        logger.debug("Final resize: %d rows -> height=%d", rows, height)
         table.setFixedHeight(height)
+
+    def fill_table(self, table, headers, names, totals):
+        table.setColumnCount(2)
+        table.setHorizontalHeaderLabels(headers)
+        table.setRowCount(len(names))
+        for row_pos, (name, total) in enumerate(zip(names, totals)):
+            table.setItem(row_pos, 0, QTableWidgetItem(str(name)))
+            table.setItem(row_pos, 1, QTableWidgetItem(f"${total:.2f}"))
+        table.resizeColumnsToContents()
+        self.auto_resize_table_height(table, row_height=32, max_height=1000)
             
+    def fill_rows(self, table, headers, rows):
+        table.setColumnCount(len(headers))
+        table.setHorizontalHeaderLabels(headers)
+        table.setRowCount(len(rows))
+        for row_pos, row in enumerate(rows):
+            for col, text in enumerate(row):
+                table.setItem(row_pos, col, QTableWidgetItem(text))
+        table.resizeColumnsToContents()
+
+    @staticmethod
+    def format_change(change):
+        return "" if change is None else f"{change:+.0%}"
+
+    def load_period_stats(self):
+        periods = self.periods
+        weeks = periods.weeks_in(self.get_year_filter())
+        # newest week first in the table, oldest first on the chart
+        rows = [(str(periods.week_starts[i]), str(periods.week_counts[i]), f"${periods.week_totals[i]:.2f}",
+                 f"${periods.rolling_totals[4][i]:.2f} ({periods.rolling_counts[4][i]})",
+                 f"${periods.rolling_totals[12][i]:.2f} ({periods.rolling_counts[12][i]})")
+                for i in weeks[::-1]]
+        self.fill_rows(self.weekly_table, ["Week of", "Games", "Total", "Last 4 wks", "Last 12 wks"], rows)
+        self.weekly_chart.set_data([str(periods.week_starts[i])[5:] for i in weeks],
+                                   [periods.week_totals[weeks],
+                                    periods.rolling_totals[4][weeks] / 4,
+                                    periods.rolling_totals[12][weeks] / 12],
+                                   self._shown_key)
+
+        season_changes = periods.changes(list(periods.season_totals))
+        rows = [(f"{y}-{(y + 1) % 100:02d}", str(c), f"${t:.2f}", self.format_change(d))
+                for y, t, c, d in zip(periods.seasons, periods.season_totals, periods.season_counts, season_changes)]
+        self.fill_rows(self.season_table, ["Season", "Games", "Total", "vs prev"], rows[::-1])
+        self.auto_resize_table_height(self.season_table, row_height=32, max_height=300)
+
+        total_changes = periods.changes(list(periods.year_totals))
+        count_changes = periods.changes(list(periods.year_counts))
+        rows = [(str(y), str(c), self.format_change(dc), f"${t:.2f}", self.format_change(dt))
+                for y, t, c, dt, dc in zip(periods.years, periods.year_totals, periods.year_counts,
+                                           total_changes, count_changes)]
+        self.fill_rows(self.year_table, ["Year", "Games", "Games YoY", "Total", "Total YoY"], rows[::-1])
+        self.auto_resize_table_height(self.year_table, row_height=32, max_height=300)
+
     def load_league_stats(self):
-        year_filter, params = self.get_year_filter()
-        conn = sqlite3.connect("matches.db")
-        cur = conn.cursor()
-        cur.execute(f"SELECT league, SUM(amount) FROM matches WHERE 1=1 {year_filter} GROUP BY league", params)
-        rows = cur.fetchall()
-        conn.close()
-        self.league_table.setColumnCount(2)
-        self.league_table.setHorizontalHeaderLabels(["League", "Total"])
-        self.league_table.setRowCount(0)
-        self.auto_resize_table_height(self.league_table)
-        for row in rows:
-            self.league_table.insertRow(self.league_table.rowCount())
-            self.league_table.setItem(self.league_table.rowCount() - 1, 0, QTableWidgetItem(row[0]))
-            self.league_table.setItem(self.league_table.rowCount() - 1, 1, QTableWidgetItem(f"${row[1]:.2f}"))
-        self.league_table.resizeColumnsToContents()
-        self.auto_resize_table_height(self.league_table, row_height=32, max_height=1000)
+        frame = self.frame
+        self.fill_table(self.league_table, ["League", "Total"], frame.league_names, frame.league_totals)
 
     def load_role_stats(self):
-        year_filter, params = self.get_year_filter()
-        conn = sqlite3.connect("matches.db")
-        cur = conn.cursor()
-        cur.execute(f"SELECT role, SUM(amount) FROM matches WHERE 1=1 {year_filter} GROUP BY role", params)
-        rows = cur.fetchall()
-        conn.close()
-
-        self.role_table.setColumnCount(2)
-        self.role_table.setHorizontalHeaderLabels(["Role", "Total"])
-        self.role_table.setRowCount(0)
-
-        for role, total in rows:
-            row_pos = self.role_table.rowCount()
-            self.role_table.insertRow(row_pos)
-            self.role_table.setItem(row_pos, 0, QTableWidgetItem(role or ""))
-            self.role_table.setItem(row_pos, 1, QTableWidgetItem(f"${total:.2f}" if total is not None else "$0.00"))
-        
-        self.role_table.resizeColumnsToContents()
-        self.auto_resize_table_height(self.role_table, row_height=32, max_height=1000)
+        frame = self.frame
+        self.fill_table(self.role_table, ["Role", "Total"], frame.role_names, frame.role_totals)
 
     def plot_role_chart(self):
-        self.role_chart.figure.clear()
-        ax = self.role_chart.figure.add_subplot(111)
-        year_filter, params = self.get_year_filter()
-        conn = sqlite3.connect("matches.db")
-        cur = conn.cursor()
-        cur.execute(f"SELECT role, SUM(amount) FROM matches WHERE 1=1 {year_filter} GROUP BY role", params)
-        data = [(r, a) for r, a in cur.fetchall() if r and a]
-        conn.close()
-
-        if not data:
-            return
-
-        roles = [r for r, _ in data]
-        totals = [a for _, a in data]
-
-        wedges, texts, autotexts = ax.pie(
-            totals,
-            labels=None,  # 不直接在图上画 label，避免重叠
-            autopct='%1.1f%%',
-            startangle=90,
-            textprops={'fontsize': 8}
-        )
-
-        ax.set_title("Income by Role", pad=10, fontsize=10)
-
-        # ✅ 设置图例在右侧、字体小、水平分布
-        ax.legend(
-            wedges,
-            [r if len(r) < 10 else r[:8] + "…" for r in roles],
-            loc="lower center",
-            bbox_to_anchor=(0.5, -0.15),  # 适当微调
-            ncol=len(roles),
-            fontsize=9,
-            title="Role"
-        )
-        self.role_chart.setMinimumHeight(300)
-        self.role_chart.draw()
+        frame = self.frame
+        self.role_chart.set_data(frame.role_names, frame.role_totals, self._shown_key)
 
     def load_data(self):
-        conn = sqlite3.connect("matches.db")
-        cur = conn.cursor()
-
-        self.monthly.setColumnCount(2)
-        self.monthly.setHorizontalHeaderLabels(["Month", "Total"])
-        self.auto_resize_table_height(self.league_table)
-        self.auto_resize_table_height(self.role_table)
-        cur.execute("SELECT strftime('%Y-%m', date), SUM(amount) FROM matches GROUP BY 1")
-        rows = cur.fetchall()
-        self.monthly.setRowCount(0)
-        for row in rows:
-            self.monthly.insertRow(self.monthly.rowCount())
-            self.monthly.setItem(self.monthly.rowCount() - 1, 0, QTableWidgetItem(row[0]))
-            self.monthly.setItem(self.monthly.rowCount() - 1, 1, QTableWidgetItem(f"${row[1] or 0:.2f}"))
-        conn.close()
+        frame = self.frame
+        self.fill_table(self.monthly, ["Month", "Total"], frame.months, frame.month_totals)
+        self.monthly.setFixedHeight(200)
 
     def plot_monthly_chart(self):
-        self.monthly_chart.figure.clear()
-        ax = self.monthly_chart.figure.add_subplot(111)
-
-        year_filter, params = self.get_year_filter()
-        conn = sqlite3.connect("matches.db")
-        cur = conn.cursor()
-        cur.execute(f"SELECT strftime('%Y-%m', date), SUM(amount) FROM matches WHERE 1=1 {year_filter} GROUP BY 1", params)
-        data = cur.fetchall()
-        conn.close()
-
-        data = [(m, t) for m, t in data if m and t is not None]
-        months = [row[0] for row in data]
-        totals = [row[1] for row in data]
-
-        ax.bar(months, totals, color='cornflowerblue', width=0.6)
-        ax.set_title("Monthly Income", fontsize=10)
-        ax.set_xlabel("Month", fontsize=9)
-        ax.set_ylabel("Total ($)", fontsize=9)
-        ax.tick_params(axis='x', labelsize=8, rotation=45)
-        ax.tick_params(axis='y', labelsize=8)
-        ax.margins(x=0.1)
-
-        self.monthly_chart.draw()
+        frame = self.frame
+        self.monthly_chart.set_data(frame.months, frame.month_totals, self._shown_key)
 
     def plot_league_chart(self):
-        self.league_chart.figure.clear()
-        ax = self.league_chart.figure.add_subplot(111)
-        year_filter, params = self.get_year_filter()
-        conn = sqlite3.connect("matches.db")
-        cur = conn.cursor()
-        cur.execute(f"SELECT league, SUM(amount) FROM matches WHERE 1=1 {year_filter} GROUP BY league", params)
-        data = cur.fetchall()
-        conn.close()
-
-        data = [(l, t) for l, t in data if l and t is not None]
+        frame = self.frame
+        data = [(l, t) for l, t in zip(frame.league_names, frame.league_totals) if l]
         data = sorted(data, key=lambda x: x[1], reverse=True)[:7]
+        self.league_chart.set_data([l if len(l) <= 14 else l[:12] + "…" for l, _ in data],
+                                   [t for _, t in data], self._shown_key)
 
-        leagues = [l if len(l) <= 14 else l[:12] + "…" for l, _ in data]
-        totals = [t for _, t in data]
-        ax.barh(leagues, totals, color='lightskyblue')
-        ax.set_title("Top Leagues by Income", fontsize=10)
-        ax.set_xlabel("Total ($)", fontsize=9)
-        ax.set_ylabel("League", fontsize=9)
-        ax.tick_params(axis='x', labelsize=8)
-        ax.tick_params(axis='y', labelsize=8)
-        ax.invert_yaxis()  # 从高到低显示
-
-        self.league_chart.figure.subplots_adjust(left=0.2, right=0.95, top=0.85, bottom=0.2)
-        self.league_chart.draw()
-
+    def showEvent(self, event):
+        super().showEvent(event)
+        # cheap when nothing changed: refresh() returns early on the same (year, data version)
+        self.refresh()
 
     def refresh(self):
+        # hidden tabs only remember that they are out of date and catch up when shown
+        if not self.isVisible():
+            self._stale = True
+            return
+        self._stale = False
         self.load_years()
+        self.load_referees()
+        key = (self.get_year_filter(), self.referee_selector.currentData(), storage.DATA_VERSION)
+        if key == self._shown_key:
+            return
+        self._shown_key = key
+        self.frame = STATS_ENGINE.frame(key[0], key[1])
+        self.periods = STATS_ENGINE.periods(key[1])
         self.load_data()
         self.load_summary()
         self.load_league_stats()
@@ -1059,6 +1642,195 @@ class StatisticsTab(QWidget):
         self.plot_monthly_chart()
         self.plot_league_chart()
         self.plot_role_chart()
+        self.load_period_stats()
+        self.pivot.refresh()
+
+# === Themes ===
+WINDOW_QSS = """
+    QPushButton {
+        background-color: #4CAF50;
+        color: white;
+        padding: 6px 12px;
+        border: none;
+        border-radius: 6px;
+        font-weight: bold;
+        transition: all 0.3s ease;
+    }
+    QPushButton:hover {
+        background-color: #45a049;
+    }
+    QPushButton:pressed {
+        background-color: #397d3c;
+    }
+
+    QLineEdit, QComboBox, QTableView {
+        border: 1px solid #ccc;
+        border-radius: 6px;
+        padding: 6px;
+        background-color: #f7f7f7;
+    }
+
+    QLineEdit:hover, QComboBox:hover {
+        background-color: #ffffff;
+    }
+
+    QHeaderView::section {
+        background-color: #e0e0e0;
+        padding: 4px;
+        border: 1px solid #ccc;
+        font-weight: bold;
+    }
+
+    QTableView::item:hover {
+        background-color: #eaf4ea;
+    }
+"""
+
+TABLE_QSS = {
+    "light": """
+    QTableView {
+        background-color: #f7f7f7;
+        color: black;
+        gridline-color: #ccc;
+    }
+    QHeaderView::section {
+        background-color: #e0e0e0;
+        color: black;
+    }
+    QTableView::item:selected {
+        background-color: #d0f0d0;
+    }
+""",
+    "dark": """
+    QTableView {
+        background-color: #2b2b2b;
+        color: #eeeeee;
+        gridline-color: #444;
+    }
+    QHeaderView::section {
+        background-color: #3c3c3c;
+        color: white;
+        border: 1px solid #555;
+    }
+    QTableView::item:selected {
+        background-color: #555;
+    }
+    QLineEdit, QComboBox, QTimeEdit {
+        background-color: #2b2b2b;
+        color: #eeeeee;
+        border: 1px solid #555;
+        border-radius: 6px;
+        padding: 6px;
+    }
+    QLineEdit:hover, QComboBox:hover, QTimeEdit:hover {
+        background-color: #3c3c3c;
+    }
+""",
+}
+
+class ThemeManager:
+    """Compiles each qt_material theme once and swaps whole stylesheets.
+
+    The compiled QSS is cached on disk (keyed by theme, qt_material version and FORMAT)
+    together with the icon folder qt_material generated for it, so later runs and
+    toggles never import qt_material or re-render its template.
+    """
+    THEMES = {"light": "light_blue.xml", "dark": "dark_teal.xml"}
+    FORMAT = 1  # bump when the cache layout changes
+
+    def __init__(self, cache_dir=None):
+        self.cache_dir = Path(cache_dir) if cache_dir else Path.home() / ".qt_material" / "refsys"
+        self.current = None
+        self._compiled = {}
+        self._app_ready = False
+
+    def _version(self):
+        # size + mtime of qt_material/__init__.py changes with every install/upgrade and,
+        # unlike importlib.metadata, costs nothing at startup
+        try:
+            origin = importlib.util.find_spec("qt_material").origin
+            stat = os.stat(origin)
+            return f"{stat.st_size}-{int(stat.st_mtime)}"
+        except (AttributeError, TypeError, ValueError, OSError):
+            return "bundled"
+
+    def compiled(self, name):
+        entry = self._compiled.get(name)
+        if entry is None:
+            key = f"{self.THEMES[name]}|{self._version()}|{self.FORMAT}"
+            path = self.cache_dir / f"{name}.json"
+            try:
+                with open(path, encoding="utf-8") as f:
+                    entry = json.load(f)
+                if entry.get("key") != key or not all(
+                        os.path.isdir(entry[d]) for d in ("icon_dir", "resources_dir", "fonts_dir")):
+                    entry = None
+            except (OSError, ValueError, KeyError):
+                entry = None
+            if entry is None:
+                entry = self._compile(name, key, path)
+            self._compiled[name] = entry
+        return entry
+
+    def _compile(self, name, key, path):
+        import qt_material
+        started = time.perf_counter()
+        icon_dir = self.cache_dir / name
+        package_dir = os.path.dirname(qt_material.__file__)
+        qss = qt_material.build_stylesheet(theme=self.THEMES[name], parent=str(icon_dir))
+        entry = {
+            "key": key,
+            "qss": qss,
+            "primary": os.environ.get("QTMATERIAL_PRIMARYCOLOR", "#000000"),
+            "icon_dir": str(icon_dir),
+            "resources_dir": os.path.join(package_dir, "resources"),
+            "fonts_dir": os.path.join(package_dir, "fonts", "roboto"),
+        }
+        try:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            tmp = path.with_suffix(".tmp")
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(entry, f)
+            os.replace(tmp, path)
+        except OSError as e:
+            logger.warning("Could not cache theme %s: %s", name, e)
+        logger.info("Compiled theme %s in %.0f ms", name, (time.perf_counter() - started) * 1000)
+        return entry
+
+    def _prepare_app(self, app, entry):
+        # what qt_material.apply_stylesheet does besides setStyleSheet, once per process
+        app.setStyle("Fusion")
+        QDir.addSearchPath("qt_material", entry["resources_dir"])
+        for font in os.listdir(entry["fonts_dir"]):
+            if font.endswith(".ttf"):
+                QFontDatabase.addApplicationFont(os.path.join(entry["fonts_dir"], font))
+        self._app_ready = True
+
+    def apply(self, app, name, window=None):
+        entry = self.compiled(name)
+        if not self._app_ready:
+            self._prepare_app(app, entry)
+        # replace (not add to) the search paths so icons follow the active theme
+        QDir.setSearchPaths("icon", [entry["icon_dir"]])
+        palette = QGuiApplication.palette()
+        primary = entry["primary"]
+        palette.setColor(QPalette.ColorRole.Text, QColor(*[int(primary[i:i + 2], 16) for i in (1, 3, 5)], 92))
+        QGuiApplication.setPalette(palette)
+        if window is not None:
+            window.setUpdatesEnabled(False)
+        try:
+            app.setStyleSheet(entry["qss"])
+            self.current = name
+            if window is not None:
+                self.style_window(window)
+        finally:
+            if window is not None:
+                window.setUpdatesEnabled(True)
+
+    def style_window(self, window):
+        window.setStyleSheet(WINDOW_QSS + TABLE_QSS[self.current or "light"])
+
+THEMES = ThemeManager()
 
 # ---------- App ----------
 class RefereeApp(QWidget):
@@ -1070,11 +1842,14 @@ class RefereeApp(QWidget):
         tabs = QTabWidget()
         self.auto_tab = AutoTab()
         self.calendar_tab = CalendarTab()
+        self.agenda_tab = AgendaTab()
         self.add_tab = AddMatchTab()
-        self.stats_tab = StatisticsTab()
+        # StatisticsTab (and matplotlib) is built the first time its tab is opened
+        self.stats_tab = None
+        self.stats_container = QWidget()
+        QVBoxLayout(self.stats_container).setContentsMargins(0, 0, 0, 0)
         self.auto_tab.calendar_tab = self.calendar_tab
         self.add_tab.calendar_tab = self.calendar_tab
-        self.calendar_tab.stats_tab = self.stats_tab
         self.theme_switch = QCheckBox("🌞 Light / Dark 🌚")
         self.theme_switch.setChecked(False)  # default color
         self.theme_switch.setCursor(Qt.PointingHandCursor)
@@ -1103,112 +1878,123 @@ class RefereeApp(QWidget):
         layout.addLayout(top_layout)
         tabs.addTab(self.auto_tab, "🧠 Auto")
         tabs.addTab(self.calendar_tab, "📅 Calendar")
+        tabs.addTab(self.agenda_tab, "🗓️ Agenda")
         tabs.addTab(self.add_tab, "➕ Add Match")
-        tabs.addTab(self.stats_tab, "📊 Statistics")
+        tabs.addTab(self.stats_container, "📊 Statistics")
+        tabs.currentChanged.connect(self.on_tab_changed)
+        self.tabs = tabs
         layout.addWidget(tabs)
-        self.calendar_tab.highlight_match_dates()
-        self.calendar_tab.refresh_table()
-        self.setStyleSheet("""
-            QPushButton {
-                background-color: #4CAF50;
-                color: white;
-                padding: 6px 12px;
-                border: none;
-                border-radius: 6px;
-                font-weight: bold;
-                transition: all 0.3s ease;
-            }
-            QPushButton:hover {
-                background-color: #45a049;
-            }
-            QPushButton:pressed {
-                background-color: #397d3c;
-            }
-        """)
-        self.setStyleSheet(self.styleSheet() + """
-            QLineEdit, QComboBox, QTableWidget {
-                border: 1px solid #ccc;
-                border-radius: 6px;
-                padding: 6px;
-                background-color: #f7f7f7;
-            }
+        # fill the calendar once the window is up
+        QTimer.singleShot(0, self.populate_calendar)
+        self._first_paint = None
+        self._shown_at = None
+        self._calendar_ready = False
+        self.startup_report = None
+        THEMES.style_window(self)
+        # writes from other processes (CLI, server, sync, the Tk app) and requests from later launches
+        self.instance = None
+        self.watcher = ChangeWatcher(skip_own=True)
+        self._outside_timer = QTimer(self)
+        self._outside_timer.setInterval(1000)
+        self._outside_timer.timeout.connect(self.poll_outside_changes)
+        self._outside_timer.start()
+
+    def populate_calendar(self):
+        with STARTUP.phase("first_queries"):
+            self.calendar_tab.highlight_match_dates()
+            self.calendar_tab.refresh_table()
+        self._calendar_ready = True
+        self.finish_startup_report()
+
+    def on_tab_changed(self, index):
+        if self.tabs.widget(index) is self.stats_container and self.stats_tab is None:
+            self.stats_tab = StatisticsTab()
+            self.stats_container.layout().addWidget(self.stats_tab)
+            self.calendar_tab.stats_tab = self.stats_tab
+
+    def paintEvent(self, event):
+        super().paintEvent(event)
+        if self._first_paint is None:
+            self._first_paint = time.perf_counter()
+            STARTUP.add("first_paint", self._shown_at or self._first_paint, self._first_paint)
+            logger.info("First paint after %.0f ms", (self._first_paint - _PROCESS_START) * 1000)
+            QTimer.singleShot(0, self.finish_startup_report)
+
+    def finish_startup_report(self):
+        # report once both the window has painted and the calendar's first queries ran
+        if self.startup_report is None or self._first_paint is None or not self._calendar_ready:
+            return
+        STARTUP.write(self.startup_report, self._first_paint)
+        self.startup_report = None
+        if STARTUP.imports is not None:
+            STARTUP.imports.uninstall()
+        QApplication.quit()
 
-            QLineEdit:hover, QComboBox:hover {
-                background-color: #ffffff;
-            }
+    def toggle_theme(self):
+        THEMES.apply(app, "dark" if self.theme_switch.isChecked() else "light", self)
+
+    def poll_outside_changes(self):
+        if self.instance is not None:
+            for message in self.instance.pending():
+                self.bring_to_front()
+                self.load_files(message.get("files", ()))
+        if self.watcher.poll():
+            notify_matches_changed()
+            self.calendar_tab.highlight_match_dates()
+            self.calendar_tab.refresh_table()
+            if self.agenda_tab.isVisible():
+                self.agenda_tab.refresh()
+            if self.stats_tab is not None:
+                self.stats_tab.refresh()
 
-            QHeaderView::section {
-                background-color: #e0e0e0;
-                padding: 4px;
-                border: 1px solid #ccc;
-                font-weight: bold;
-            }
+    def bring_to_front(self):
+        self.setWindowState(self.windowState() & ~Qt.WindowMinimized)
+        self.show()
+        self.raise_()
+        self.activateWindow()
 
-            QTableWidget::item:hover {
-                background-color: #eaf4ea;
-            }
-        """)
-    
-    def toggle_theme(self):
-        if self.theme_switch.isChecked():
-            apply_stylesheet(app, theme='dark_teal.xml')
-            self.set_dark_table_style()
-        else:
-            apply_stylesheet(app, theme='light_blue.xml')
-            self.set_light_table_style()
-    
-    def set_dark_table_style(self):
-        self.setStyleSheet(self.styleSheet() + """
-        QTableWidget {
-            background-color: #2b2b2b;
-            color: #eeeeee;
-            gridline-color: #444;
-        }
-        QHeaderView::section {
-            background-color: #3c3c3c;
-            color: white;
-            border: 1px solid #555;
-        }
-        QTableWidget::item:selected {
-            background-color: #555;
-        }
-        QLineEdit, QComboBox, QTimeEdit {
-            background-color: #2b2b2b;
-            color: #eeeeee;
-            border: 1px solid #555;
-            border-radius: 6px;
-            padding: 6px;
-        }
-        QLineEdit:hover, QComboBox:hover, QTimeEdit:hover {
-            background-color: #3c3c3c;
-        }
-    """)
-
-    def set_light_table_style(self):
-        self.setStyleSheet(self.styleSheet() + """
-            QTableWidget {
-                background-color: #f7f7f7;
-                color: black;
-                gridline-color: #ccc;
-            }
-            QHeaderView::section {
-                background-color: #e0e0e0;
-                color: black;
-            }
-            QTableWidget::item:selected {
-                background-color: #d0f0d0;
-            }
-        """)
+    def load_files(self, paths):
+        if any([self.auto_tab.load_file(path) for path in paths]):
+            self.tabs.setCurrentWidget(self.auto_tab)
+
+def startup_report_path(argv):
+    """--startup-benchmark / --profile-startup [report.json]: "" means print to stdout, None means off."""
+    for flag in ("--profile-startup", "--startup-benchmark"):
+        if flag in argv:
+            following = argv[argv.index(flag) + 1:argv.index(flag) + 2]
+            return following[0] if following and not following[0].startswith("--") else ""
+    return None
 
 if __name__ == "__main__":
-    init_db()
-    update_db_structure()
-    app = QApplication(sys.argv)
-    font = QFont("Segoe UI", 17)
-    font.setBold(True)
-    font.setStyleStrategy(QFont.PreferAntialias)
-    app.setFont(font)
-    apply_stylesheet(app, theme='light_blue.xml')
-    window = RefereeApp()
+    configure_logging()
+    instance = None
+    if startup_report_path(sys.argv) is None and "--reprice" not in sys.argv and "--rollback-reprice" not in sys.argv:
+        # one window per matches.db: a second launch hands its files to the running one and exits
+        instance = SingleInstance("qt")
+        if not instance.acquire():
+            instance.send({"action": "show", "files": handoff_files(sys.argv[1:])})
+            sys.exit(0)
+    with STARTUP.phase("init_db"):
+        init_db()
+    with STARTUP.phase("update_db_structure"):
+        update_db_structure()
+    if "--reprice" in sys.argv or "--rollback-reprice" in sys.argv:
+        sys.exit(run_reprice_cli(sys.argv[1:]))
+    with STARTUP.phase("qapplication"):
+        app = QApplication(sys.argv)
+        font = QFont("Segoe UI", 17)
+        font.setBold(True)
+        font.setStyleStrategy(QFont.PreferAntialias)
+        app.setFont(font)
+    with STARTUP.phase("apply_stylesheet"):
+        THEMES.apply(app, "light")
+    with STARTUP.phase("tab_construction"):
+        window = RefereeApp()
+    # quit after the first paint and write the startup report (see startup_profile.py)
+    window.startup_report = startup_report_path(sys.argv)
+    window.instance = instance
+    window._shown_at = time.perf_counter()
     window.show()
-    sys.exit(app.exec())
\ No newline at end of file
+    if instance is not None:
+        window.load_files(handoff_files(sys.argv[1:]))
+    sys.exit(app.exec())
@@ -0,0 +1,146 @@
+"""Assignment engine on a synthetic 300-game weekend.
+
+    python benchmarks/assign.py
+    python benchmarks/assign.py --games 300 --referees 320 --objective cost --seconds 5
+
+Builds a throwaway database with referees (grades, limits, availability windows, a few games
+they already have), venues on a map with travel times between them, and a Saturday/Sunday
+fixture list needing a Referee and two ARs per game. Runs refsys.assign.solve, then checks
+every constraint again independently of the solver and reports fill rate, fairness and travel.
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from refsys import storage  # noqa: E402
+from refsys.assign import Slot, Travel, solve  # noqa: E402
+from refsys.conflicts import calculate_end_time  # noqa: E402
+from refsys.pricing import TIER_GRADES, infer_match_amount  # noqa: E402
+
+DAYS = ("2025-05-03", "2025-05-04")
+GRADE_SHARE = (0.35, 0.30, 0.25, 0.10)  # grade 1..4
+
+
+def build(args, path):
+    rng = random.Random(args.seed)
+    storage.DB_PATH = path
+    storage.init_db()
+    storage.update_db_structure()
+    conn = storage.connect()
+
+    venues = [f"Park {i:02d}" for i in range(args.venues)]
+    where = {v: (rng.uniform(0, 40), rng.uniform(0, 40)) for v in venues}
+    matrix = {a: {b: round(10 + 1.5 * ((where[a][0] - where[b][0]) ** 2 + (where[a][1] - where[b][1]) ** 2) ** 0.5)
+                  for b in venues if b != a} for a in venues}
+
+    with conn:
+        for i in range(args.referees):
+            grade = rng.choices((1, 2, 3, 4), GRADE_SHARE)[0]
+            referee_id = conn.execute(
+                "INSERT INTO referees (name, grade, max_per_day, max_per_week) VALUES (?, ?, ?, ?)",
+                (f"Ref {i:03d}", grade, rng.choice((2, 3, 3, 4)), rng.choice((4, 5, 6)))).lastrowid
+            for day in DAYS:
+                if rng.random() < 0.8:
+                    start, end = rng.choice(("08:00", "09:00", "10:00", "12:00")), rng.choice(("15:00", "18:00", "22:00"))
+                    conn.execute("INSERT INTO availability (referee_id, date, start_time, end_time) VALUES (?, ?, ?, ?)",
+                                 (referee_id, day, start, end))
+            if rng.random() < 0.1:  # already has a game that weekend
+                start = f"{rng.randint(9, 17):02d}:00"
+                storage.insert_matches(conn, [{
+                    "league": "BCCSL", "role": "Referee", "match_name": "Earlier booking", "date": DAYS[0],
+                    "start_time": start, "end_time": calculate_end_time(start), "location": rng.choice(venues),
+                    "amount": 0.0, "division": "U12", "referee_id": referee_id}])
+
+    tiers = list(TIER_GRADES)
+    kickoffs = [f"{h:02d}:{m:02d}" for h in range(8, 19) for m in (0, 30)]
+    slots = []
+    for g in range(args.games):
+        tier = rng.choice(tiers)
+        league = "BCSPL" if TIER_GRADES[tier] >= 3 and rng.random() < 0.3 else "BCCSL"
+        start = rng.choice(kickoffs)
+        fixture = {"league": league, "division": tier, "match_name": f"Home {g} vs Away {g}",
+                   "date": DAYS[g % len(DAYS)], "start_time": start, "end_time": calculate_end_time(start),
+                   "location": rng.choice(venues), "content": ""}
+        for role in ["Referee"] + ["AR"] * args.ars:
+            match = dict(fixture, role=role, amount=infer_match_amount(league, role, tier))
+            slots.append(Slot(len(slots), match))
+    return conn, slots, Travel(matrix, default=40)
+
+
+def check(assignment, travel):
+    """Constraint violations found without trusting the solver's own bookkeeping."""
+    problems = []
+    games = {}
+    for slot, referee in zip(assignment.slots, assignment.referee_of):
+        if referee is None:
+            continue
+        if referee.grade < slot.grade:
+            problems.append(f"{referee.name} grade {referee.grade} on a grade {slot.grade} slot")
+        if not any(s <= slot.start and slot.end <= e for s, e in referee.windows.get(slot.date, ())):
+            problems.append(f"{referee.name} not available for slot {slot.index}")
+        games.setdefault((referee, slot.date), []).append((slot.start, slot.end, slot.venue))
+    for (referee, date), day in games.items():
+        day = sorted(day + [(s, e, v) for s, e, v, i in referee.days.get(date, ()) if i < 0])
+        for (s1, e1, v1), (s2, e2, v2) in zip(day, day[1:]):
+            if e1 + travel(v1, v2) > s2:
+                problems.append(f"{referee.name} can't get from {v1} to {v2} on {date}")
+        if referee.max_day is not None and len(day) > referee.max_day:
+            problems.append(f"{referee.name} over the daily limit on {date}")
+    for referee in assignment.referees.values():
+        if referee.max_week is not None and any(n > referee.max_week for n in referee.weeks.values()):
+            problems.append(f"{referee.name} over the weekly limit")
+    return problems
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--games", type=int, default=300)
+    parser.add_argument("--referees", type=int, default=320)
+    parser.add_argument("--venues", type=int, default=30)
+    parser.add_argument("--ars", type=int, default=2)
+    parser.add_argument("--objective", default="fairness", choices=("fairness", "cost"))
+    parser.add_argument("--seconds", type=float, default=10.0, help="solver time budget")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--target", type=float, default=10.0, help="seconds that count as OK")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        conn, slots, travel = build(args, os.path.join(tmp, "matches.db"))
+        started = time.perf_counter()
+        try:
+            assignment, timings = solve(conn, slots, args.objective, travel, args.seconds)
+        finally:
+            conn.close()
+        elapsed = time.perf_counter() - started
+
+    filled = len(slots) - assignment.referee_of.count(None)
+    eligible = [len(s.candidates) for s in slots]
+    loads = [r.load for r in assignment.referees.values() if r.windows]
+    travelled = sum(travel(a[2], b[2]) for r in assignment.referees.values()
+                    for day in r.days.values() for a, b in zip(day, day[1:]))
+    surplus = sum(r.grade - s.grade for s, r in zip(slots, assignment.referee_of) if r)
+    print(f"{args.games} games, {len(slots)} slots, {args.referees} referees, {args.venues} venues; "
+          f"eligible referees per slot: median {statistics.median(eligible):.0f}, min {min(eligible)}")
+    print(f"filled {filled}/{len(slots)} ({filled / len(slots):.1%}) in {elapsed:.2f}s "
+          f"(setup {timings['setup']:.2f}s, greedy {timings['greedy']:.2f}s, improve {timings['improve']:.2f}s)")
+    print(f"objective ({args.objective}) {timings['greedy_objective']:.0f} after greedy -> "
+          f"{assignment.objective():.0f} after {timings['repaired']} repair(s) and {timings['moves']} move(s)")
+    print(f"games per available referee: {min(loads)}-{max(loads)}, stdev {statistics.pstdev(loads):.2f}; "
+          f"travel {travelled} min; grade surplus {surplus}")
+    problems = check(assignment, travel)
+    for problem in problems[:10]:
+        print("VIOLATION", problem)
+    ok = not problems and elapsed <= args.target
+    print(f"target {args.target:.0f}s, no violations: {'OK' if ok else 'FAILED'}")
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,77 @@
+"""Requests per second against `python -m refsys serve`.
+
+    python -m refsys serve &
+    python benchmarks/server.py --clients 8 --seconds 5
+    python benchmarks/server.py --path "/matches?from=2024-01-01&to=2024-12-31" --no-etag
+
+Each client holds one keep-alive connection. By default clients send back the ETag they
+got, so most answers are 304s; --no-etag measures full responses instead.
+"""
+import argparse
+import http.client
+import statistics
+import sys
+import threading
+import time
+
+
+def client(host, port, paths, use_etag, stop_at, results):
+    conn = http.client.HTTPConnection(host, port, timeout=10)
+    etags = {}
+    latencies, statuses = [], {}
+    i = 0
+    while time.perf_counter() < stop_at:
+        path = paths[i % len(paths)]
+        i += 1
+        headers = {"If-None-Match": etags[path]} if use_etag and path in etags else {}
+        started = time.perf_counter()
+        conn.request("GET", path, headers=headers)
+        response = conn.getresponse()
+        response.read()
+        latencies.append(time.perf_counter() - started)
+        statuses[response.status] = statuses.get(response.status, 0) + 1
+        if response.getheader("ETag"):
+            etags[path] = response.getheader("ETag")
+    conn.close()
+    results.append((latencies, statuses))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--clients", type=int, default=8)
+    parser.add_argument("--seconds", type=float, default=5)
+    parser.add_argument("--path", action="append", help="path to request (repeatable)")
+    parser.add_argument("--no-etag", action="store_true", help="never send If-None-Match")
+    parser.add_argument("--target", type=float, default=300, help="requests per second that counts as OK")
+    args = parser.parse_args(argv)
+
+    paths = args.path or ["/day/2024-06-15", "/matches?from=2024-06-01&to=2024-06-30",
+                          "/stats?by=month&year=2024", "/version"]
+    results = []
+    stop_at = time.perf_counter() + args.seconds
+    threads = [threading.Thread(target=client, args=(args.host, args.port, paths, not args.no_etag, stop_at, results))
+               for _ in range(args.clients)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    latencies = sorted(l for r in results for l in r[0])
+    statuses = {}
+    for _, s in results:
+        for status, count in s.items():
+            statuses[status] = statuses.get(status, 0) + count
+    rps = len(latencies) / args.seconds
+    print(f"{len(latencies)} requests in {args.seconds:.0f}s from {args.clients} clients: {rps:.0f} req/s")
+    print(f"latency median {statistics.median(latencies) * 1000:.1f} ms, "
+          f"p99 {latencies[int(len(latencies) * 0.99)] * 1000:.1f} ms")
+    print("status " + ", ".join(f"{k}: {v}" for k, v in sorted(statuses.items())))
+    ok = rps >= args.target
+    print(f"target {args.target:.0f} req/s: {'OK' if ok else 'UNDER'}")
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
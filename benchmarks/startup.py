@@ -0,0 +1,130 @@
+"""Time-to-first-paint benchmark for the PySide6 app (or the frozen exe).
+
+    python benchmarks/startup.py                 # runs RefSys_PySide6.py
+    python benchmarks/startup.py --exe dist/RefSys_PySide6.exe --runs 10
+    python benchmarks/startup.py --profile --save before.json
+    python benchmarks/startup.py --profile --compare before.json
+
+--profile runs the app with --profile-startup, which adds import timings to every report.
+--save writes the summary (median per phase, slowest imports) so a later run can
+--compare against it; phases that got slower by more than --threshold are flagged.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+TARGET_MS = 1000
+
+
+def run_once(command, cwd, flag):
+    fd, report_path = tempfile.mkstemp(suffix=".json")
+    os.close(fd)
+    try:
+        started = time.perf_counter()
+        subprocess.run(command + [flag, report_path], cwd=cwd, check=True, timeout=120)
+        wall_ms = (time.perf_counter() - started) * 1000
+        with open(report_path, encoding="utf-8") as f:
+            report = json.load(f)
+    finally:
+        os.remove(report_path)
+    report["wall_ms"] = round(wall_ms, 1)
+    return report
+
+
+def summarize(runs):
+    phases = {}
+    for run in runs:
+        totals = {}
+        for phase in run.get("phases", []):
+            totals[phase["phase"]] = totals.get(phase["phase"], 0) + phase["ms"]
+        for name, ms in totals.items():
+            phases.setdefault(name, []).append(ms)
+    summary = {
+        "runs": len(runs),
+        "time_to_first_paint_ms": statistics.median(r["time_to_first_paint_ms"] for r in runs),
+        "wall_ms": statistics.median(r["wall_ms"] for r in runs),
+        "phases_ms": {name: statistics.median(values) for name, values in phases.items()},
+    }
+    packages = {}
+    for run in runs:
+        for name, us in run.get("imports", {}).get("by_package_us", {}).items():
+            packages.setdefault(name, []).append(us)
+    if packages:
+        medians = {name: statistics.median(values) / 1000 for name, values in packages.items()}
+        summary["imports_ms"] = dict(sorted(medians.items(), key=lambda item: -item[1])[:20])
+    return summary
+
+
+def print_summary(summary):
+    print(f"first paint: median {summary['time_to_first_paint_ms']:.0f} ms over {summary['runs']} runs")
+    print(f"process wall clock (incl. interpreter start and quit): median {summary['wall_ms']:.0f} ms")
+    for name, ms in summary["phases_ms"].items():
+        print(f"  {name:<22} {ms:8.1f} ms")
+    if "imports_ms" in summary:
+        print("slowest imports (cumulative):")
+        for name, ms in list(summary["imports_ms"].items())[:10]:
+            print(f"  {name:<22} {ms:8.1f} ms")
+
+
+def compare(baseline, current, threshold):
+    """Print baseline vs current per phase; returns the names that regressed."""
+    rows = [("time_to_first_paint", baseline["time_to_first_paint_ms"], current["time_to_first_paint_ms"])]
+    for name in list(baseline["phases_ms"]) + [n for n in current["phases_ms"] if n not in baseline["phases_ms"]]:
+        rows.append((name, baseline["phases_ms"].get(name), current["phases_ms"].get(name)))
+    for name in current.get("imports_ms", {}):
+        rows.append(("import " + name, baseline.get("imports_ms", {}).get(name), current["imports_ms"][name]))
+    regressions = []
+    print(f"{'':<28} {'baseline':>10} {'current':>10} {'change':>8}")
+    for name, before, after in rows:
+        if before is None or after is None:
+            print(f"{name:<28} {before if before is not None else '-':>10} {after if after is not None else '-':>10}")
+            continue
+        change = (after - before) / before if before else 0.0
+        # ignore noise on phases that only take a few ms
+        slower = change > threshold and after - before > 5
+        if slower:
+            regressions.append(name)
+        print(f"{name:<28} {before:10.1f} {after:10.1f} {change:+8.0%}{'  <-- slower' if slower else ''}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--exe", help="frozen executable to time instead of the script")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--profile", action="store_true", help="also record import timings")
+    parser.add_argument("--save", help="write the summary to this file")
+    parser.add_argument("--compare", help="summary from an earlier --save to compare against")
+    parser.add_argument("--threshold", type=float, default=0.10, help="relative slowdown that counts as a regression")
+    args = parser.parse_args(argv)
+
+    command = [args.exe] if args.exe else [sys.executable, str(ROOT / "RefSys_PySide6.py")]
+    flag = "--profile-startup" if args.profile else "--startup-benchmark"
+    runs = [run_once(command, ROOT, flag) for _ in range(args.runs)]
+    summary = summarize(runs)
+    print_summary(summary)
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump(summary, f, indent=2)
+
+    failed = summary["time_to_first_paint_ms"] > TARGET_MS
+    print(f"target {TARGET_MS} ms: {'OVER' if failed else 'OK'}")
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(baseline, summary, args.threshold)
+        if regressions:
+            print("regressed: " + ", ".join(regressions))
+            failed = True
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,18 @@
+"""Headless core shared by the PySide6 and Tk front ends.
+
+storage    matches.db connections (WAL, busy retries), schema, referees and change notification
+parsing    pasted assignment text -> match dicts
+pricing    rate tables, division tiers and grades, amount inference, re-pricing
+conflicts  end times, per-referee overlap checks and workload limits
+stats      NumPy statistics, period series and the earnings cube
+records    CSV/JSON Lines column mapping, validation and import
+ics        incremental iCalendar feed
+snapshot   columnar .npy snapshot for notebooks
+assign     availability windows and the weekend assignment engine
+sync       change log, version vectors and delta sync between devices
+instance   single-instance guard and handoff for the GUI front ends
+cli        `python -m refsys` subcommands
+server     asyncio HTTP/JSON API (`python -m refsys serve`)
+
+Nothing in here imports Qt, Tk or matplotlib.
+"""
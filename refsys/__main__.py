@@ -0,0 +1,5 @@
+import sys
+
+from refsys.cli import main
+
+sys.exit(main())
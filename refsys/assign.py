@@ -0,0 +1,391 @@
+"""Weekend assignment engine: fills open Referee/AR slots from referees' availability windows.
+
+A slot is one role on one fixture. A referee can take it when
+  - one of their availability windows on that date covers the whole game,
+  - their grade is at least pricing.required_grade(role, division) (the BCCR_RATES tiers),
+  - it leaves travel time to and from their other games that day, the ones already in the db included,
+  - it keeps them within their daily and weekly limits.
+
+solve() fills the most constrained slots first (fewest eligible referees), then repairs slots it
+couldn't fill by moving one blocking game to somebody else, then improves the objective with
+moves and same-kickoff swaps until a pass finds nothing or the time budget runs out. Eligibility
+is worked out once per slot, and a referee's games are kept per (referee, date), so each check
+only looks at the handful of games that referee has that day.
+
+    fairness  spread games evenly (squared games per referee), then less travel
+    cost      least travel, keeping high-grade referees for the games that need them
+"""
+import bisect
+import json
+import time
+from datetime import datetime, timedelta
+
+from refsys import storage
+from refsys.conflicts import week_bounds
+from refsys.pricing import infer_match_amount, required_grade
+from refsys.records import RecordError, column_map, to_match
+
+# weights of (games per referee squared, travel minutes, grades above what the slot needs)
+OBJECTIVES = {
+    "fairness": (10.0, 0.2, 1.0),
+    "cost": (0.5, 1.0, 15.0),
+}
+UNFILLED_COST = 100000.0
+DEFAULT_TRAVEL = 30
+
+def minutes(text):
+    hours, mins = text.split(":")[:2]
+    return int(hours) * 60 + int(mins)
+
+class Travel:
+    """Minutes between venues: 0 at the same venue, the matrix when it knows the pair, else default."""
+
+    def __init__(self, matrix=None, default=DEFAULT_TRAVEL):
+        self.matrix = matrix or {}
+        self.default = default
+
+    @classmethod
+    def load(cls, path, default=DEFAULT_TRAVEL):
+        with open(path, encoding="utf-8") as f:
+            return cls(json.load(f), default)
+
+    def __call__(self, a, b):
+        if a == b:
+            return 0
+        row = self.matrix.get(a)
+        if row and b in row:
+            return row[b]
+        row = self.matrix.get(b)
+        if row and a in row:
+            return row[a]
+        return self.default
+
+class Slot:
+    __slots__ = ("index", "match", "date", "start", "end", "venue", "grade", "candidates")
+
+    def __init__(self, index, match):
+        self.index = index
+        self.match = match
+        self.date = match["date"]
+        self.start = minutes(match["start_time"])
+        self.end = minutes(match["end_time"])
+        self.venue = match["location"]
+        self.grade = required_grade(match["role"], match["division"])
+        self.candidates = []
+
+    @property
+    def key(self):
+        return self.date, self.match["start_time"], self.match["match_name"], self.match["role"]
+
+class Referee:
+    __slots__ = ("id", "name", "grade", "max_day", "max_week", "windows", "days", "weeks", "load")
+
+    def __init__(self, referee_id, name, grade, max_day, max_week):
+        self.id = referee_id
+        self.name = name
+        self.grade = grade or 1
+        self.max_day = max_day
+        self.max_week = max_week
+        self.windows = {}  # date -> [(start, end)]
+        self.days = {}     # date -> sorted [(start, end, venue, slot index or -1 for a db game)]
+        self.weeks = {}    # monday -> games that week
+        self.load = 0      # games on the fixture dates
+
+# ---------- Slots ----------
+def slots_from_records(records, overrides=None, ars=2):
+    """(slots, invalid) from (line, fixture record) pairs.
+
+    A fixture with a role column is that one slot; otherwise it needs a Referee and `ars` ARs.
+    invalid is [(line, reason)].
+    """
+    slots, invalid = [], []
+    mapping = None
+    for line, record in records:
+        if mapping is None:
+            mapping = column_map(record.keys(), overrides)
+        try:
+            match = to_match(record, mapping)
+            minutes(match["start_time"]), minutes(match["end_time"])
+        except (RecordError, ValueError) as e:
+            invalid.append((line, str(e)))
+            continue
+        has_role = "role" in mapping and str(record.get(mapping["role"]) or "").strip()
+        roles = [match["role"]] if has_role else ["Referee"] + ["AR"] * ars
+        for role in roles:
+            slot_match = dict(match, role=role, referee="", referee_id=None)
+            if not has_role:
+                slot_match["amount"] = infer_match_amount(match["league"], role, match["division"])
+            slots.append(Slot(len(slots), slot_match))
+    return slots, invalid
+
+def open_slots(conn, slots):
+    """The slots not already filled in the db by an assigned match with the same date, start, subject and role.
+
+    Re-runs after adding referees or windows therefore only work on what is still open.
+    """
+    filled = {}
+    for date in {s.date for s in slots}:
+        for key in conn.execute("""SELECT date, start_time, subject, role FROM matches
+                                   WHERE date=? AND referee_id IS NOT NULL""", (date,)):
+            filled[key] = filled.get(key, 0) + 1
+    remaining = []
+    for slot in slots:
+        if filled.get(slot.key):
+            filled[slot.key] -= 1
+        else:
+            slot.index = len(remaining)
+            remaining.append(slot)
+    return remaining
+
+# ---------- Referees ----------
+def load_referees(conn, dates):
+    """Active referees with their windows, games and week counts around the given dates."""
+    referees = {row[0]: Referee(*row) for row in conn.execute(
+        "SELECT id, name, grade, max_per_day, max_per_week FROM referees WHERE active")}
+    dates = sorted(dates)
+    for referee_id, date, start, end in conn.execute(
+            f"SELECT referee_id, date, start_time, end_time FROM availability WHERE date IN ({','.join('?' * len(dates))})",
+            dates):
+        if referee_id in referees:
+            referees[referee_id].windows.setdefault(date, []).append((minutes(start), minutes(end)))
+    for date in dates:
+        for referee_id, start, end, venue in conn.execute(
+                """SELECT referee_id, start_time, end_time, COALESCE(location, '') FROM matches
+                   WHERE date=? AND referee_id IS NOT NULL""", (date,)):
+            referee = referees.get(referee_id)
+            try:
+                game = (minutes(start), minutes(end), venue, -1)
+            except (AttributeError, ValueError):
+                continue
+            if referee:
+                bisect.insort(referee.days.setdefault(date, []), game)
+                referee.load += 1
+    mondays = {week_bounds(date) for date in dates}
+    for monday, sunday in mondays:
+        for referee_id, games in conn.execute("""SELECT referee_id, COUNT(*) FROM matches
+                                                 WHERE referee_id IS NOT NULL AND date BETWEEN ? AND ?
+                                                 GROUP BY referee_id""", (monday, sunday)):
+            if referee_id in referees:
+                referees[referee_id].weeks[monday] = games
+    return referees
+
+# ---------- Solver ----------
+class Assignment:
+    def __init__(self, slots, referees, travel, objective):
+        self.slots = slots
+        self.referees = referees
+        self.travel = travel
+        self.w_load, self.w_travel, self.w_grade = OBJECTIVES[objective]
+        self.referee_of = [None] * len(slots)  # slot index -> Referee
+        self.mondays = {slot.date: week_bounds(slot.date)[0] for slot in slots}
+        for slot in slots:
+            slot.candidates = [r for r in referees.values()
+                               if r.grade >= slot.grade
+                               and any(s <= slot.start and slot.end <= e for s, e in r.windows.get(slot.date, ()))]
+
+    # --- constraint checks ---
+    def fits(self, referee, slot):
+        day = referee.days.get(slot.date, ())
+        if referee.max_day is not None and len(day) >= referee.max_day:
+            return False
+        if referee.max_week is not None and referee.weeks.get(self.mondays[slot.date], 0) >= referee.max_week:
+            return False
+        return not self.blockers(referee, slot, day, first_only=True)
+
+    def blockers(self, referee, slot, day=None, first_only=False):
+        # games that leave no time to get to or from this one
+        found = []
+        for start, end, venue, index in referee.days.get(slot.date, ()) if day is None else day:
+            gap = self.travel(venue, slot.venue)
+            if start < slot.end + gap and slot.start < end + gap:
+                found.append(index)
+                if first_only:
+                    break
+        return found
+
+    # --- costs ---
+    def neighbours(self, day, slot):
+        i = bisect.bisect_left(day, (slot.start,))
+        return (day[i - 1] if i else None), (day[i] if i < len(day) else None)
+
+    def travel_delta(self, day, slot):
+        prev, nxt = self.neighbours(day, slot)
+        added = 0
+        if prev:
+            added += self.travel(prev[2], slot.venue)
+        if nxt:
+            added += self.travel(slot.venue, nxt[2])
+        if prev and nxt:
+            added -= self.travel(prev[2], nxt[2])
+        return added
+
+    def add_cost(self, referee, slot):
+        """Objective change from giving slot to referee (referee must not have it)."""
+        return (self.w_load * (2 * referee.load + 1)
+                + self.w_travel * self.travel_delta(referee.days.get(slot.date, ()), slot)
+                + self.w_grade * (referee.grade - slot.grade))
+
+    def remove_gain(self, referee, slot):
+        """Objective change saved by taking slot away from referee (referee must have it)."""
+        self.unassign(slot)
+        gain = self.add_cost(referee, slot)
+        self.assign(referee, slot)
+        return gain
+
+    def assign(self, referee, slot):
+        bisect.insort(referee.days.setdefault(slot.date, []), (slot.start, slot.end, slot.venue, slot.index))
+        monday = self.mondays[slot.date]
+        referee.weeks[monday] = referee.weeks.get(monday, 0) + 1
+        referee.load += 1
+        self.referee_of[slot.index] = referee
+
+    def unassign(self, slot):
+        referee = self.referee_of[slot.index]
+        referee.days[slot.date].remove((slot.start, slot.end, slot.venue, slot.index))
+        referee.weeks[self.mondays[slot.date]] -= 1
+        referee.load -= 1
+        self.referee_of[slot.index] = None
+        return referee
+
+    def cheapest(self, slot, exclude=None):
+        best, best_cost = None, None
+        for referee in slot.candidates:
+            if referee is not exclude and self.fits(referee, slot):
+                cost = self.add_cost(referee, slot)
+                if best is None or cost < best_cost:
+                    best, best_cost = referee, cost
+        return best, best_cost
+
+    def objective(self):
+        total = UNFILLED_COST * self.referee_of.count(None)
+        for referee in self.referees.values():
+            total += self.w_load * referee.load ** 2
+            for day in referee.days.values():
+                total += self.w_travel * sum(self.travel(a[2], b[2]) for a, b in zip(day, day[1:]))
+        total += self.w_grade * sum(r.grade - s.grade for s, r in zip(self.slots, self.referee_of) if r)
+        return total
+
+    # --- phases ---
+    def greedy(self):
+        # most constrained first; ties go to the higher grade requirement, then by kickoff
+        order = sorted(self.slots, key=lambda s: (len(s.candidates), -s.grade, s.date, s.start))
+        for slot in order:
+            referee, _ = self.cheapest(slot)
+            if referee:
+                self.assign(referee, slot)
+
+    def repair(self):
+        """Fill open slots by handing one blocking game to another referee; returns how many were filled."""
+        filled = 0
+        for slot in self.slots:
+            if self.referee_of[slot.index]:
+                continue
+            referee, _ = self.cheapest(slot)
+            if referee:
+                self.assign(referee, slot)
+                filled += 1
+                continue
+            for referee in slot.candidates:
+                blocking = self.blockers(referee, slot)
+                if len(blocking) != 1 or blocking[0] < 0:
+                    continue
+                other = self.slots[blocking[0]]
+                self.unassign(other)
+                if self.fits(referee, slot):
+                    replacement, _ = self.cheapest(other, exclude=referee)
+                    if replacement:
+                        self.assign(replacement, other)
+                        self.assign(referee, slot)
+                        filled += 1
+                        break
+                self.assign(referee, other)
+        return filled
+
+    def improve(self, deadline):
+        """Moves and swaps while they lower the objective; returns how many were applied."""
+        kickoffs = {}
+        for slot in self.slots:
+            kickoffs.setdefault((slot.date, slot.start), []).append(slot)
+        applied = 0
+        improved = True
+        while improved and time.perf_counter() < deadline:
+            improved = False
+            for slot in self.slots:
+                current = self.referee_of[slot.index]
+                if current is None:
+                    continue
+                gain = self.remove_gain(current, slot)
+                self.unassign(slot)
+                referee, cost = self.cheapest(slot, exclude=current)
+                if referee and cost < gain - 1e-9:
+                    self.assign(referee, slot)
+                    applied += 1
+                    improved = True
+                else:
+                    self.assign(current, slot)
+            for group in kickoffs.values():
+                for i, a in enumerate(group):
+                    for b in group[i + 1:]:
+                        if self.try_swap(a, b):
+                            applied += 1
+                            improved = True
+                if time.perf_counter() >= deadline:
+                    break
+        return applied
+
+    def try_swap(self, a, b):
+        ra, rb = self.referee_of[a.index], self.referee_of[b.index]
+        # a swap still has to respect each slot's grade and availability window
+        if ra is None or rb is None or ra is rb or rb not in a.candidates or ra not in b.candidates:
+            return False
+        before = self.remove_gain(ra, a) + self.remove_gain(rb, b)
+        self.unassign(a)
+        self.unassign(b)
+        if self.fits(rb, a):
+            cost_a = self.add_cost(rb, a)
+            self.assign(rb, a)
+            if self.fits(ra, b) and cost_a + self.add_cost(ra, b) < before - 1e-9:
+                self.assign(ra, b)
+                return True
+            self.unassign(a)
+        self.assign(ra, a)
+        self.assign(rb, b)
+        return False
+
+def solve(conn, slots, objective="fairness", travel=None, seconds=10.0):
+    """Assigns slots to referees; returns (Assignment, {phase: seconds, ...})."""
+    started = time.perf_counter()
+    assignment = Assignment(slots, load_referees(conn, {s.date for s in slots}), travel or Travel(), objective)
+    timings = {"setup": time.perf_counter() - started}
+    phase = time.perf_counter()
+    assignment.greedy()
+    timings["greedy"] = time.perf_counter() - phase
+    timings["greedy_objective"] = assignment.objective()
+    phase = time.perf_counter()
+    timings["repaired"] = assignment.repair()
+    timings["moves"] = assignment.improve(started + seconds)
+    timings["repaired"] += assignment.repair()
+    timings["improve"] = time.perf_counter() - phase
+    timings["total"] = time.perf_counter() - started
+    return assignment, timings
+
+def save_assignment(conn, assignment):
+    """Inserts the filled slots as matches for their referees; the caller commits. Returns the dates."""
+    matches = [dict(slot.match, referee_id=referee.id)
+               for slot, referee in zip(assignment.slots, assignment.referee_of) if referee]
+    storage.insert_matches(conn, matches)
+    return {match["date"] for match in matches}
+
+def set_availability(conn, referee_id, dates, start_time=None, end_time=None):
+    """Replaces the referee's windows on each date with start_time-end_time, or clears them when no times."""
+    for date in dates:
+        conn.execute("DELETE FROM availability WHERE referee_id=? AND date=?", (referee_id, date))
+        if start_time and end_time:
+            conn.execute("INSERT INTO availability (referee_id, date, start_time, end_time) VALUES (?, ?, ?, ?)",
+                         (referee_id, date, start_time, end_time))
+
+def date_range(first, last):
+    day, end = datetime.strptime(first, "%Y-%m-%d"), datetime.strptime(last, "%Y-%m-%d")
+    while day <= end:
+        yield day.strftime("%Y-%m-%d")
+        day += timedelta(days=1)
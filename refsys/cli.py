@@ -0,0 +1,711 @@
+"""`python -m refsys`: batch import, statistics, conflict audit, re-pricing, export, assignment and sync.
+
+Output is written row by row as it is produced, so these work on databases far larger
+than the GUI shows. Only the subcommand that runs imports what it needs (numpy for
+stats, dateparser for import); Qt and matplotlib are never imported.
+"""
+import argparse
+import csv
+import json
+import os
+import sys
+
+from refsys import storage
+from refsys.pricing import add_reprice_arguments
+
+EXPORT_COLUMNS = ("id", "date", "start_time", "end_time", "league", "division", "role", "subject", "location", "amount",
+                  "content", "referee")
+EXPORT_SELECT = ", ".join("COALESCE(r.name, '')" if c == "referee" else f"m.{c}" for c in EXPORT_COLUMNS)
+
+# ---------- Output ----------
+def plain(value):
+    # numpy scalars -> python numbers for csv/json
+    if hasattr(value, "item"):
+        value = value.item()
+    if isinstance(value, float):
+        value = round(value, 2)
+    return value
+
+def write_rows(headers, rows, fmt, out):
+    """Streams rows as table, csv, json (one array) or jsonl; returns how many were written."""
+    count = 0
+    if fmt == "csv":
+        writer = csv.writer(out, lineterminator="\n")
+        writer.writerow(headers)
+        for row in rows:
+            writer.writerow([plain(v) for v in row])
+            count += 1
+    elif fmt in ("json", "jsonl"):
+        if fmt == "json":
+            out.write("[")
+        for row in rows:
+            record = json.dumps(dict(zip(headers, (plain(v) for v in row))), ensure_ascii=False)
+            if fmt == "json":
+                out.write(("," if count else "") + "\n  " + record)
+            else:
+                out.write(record + "\n")
+            count += 1
+        if fmt == "json":
+            out.write("\n]\n" if count else "]\n")
+    else:
+        widths = [max(len(h), 10) for h in headers]
+        out.write("  ".join(h.ljust(w) for h, w in zip(headers, widths)).rstrip() + "\n")
+        for row in rows:
+            cells = []
+            for value, width in zip(row, widths):
+                value = plain(value)
+                text = f"{value:.2f}" if isinstance(value, float) else str(value)
+                cells.append(text.rjust(width) if isinstance(value, (int, float)) else text.ljust(width))
+            out.write("  ".join(cells).rstrip() + "\n")
+            count += 1
+    return count
+
+def open_output(path):
+    return open(path, "w", encoding="utf-8", newline="") if path and path != "-" else sys.stdout
+
+def referee_arg(name):
+    """--referee NAME -> referee id; exits when nobody has that name."""
+    if not name:
+        return None
+    conn = storage.connect()
+    try:
+        referee_id = storage.find_referee(conn, name, create=False)
+    finally:
+        conn.close()
+    if referee_id is None:
+        raise SystemExit(f"no referee called {name!r} (see `python -m refsys referees`)")
+    return referee_id
+
+# ---------- import ----------
+def read_sources(paths):
+    for path in paths or ["-"]:
+        if path == "-":
+            yield "<stdin>", sys.stdin.read()
+        else:
+            with open(path, encoding="utf-8") as f:
+                yield path, f.read()
+
+def parse_mapping(pairs):
+    mapping = {}
+    for pair in pairs or ():
+        field, sep, header = pair.partition("=")
+        if not sep:
+            raise SystemExit(f"--map expects FIELD=HEADER, got {pair!r}")
+        mapping[field.strip()] = header.strip()
+    return mapping
+
+def import_record_files(args, fmt):
+    from refsys.records import READERS, RecordError, import_records
+
+    overrides = parse_mapping(args.map)
+    rejects = open_output(args.rejects) if args.rejects else None
+    reject_writer = csv.writer(rejects, lineterminator="\n") if rejects else None
+    if reject_writer:
+        reject_writer.writerow(("source", "line", "problem", "detail"))
+    conn = storage.connect()
+    added = problems = 0
+    dates = set()
+    try:
+        for path in args.files or ["-"]:
+            source = "<stdin>" if path == "-" else path
+
+            def on_problem(kind, line, *details):
+                if kind == "invalid":
+                    detail = details[0]
+                else:
+                    match = details[0]
+                    detail = f"{match['date']} {match['start_time']}-{match['end_time']}  {match['match_name']}"
+                    if match.get("referee"):
+                        detail += f"  [{match['referee']}]"
+                    if kind == "conflict":
+                        detail += f"  {details[1]}"
+                print(f"{source}:{line}: {kind}  {detail}", file=sys.stderr)
+                if reject_writer:
+                    reject_writer.writerow((source, line, kind, detail))
+
+            f = sys.stdin if path == "-" else open(path, encoding="utf-8-sig", newline="")
+            try:
+                result = import_records(conn, READERS[fmt](f), overrides=overrides,
+                                        allow_conflicts=args.allow_conflicts, dry_run=args.dry_run,
+                                        batch_size=args.batch_size, on_problem=on_problem,
+                                        check_limits=not args.ignore_limits)
+            except RecordError as e:
+                # the whole file is one transaction, so nothing from it was kept
+                print(f"{source}: {e}; file not imported", file=sys.stderr)
+                problems += 1
+                continue
+            finally:
+                if f is not sys.stdin:
+                    f.close()
+            added += result.added
+            problems += len(result.invalid) + len(result.duplicates) + len(result.conflicts)
+            dates |= result.dates
+            print(f"{source}: {result.added} {'valid' if args.dry_run else 'added'}, "
+                  f"{len(result.duplicates)} duplicate(s), {len(result.conflicts)} conflict(s), "
+                  f"{len(result.invalid)} invalid", file=sys.stderr)
+    finally:
+        conn.close()
+        if rejects and rejects is not sys.stdout:
+            rejects.close()
+    if dates and not args.dry_run:
+        storage.notify_matches_changed(*dates)
+    return 1 if problems else 0
+
+def cmd_import(args):
+    from refsys.records import guess_format
+    fmt = args.format
+    if fmt == "auto":
+        fmt = guess_format(args.files[0]) if args.files else "text"
+    if fmt != "text":
+        return import_record_files(args, fmt)
+
+    from refsys.conflicts import match_problem
+    from refsys.parsing import parse_text_to_match_data
+
+    # each match is inserted as soon as it passes, so later checks on the same connection see it;
+    # commits every --batch-size matches, and a dry run rolls everything back at the end
+    conn = storage.connect()
+    dates = set()
+    added = skipped = unrecognized = uncommitted = 0
+    try:
+        for source, text in read_sources(args.files):
+            matches = parse_text_to_match_data(text)
+            if not matches:
+                print(f"{source}: no matches recognized", file=sys.stderr)
+                unrecognized += 1
+                continue
+            for match in matches:
+                date, start, end = match["date"], match["start_time"], match["end_time"]
+                who = f"  [{match['referee']}]" if match.get("referee") else ""
+                problem = match_problem(match, conn, not args.ignore_limits, not args.allow_conflicts)
+                if problem:
+                    print(f"skipped  {date} {start}-{end}  {match['match_name']}{who}: {problem}  ({source})",
+                          file=sys.stderr)
+                    skipped += 1
+                    continue
+                storage.insert_matches(conn, [match])
+                print(f"{'parsed' if args.dry_run else 'added'}  {date} {start}-{end}  {match['match_name']}{who}")
+                added += 1
+                dates.add(date)
+                uncommitted += 1
+                if uncommitted >= args.batch_size and not args.dry_run:
+                    conn.commit()
+                    uncommitted = 0
+        if args.dry_run:
+            conn.rollback()
+        else:
+            conn.commit()
+    finally:
+        conn.close()
+    if dates and not args.dry_run:
+        storage.notify_matches_changed(*dates)
+    print(f"{added} match(es) {'parsed' if args.dry_run else 'added'}, {skipped} skipped for conflicts or limits, "
+          f"{unrecognized} source(s) not recognized", file=sys.stderr)
+    return 1 if unrecognized or skipped else 0
+
+# ---------- stats ----------
+def stats_rows(by, year, referee_id=None):
+    from refsys.stats import STATS_ENGINE
+    if by in ("week", "season", "year"):
+        periods = STATS_ENGINE.periods(referee_id)
+        if by == "week":
+            headers = ("week", "games", "total", "last_4_weeks", "last_12_weeks")
+            weeks = periods.weeks_in(year, last=len(periods.week_starts))
+            rows = ((str(periods.week_starts[i]), periods.week_counts[i], periods.week_totals[i],
+                     periods.rolling_totals[4][i], periods.rolling_totals[12][i])
+                    for i in weeks if periods.week_counts[i])
+        elif by == "season":
+            headers = ("season", "games", "total", "change")
+            changes = periods.changes(list(periods.season_totals))
+            rows = ((f"{y}-{(y + 1) % 100:02d}", c, t, d)
+                    for y, t, c, d in zip(periods.seasons, periods.season_totals, periods.season_counts, changes)
+                    if not year or int(year) in (y, y + 1))
+        else:
+            headers = ("year", "games", "total", "change")
+            changes = periods.changes(list(periods.year_totals))
+            rows = ((y, c, t, d) for y, t, c, d in zip(periods.years, periods.year_totals, periods.year_counts, changes)
+                    if not year or int(year) == y)
+        return headers, rows
+
+    frame = STATS_ENGINE.frame(year, referee_id)
+    names, totals, counts = {
+        "month": (frame.months, frame.month_totals, frame.month_counts),
+        "league": (frame.league_names, frame.league_totals, frame.league_counts),
+        "role": (frame.role_names, frame.role_totals, frame.role_counts),
+        "division": (frame.division_names, frame.division_totals, frame.division_counts),
+        "referee": (frame.referee_names, frame.referee_totals, frame.referee_counts),
+    }[by]
+    return (by, "games", "total"), zip(names, counts, totals)
+
+def cmd_stats(args):
+    headers, rows = stats_rows(args.by, args.year, referee_arg(args.referee))
+    out = open_output(args.output)
+    try:
+        write_rows(headers, rows, args.format, out)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    return 0
+
+# ---------- conflicts ----------
+def overlapping_pairs(day):
+    """(referee_id, referee, pair...) for the overlapping pairs among one day's
+    (id, start, end, subject, referee_id, referee) rows, by a start-time sweep.
+
+    Two referees' own games never clash; an unassigned game clashes with anyone's.
+    """
+    from refsys.conflicts import times_overlap
+    # zero-pad "9:00" so times compare as text
+    rows = sorted((start.zfill(5), end.zfill(5), match_id, subject, referee_id, name)
+                  for match_id, start, end, subject, referee_id, name in day if start and end)
+    active = []  # earlier matches that haven't ended yet
+    for start, end, match_id, subject, referee_id, name in rows:
+        active = [a for a in active if a[1] > start]
+        for other_start, other_end, other_id, other_subject, other_referee, other_name in active:
+            if None not in (referee_id, other_referee) and referee_id != other_referee:
+                continue
+            if times_overlap(start, end, other_start, other_end):
+                yield (other_referee if referee_id is None else referee_id, name or other_name,
+                       other_id, f"{other_start}-{other_end}", other_subject, match_id, f"{start}-{end}", subject)
+        active.append((start, end, match_id, subject, referee_id, name))
+
+def iter_conflicts(conn, date_from=None, date_to=None, referee_id=None, chunk_size=1000):
+    """Yields (date, referee, pair...) for every overlapping pair one referee is booked into.
+
+    Walks the date index, so only one day is held in memory. With referee_id, only the pairs
+    with at least one of that referee's matches.
+    """
+    query = """SELECT m.date, m.id, m.start_time, m.end_time, m.subject, m.referee_id, COALESCE(r.name, '')
+               FROM matches m LEFT JOIN referees r ON r.id=m.referee_id WHERE 1=1"""
+    params = []
+    if referee_id is not None:
+        query += " AND (m.referee_id=? OR m.referee_id IS NULL)"
+        params.append(referee_id)
+    if date_from:
+        query += " AND m.date>=?"
+        params.append(date_from)
+    if date_to:
+        query += " AND m.date<=?"
+        params.append(date_to)
+    cur = conn.execute(query + " ORDER BY m.date", params)
+    day, rows = None, []
+    while True:
+        chunk = cur.fetchmany(chunk_size)
+        for date, *row in chunk:
+            if date != day:
+                for referee, *pair in overlapping_pairs(rows):
+                    if referee_id is None or referee == referee_id:
+                        yield (day, *pair)
+                day, rows = date, []
+            rows.append(row)
+        if not chunk:
+            break
+    for referee, *pair in overlapping_pairs(rows):
+        if referee_id is None or referee == referee_id:
+            yield (day, *pair)
+
+def cmd_conflicts(args):
+    conn = storage.connect()
+    out = open_output(args.output)
+    try:
+        found = write_rows(("date", "referee", "id", "time", "subject", "other_id", "other_time", "other_subject"),
+                           iter_conflicts(conn, args.date_from, args.date_to, referee_arg(args.referee)),
+                           args.format, out)
+    finally:
+        conn.close()
+        if out is not sys.stdout:
+            out.close()
+    print(f"{found} conflicting pair(s)", file=sys.stderr)
+    return 1 if found else 0
+
+# ---------- reprice ----------
+def cmd_reprice(args):
+    from refsys.pricing import reprice_command
+    return reprice_command(args)
+
+# ---------- export ----------
+def iter_matches(conn, date_from=None, date_to=None, league=None, referee_id=None, chunk_size=1000):
+    query = f"SELECT {EXPORT_SELECT} FROM matches m LEFT JOIN referees r ON r.id=m.referee_id WHERE 1=1"
+    params = []
+    if date_from:
+        query += " AND m.date>=?"
+        params.append(date_from)
+    if date_to:
+        query += " AND m.date<=?"
+        params.append(date_to)
+    if league:
+        query += " AND m.league=?"
+        params.append(league)
+    if referee_id is not None:
+        query += " AND m.referee_id=?"
+        params.append(referee_id)
+    cur = conn.execute(query + " ORDER BY m.date, m.start_time, m.id", params)
+    while True:
+        rows = cur.fetchmany(chunk_size)
+        if not rows:
+            break
+        yield from rows
+
+def cmd_export(args):
+    conn = storage.connect()
+    out = open_output(args.output)
+    try:
+        count = write_rows(EXPORT_COLUMNS, iter_matches(conn, args.date_from, args.date_to, args.league,
+                                                        referee_arg(args.referee)),
+                           args.format, out)
+    finally:
+        conn.close()
+        if out is not sys.stdout:
+            out.close()
+    print(f"{count} match(es) exported", file=sys.stderr)
+    return 0
+
+# ---------- ics ----------
+def cmd_ics(args):
+    from refsys.ics import IcsFeed
+    cache = None if args.no_cache else (args.cache or (args.output + ".cache.json" if args.output else None))
+    feed = IcsFeed.load(cache, args.name) if cache and not args.rebuild else IcsFeed(args.name)
+    conn = storage.connect()
+    try:
+        rendered = feed.refresh(conn)
+    finally:
+        conn.close()
+    out = open_output(args.output)
+    try:
+        for piece in feed.iter_feed(args.date_from, args.date_to):
+            out.write(piece)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    if cache:
+        feed.save(cache)
+    print(f"{len(feed.events)} event(s), {rendered} re-rendered", file=sys.stderr)
+    return 0
+
+# ---------- referees ----------
+def cmd_referees(args):
+    conn = storage.connect()
+    try:
+        if args.action in (None, "list"):
+            rows = conn.execute("""SELECT r.name, COALESCE(r.email, ''), COALESCE(r.grade, 1), r.max_per_day,
+                                          r.max_per_week, COUNT(m.id), COALESCE(SUM(m.amount), 0)
+                                   FROM referees r LEFT JOIN matches m ON m.referee_id=r.id
+                                   WHERE r.active GROUP BY r.id ORDER BY r.name""")
+            write_rows(("referee", "email", "grade", "max_per_day", "max_per_week", "games", "total"),
+                       ((n, e, g, d if d is not None else "", w if w is not None else "", c, t)
+                        for n, e, g, d, w, c, t in rows), args.format, sys.stdout)
+            unassigned = conn.execute("SELECT COUNT(*) FROM matches WHERE referee_id IS NULL").fetchone()[0]
+            print(f"{unassigned} match(es) without a referee", file=sys.stderr)
+            return 0
+
+        with conn:
+            referee_id = storage.find_referee(conn, args.name, create=args.action in ("add", "claim"))
+            if referee_id is None:
+                raise SystemExit(f"no referee called {args.name!r}")
+            if args.action in ("add", "set"):
+                for column, value in (("email", args.email), ("grade", args.grade), ("max_per_day", args.max_day),
+                                      ("max_per_week", args.max_week)):
+                    if value is not None:
+                        # 0 clears a limit
+                        conn.execute(f"UPDATE referees SET {column}=? WHERE id=?",
+                                     (value if value != 0 else None, referee_id))
+                print(f"{args.name}: saved", file=sys.stderr)
+                return 0
+            if args.action == "available":
+                from refsys.assign import date_range, set_availability
+                dates = []
+                for text in args.dates:
+                    first, _, last = text.partition("..")
+                    dates.extend(date_range(first, last or first))
+                if args.clear:
+                    set_availability(conn, referee_id, dates)
+                else:
+                    set_availability(conn, referee_id, dates, args.start, args.end)
+                print(f"{args.name}: {'cleared' if args.clear else f'{args.start}-{args.end} on'} "
+                      f"{len(dates)} date(s)", file=sys.stderr)
+                return 0
+            # claim: hand unassigned matches (e.g. a single-user history) to this referee
+            query = "SELECT DISTINCT date FROM matches WHERE referee_id IS NULL"
+            params = []
+            if args.date_from:
+                query += " AND date>=?"
+                params.append(args.date_from)
+            if args.date_to:
+                query += " AND date<=?"
+                params.append(args.date_to)
+            dates = [row[0] for row in conn.execute(query, params)]
+            claimed = conn.execute(query.replace("SELECT DISTINCT date FROM matches WHERE",
+                                                 "UPDATE matches SET referee_id=? WHERE"),
+                                   [referee_id] + params).rowcount
+    finally:
+        conn.close()
+    if dates:
+        storage.notify_matches_changed(*dates)
+    print(f"{claimed} match(es) assigned to {args.name}", file=sys.stderr)
+    return 0
+
+# ---------- assign ----------
+def cmd_assign(args):
+    from refsys.assign import Travel, open_slots, save_assignment, slots_from_records, solve
+    from refsys.records import READERS, RecordError, guess_format
+
+    slots, invalid = [], []
+    for path in args.files:
+        fmt = guess_format(path)
+        if fmt not in READERS:
+            raise SystemExit(f"{path}: fixtures must be .csv, .jsonl or .json")
+        with open(path, encoding="utf-8", newline="") as f:
+            try:
+                found, bad = slots_from_records(READERS[fmt](f), parse_mapping(args.map), args.ars)
+            except RecordError as e:
+                raise SystemExit(f"{path}: {e}")
+        for slot in found:
+            slot.index = len(slots)
+            slots.append(slot)
+        invalid.extend((path, line, reason) for line, reason in bad)
+    for path, line, reason in invalid:
+        print(f"{path}:{line}: {reason}", file=sys.stderr)
+
+    travel = Travel.load(args.travel_matrix, args.travel) if args.travel_matrix else Travel(default=args.travel)
+    conn = storage.connect()
+    try:
+        total = len(slots)
+        slots = open_slots(conn, slots)
+        assignment, timings = solve(conn, slots, args.objective, travel, args.seconds)
+        dates = set()
+        if not args.dry_run:
+            with conn:
+                dates = save_assignment(conn, assignment)
+    finally:
+        conn.close()
+    if dates:
+        storage.notify_matches_changed(*dates)
+
+    rows = ((s.date, s.match["start_time"], s.match["end_time"], s.match["match_name"], s.match["division"],
+             s.match["role"], s.venue, r.name if r else "", len(s.candidates))
+            for s, r in sorted(zip(slots, assignment.referee_of), key=lambda p: (p[0].date, p[0].start, p[0].index)))
+    out = open_output(args.output)
+    try:
+        write_rows(("date", "start_time", "end_time", "subject", "division", "role", "location", "referee",
+                    "eligible"), rows, args.format, out)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    unfilled = assignment.referee_of.count(None)
+    loads = [r.load for r in assignment.referees.values() if r.load]
+    print(f"{len(slots) - unfilled}/{len(slots)} open slot(s) filled ({total - len(slots)} already filled, "
+          f"{len(invalid)} invalid fixture row(s)) in {timings['total']:.2f}s with {timings['moves']} improving "
+          f"move(s); games per referee {min(loads, default=0)}-{max(loads, default=0)}"
+          f"{'; dry run, nothing saved' if args.dry_run else ''}", file=sys.stderr)
+    return 1 if unfilled or invalid else 0
+
+# ---------- sync ----------
+def review_policies(args):
+    from refsys.storage import SYNC_FIELDS
+    fields = SYNC_FIELDS if args.review_all else args.review or ()
+    for field in fields:
+        if field not in SYNC_FIELDS:
+            raise SystemExit(f"unknown field {field!r}; one of {', '.join(SYNC_FIELDS)}")
+    return {field: "review" for field in fields}
+
+def cmd_sync(args):
+    from refsys.sync import SyncError, device_id, new_device, peer_for, resolve_review, review_items, sync, \
+        version_vector
+
+    conn = storage.connect()
+    try:
+        if args.new_device:
+            print(f"this database is now device {new_device(conn)}", file=sys.stderr)
+            return 0
+        if args.restore is not None or args.dismiss is not None:
+            try:
+                resolve_review(conn, args.restore if args.restore is not None else args.dismiss,
+                               restore=args.restore is not None)
+            except SyncError as e:
+                raise SystemExit(str(e))
+            print("restored" if args.restore is not None else "dismissed", file=sys.stderr)
+            return 0
+        if args.review_queue:
+            write_rows(("id", "date", "subject", "field", "kept", "other", "other_device", "queued_at"),
+                       review_items(conn), args.format, sys.stdout)
+            return 0
+        if not args.target:
+            print(f"device {device_id(conn)}", file=sys.stderr)
+            write_rows(("device", "seq"), sorted(version_vector(conn).items()), args.format, sys.stdout)
+            for peer, synced_at in conn.execute("SELECT peer, synced_at FROM sync_peers ORDER BY peer"):
+                print(f"last synced with {peer} at {synced_at}", file=sys.stderr)
+            return 0
+
+        name, peer = peer_for(args.target, args.token, review_policies(args))
+        try:
+            result = sync(conn, peer, name, review_policies(args), args.batch)
+        except SyncError as e:
+            raise SystemExit(str(e))
+        open_items = len(review_items(conn))
+    finally:
+        conn.close()
+    print(f"sent {result.sent} change(s), received {result.received} ({result.applied} applied, "
+          f"{result.conflicts} concurrent edit(s)) in {result.rounds} round(s)"
+          + (f"; {open_items} value(s) waiting in `refsys sync --review-queue`" if open_items else ""),
+          file=sys.stderr)
+    return 0
+
+# ---------- snapshot ----------
+def cmd_snapshot(args):
+    from refsys.snapshot import compact, write_snapshot
+    rows, deleted, manifest = write_snapshot(args.directory, rebuild=args.rebuild)
+    if args.compact and len(manifest["segments"]) > 1:
+        manifest = compact(args.directory, manifest)
+    live = sum(s["rows"] for s in manifest["segments"][:1])
+    print(f"{rows} row(s) and {deleted} deletion(s) written at data version {manifest['version']}; "
+          f"{len(manifest['segments'])} segment(s), base has {live} row(s)", file=sys.stderr)
+    return 0
+
+# ---------- serve ----------
+def cmd_serve(args):
+    from refsys.server import serve
+    serve(args.host, args.port, args.readers, args.token, review_policies(args))
+    return 0
+
+# ---------- main ----------
+def build_parser():
+    parser = argparse.ArgumentParser(prog="python -m refsys", description=__doc__.splitlines()[0])
+    parser.add_argument("--db", default=storage.DB_PATH, help="database file (default: %(default)s)")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    p = commands.add_parser("import", help="add matches from assignment e-mails/text or CSV/JSON Lines files")
+    p.add_argument("files", nargs="*", help="text files (one assignment paste each) or .csv/.jsonl/.json exports; "
+                                            "'-' or nothing reads stdin")
+    p.add_argument("--format", default="auto", choices=("auto", "text", "csv", "jsonl", "json"),
+                   help="auto picks by the first file's extension")
+    p.add_argument("--map", action="append", metavar="FIELD=HEADER",
+                   help="column for a field when the header isn't recognized, e.g. --map date='Game Date'")
+    p.add_argument("--rejects", help="write duplicates, conflicts and invalid rows to this CSV")
+    p.add_argument("--batch-size", type=int, default=500,
+                   help="matches per transaction for text, per executemany for CSV/JSON (one transaction per file)")
+    p.add_argument("--allow-conflicts", action="store_true", help="add overlapping matches instead of skipping them")
+    p.add_argument("--ignore-limits", action="store_true", help="don't enforce referees' daily/weekly game limits")
+    p.add_argument("--dry-run", action="store_true", help="parse and check only")
+    p.set_defaults(func=cmd_import)
+
+    p = commands.add_parser("stats", help="earnings and game counts by period, league, role or division")
+    p.add_argument("--by", default="month",
+                   choices=("week", "month", "season", "year", "league", "role", "division", "referee"))
+    p.add_argument("--referee", help="only this referee's matches")
+    p.add_argument("--year", help="only this year")
+    p.add_argument("--format", default="table", choices=("table", "csv", "json", "jsonl"))
+    p.add_argument("-o", "--output", help="write to this file instead of stdout")
+    p.set_defaults(func=cmd_stats)
+
+    p = commands.add_parser("conflicts", help="audit every referee's days for overlapping matches")
+    p.add_argument("--referee", help="only this referee")
+    p.add_argument("--from", dest="date_from", help="first date (YYYY-MM-DD)")
+    p.add_argument("--to", dest="date_to", help="last date (YYYY-MM-DD)")
+    p.add_argument("--format", default="table", choices=("table", "csv", "json", "jsonl"))
+    p.add_argument("-o", "--output", help="write to this file instead of stdout")
+    p.set_defaults(func=cmd_conflicts)
+
+    p = commands.add_parser("reprice", help="recompute amounts from a rate table")
+    add_reprice_arguments(p, rollback_flag="--rollback")
+    p.set_defaults(func=cmd_reprice)
+
+    p = commands.add_parser("export", help="stream matches as CSV or JSON lines")
+    p.add_argument("--referee", help="only this referee's matches")
+    p.add_argument("--from", dest="date_from", help="first date (YYYY-MM-DD)")
+    p.add_argument("--to", dest="date_to", help="last date (YYYY-MM-DD)")
+    p.add_argument("--league", help="only this league")
+    p.add_argument("--format", default="csv", choices=("csv", "jsonl", "json"))
+    p.add_argument("-o", "--output", help="write to this file instead of stdout")
+    p.set_defaults(func=cmd_export)
+
+    p = commands.add_parser("ics", help="iCalendar feed for phone/desktop calendars")
+    p.add_argument("--from", dest="date_from", help="first month to include (YYYY-MM-DD)")
+    p.add_argument("--to", dest="date_to", help="last month to include (YYYY-MM-DD)")
+    p.add_argument("--name", default="Referee assignments", help="calendar name shown by the app")
+    p.add_argument("-o", "--output", help="write to this file instead of stdout")
+    p.add_argument("--cache", help="rendered-event cache (default: OUTPUT.cache.json when -o is given)")
+    p.add_argument("--no-cache", action="store_true", help="don't read or write the cache")
+    p.add_argument("--rebuild", action="store_true", help="ignore the cache and render every event")
+    p.set_defaults(func=cmd_ics)
+
+    p = commands.add_parser("referees", help="list referees, set grades, limits and availability, claim unassigned matches")
+    actions = p.add_subparsers(dest="action")
+    p.add_argument("--format", default="table", choices=("table", "csv", "json", "jsonl"))
+    for action, text in (("add", "add a referee"), ("set", "change a referee's e-mail or limits")):
+        a = actions.add_parser(action, help=text)
+        a.add_argument("name")
+        a.add_argument("--email")
+        a.add_argument("--grade", type=int, help="1 (grassroots) and up; see pricing.TIER_GRADES")
+        a.add_argument("--max-day", type=int, help="most games per day (0 = no limit)")
+        a.add_argument("--max-week", type=int, help="most games per Monday-Sunday week (0 = no limit)")
+    a = actions.add_parser("claim", help="assign every match without a referee to NAME")
+    a.add_argument("name")
+    a.add_argument("--from", dest="date_from", help="first date (YYYY-MM-DD)")
+    a.add_argument("--to", dest="date_to", help="last date (YYYY-MM-DD)")
+    a = actions.add_parser("available", help="set NAME's availability window on some dates")
+    a.add_argument("name")
+    a.add_argument("dates", nargs="+", metavar="DATE", help="YYYY-MM-DD or FIRST..LAST")
+    a.add_argument("--start", default="08:00", help="window start (default: %(default)s)")
+    a.add_argument("--end", default="22:00", help="window end (default: %(default)s)")
+    a.add_argument("--clear", action="store_true", help="remove the windows on those dates instead")
+    actions.add_parser("list", help="referees with their limits, games and totals (the default)")
+    p.set_defaults(func=cmd_referees)
+
+    p = commands.add_parser("assign", help="fill Referee/AR slots for a fixture list from referees' availability")
+    p.add_argument("files", nargs="+", help="fixtures as .csv/.jsonl/.json (date, time, teams, venue, league, division)")
+    p.add_argument("--map", action="append", metavar="FIELD=HEADER", help="column for a field, as for import")
+    p.add_argument("--ars", type=int, default=2, help="AR slots per game when the fixtures have no role column")
+    p.add_argument("--objective", default="fairness", choices=("fairness", "cost"),
+                   help="spread games evenly, or least travel and grade surplus")
+    p.add_argument("--travel", type=int, default=30, help="minutes between two different venues (default: %(default)s)")
+    p.add_argument("--travel-matrix", help='JSON {"venue": {"other venue": minutes}} overriding --travel per pair')
+    p.add_argument("--seconds", type=float, default=10.0, help="time budget for the whole solve")
+    p.add_argument("--dry-run", action="store_true", help="print the assignment without saving it")
+    p.add_argument("--format", default="table", choices=("table", "csv", "json", "jsonl"))
+    p.add_argument("-o", "--output", help="write to this file instead of stdout")
+    p.set_defaults(func=cmd_assign)
+
+    p = commands.add_parser("sync", help="exchange changes with another device's `refsys serve` or database file")
+    p.add_argument("target", nargs="?", help="http://host:port of `refsys serve`, or another matches.db; "
+                                             "without one, show this device's id and version vector")
+    p.add_argument("--token", help="the server's --token")
+    p.add_argument("--review", action="append", metavar="FIELD",
+                   help="queue the losing value of concurrent edits to FIELD for review (repeatable)")
+    p.add_argument("--review-all", action="store_true", help="--review for every field")
+    p.add_argument("--review-queue", action="store_true", help="list values waiting for review")
+    p.add_argument("--restore", type=int, metavar="ID", help="put a queued value back (syncs like any edit)")
+    p.add_argument("--dismiss", type=int, metavar="ID", help="drop a queued value")
+    p.add_argument("--new-device", action="store_true",
+                   help="give this database its own device id (after copying matches.db to another machine)")
+    p.add_argument("--batch", type=int, default=500, help="changes per request")
+    p.add_argument("--format", default="table", choices=("table", "csv", "json", "jsonl"))
+    p.set_defaults(func=cmd_sync)
+
+    p = commands.add_parser("snapshot", help="columnar .npy snapshot for notebooks (refsys.snapshot.load_snapshot)")
+    p.add_argument("directory", help="snapshot directory; created or brought up to date")
+    p.add_argument("--rebuild", action="store_true", help="write a fresh base segment instead of a delta")
+    p.add_argument("--compact", action="store_true", help="fold delta segments into the base afterwards")
+    p.set_defaults(func=cmd_snapshot)
+
+    p = commands.add_parser("serve", help="local HTTP/JSON API over the match database")
+    p.add_argument("--host", default="127.0.0.1", help="address to listen on (default: %(default)s)")
+    p.add_argument("--port", type=int, default=8765)
+    p.add_argument("--readers", type=int, default=4, help="read connections / worker threads")
+    p.add_argument("--token", help="require 'Authorization: Bearer TOKEN' on /ingest and /sync")
+    p.add_argument("--review", action="append", metavar="FIELD",
+                   help="on /sync, queue the losing value of concurrent edits to FIELD for review")
+    p.add_argument("--review-all", action="store_true", help="--review for every field")
+    p.set_defaults(func=cmd_serve)
+    return parser
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    storage.DB_PATH = args.db
+    storage.init_db()
+    storage.update_db_structure()
+    try:
+        return args.func(args)
+    except BrokenPipeError:
+        # output piped into head & co.; stop quietly without a second error at exit
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+        return 0
@@ -0,0 +1,108 @@
+"""Match end times, same-day overlap checks and per-referee workload limits."""
+from datetime import datetime, timedelta
+
+from refsys.storage import connect, find_referee
+
+# two 45 minute halves and a 10 minute half-time, unless the assignment says otherwise
+MATCH_MINUTES = 90
+BREAK_MINUTES = 10
+# referee_id of a referee the database doesn't know yet: no row has it (ids start at 1)
+NEW_REFEREE = 0
+
+def calculate_end_time(start, match_duration=MATCH_MINUTES, break_time=BREAK_MINUTES):
+    """End time as "HH:MM" for a start given as "HH:MM" or a datetime."""
+    if isinstance(start, str):
+        start = datetime.strptime(start, '%H:%M')
+    return (start + timedelta(minutes=match_duration + break_time)).strftime('%H:%M')
+
+def times_overlap(start_a, end_a, start_b, end_b):
+    # "HH:MM" strings compare correctly as text
+    return start_a < end_b and end_a > start_b
+
+def find_time_conflicts(date, start_time, end_time, conn=None, referee_id=None):
+    """(id, subject, start_time, end_time) of every match on date overlapping start_time-end_time.
+
+    A referee's match is checked against their own and the unassigned ones (the single-user setup,
+    which may well be theirs); referee_id None means an unassigned match, checked against all of them.
+    """
+    own = conn is None
+    conn = conn or connect()
+    try:
+        if referee_id is None:
+            rows = conn.execute("SELECT id, subject, start_time, end_time FROM matches WHERE date=?",
+                                (date,)).fetchall()
+        else:
+            rows = conn.execute("""SELECT id, subject, start_time, end_time FROM matches
+                                   WHERE date=? AND (referee_id=? OR referee_id IS NULL)""",
+                                (date, referee_id)).fetchall()
+    finally:
+        if own:
+            conn.close()
+    new_start = datetime.strptime(start_time, '%H:%M').strftime('%H:%M')
+    new_end = datetime.strptime(end_time, '%H:%M').strftime('%H:%M')
+    conflicts = []
+    for match_id, subject, existing_start, existing_end in rows:
+        try:
+            existing_start = datetime.strptime(existing_start, '%H:%M').strftime('%H:%M')
+            existing_end = datetime.strptime(existing_end, '%H:%M').strftime('%H:%M')
+        except (TypeError, ValueError):
+            continue
+        if times_overlap(new_start, new_end, existing_start, existing_end):
+            conflicts.append((match_id, subject, existing_start, existing_end))
+    return conflicts
+
+def check_time_conflict(date, start_time, end_time, conn=None, referee_id=None):
+    return bool(find_time_conflicts(date, start_time, end_time, conn, referee_id))
+
+# ---------- Workload ----------
+def week_bounds(date):
+    # Monday..Sunday around date, as "YYYY-MM-DD"
+    day = datetime.strptime(date, '%Y-%m-%d')
+    monday = day - timedelta(days=day.weekday())
+    return monday.strftime('%Y-%m-%d'), (monday + timedelta(days=6)).strftime('%Y-%m-%d')
+
+def workload_limits(conn, referee_id):
+    """(max per day, max per week) for a referee; None where there is no limit."""
+    if referee_id is None:
+        return None, None
+    row = conn.execute("SELECT max_per_day, max_per_week FROM referees WHERE id=?", (referee_id,)).fetchone()
+    return row if row else (None, None)
+
+def workload_problem(conn, referee_id, date, adding=1, pending_day=0, pending_week=0):
+    """Why adding `adding` games on date would take the referee over a limit, or None.
+
+    pending_* are games already accepted but not yet visible to conn (e.g. an import batch).
+    """
+    max_day, max_week = workload_limits(conn, referee_id)
+    if max_day is not None:
+        games = conn.execute("SELECT COUNT(*) FROM matches WHERE referee_id=? AND date=?",
+                             (referee_id, date)).fetchone()[0] + pending_day
+        if games + adding > max_day:
+            return f"daily limit {max_day} reached ({games} on {date})"
+    if max_week is not None:
+        monday, sunday = week_bounds(date)
+        games = conn.execute("SELECT COUNT(*) FROM matches WHERE referee_id=? AND date BETWEEN ? AND ?",
+                             (referee_id, monday, sunday)).fetchone()[0] + pending_week
+        if games + adding > max_week:
+            return f"weekly limit {max_week} reached ({games} in the week of {monday})"
+    return None
+
+def match_problem(match, conn=None, check_limits=True, check_overlaps=True):
+    """Why a parsed match can't go to its referee (an overlap or a workload limit), or None."""
+    own = conn is None
+    conn = conn or connect()
+    try:
+        referee_id = match.get('referee_id')
+        name = (match.get('referee') or '').strip()
+        if referee_id is None and name:
+            # a referee we haven't seen has no games of their own yet, but the unassigned ones still count
+            referee_id = find_referee(conn, name, create=False) or NEW_REFEREE
+        clashes = check_overlaps and find_time_conflicts(match['date'], match['start_time'], match['end_time'],
+                                                         conn, referee_id)
+        if clashes:
+            _, subject, start, end = clashes[0]
+            return f"overlaps {subject} ({start}-{end})"
+        return workload_problem(conn, referee_id, match['date']) if check_limits else None
+    finally:
+        if own:
+            conn.close()
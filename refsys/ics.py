@@ -0,0 +1,178 @@
+"""iCalendar (.ics) feed of the matches table, regenerated incrementally.
+
+Each match becomes a VEVENT with UID match-<id>@refsys, so phones update events in place
+instead of duplicating them. Rendered events are cached per month; a regeneration only
+re-renders rows whose row_version is newer than the last version seen (and drops ids in
+deleted_matches), then re-joins the months they belong to. The cache can be saved to a
+JSON file so the CLI keeps it between runs.
+"""
+import json
+import os
+from datetime import datetime, timedelta, timezone
+
+from refsys import storage
+from refsys.conflicts import calculate_end_time
+
+FORMAT = 1
+COLUMNS = ("id", "date", "start_time", "end_time", "league", "division", "role", "subject", "location",
+           "amount", "row_version")
+HEADER = ("BEGIN:VCALENDAR\r\n"
+          "VERSION:2.0\r\n"
+          "PRODID:-//RefSys//Referee Management System//EN\r\n"
+          "CALSCALE:GREGORIAN\r\n"
+          "METHOD:PUBLISH\r\n"
+          "X-WR-CALNAME:{name}\r\n")
+FOOTER = "END:VCALENDAR\r\n"
+
+def escape(text):
+    return (str(text or "").replace("\\", "\\\\").replace(";", "\\;").replace(",", "\\,")
+            .replace("\r\n", "\\n").replace("\n", "\\n"))
+
+def fold(line):
+    # RFC 5545: lines longer than 75 octets continue on the next line after a space
+    data = line.encode("utf-8")
+    if len(data) <= 75:
+        return line + "\r\n"
+    parts, start = [], 0
+    while start < len(data):
+        end = min(start + (75 if not parts else 74), len(data))
+        while end < len(data) and (data[end] & 0xC0) == 0x80:  # don't split a utf-8 sequence
+            end -= 1
+        parts.append(data[start:end].decode("utf-8"))
+        start = end
+    return "\r\n ".join(parts) + "\r\n"
+
+def render_event(row, stamp):
+    """VEVENT text for one matches row, or None when its date/time can't be read."""
+    match = dict(zip(COLUMNS, row))
+    try:
+        start = datetime.strptime(f"{match['date']} {match['start_time'] or '00:00'}", "%Y-%m-%d %H:%M")
+        end_time = match["end_time"] or calculate_end_time(start)
+        end = datetime.strptime(f"{match['date']} {end_time}", "%Y-%m-%d %H:%M")
+    except (TypeError, ValueError):
+        return None
+    if end <= start:  # ran past midnight
+        end += timedelta(days=1)
+    description = [f"Role: {match['role'] or ''}",
+                   f"League: {match['league'] or ''}" + (f" {match['division']}" if match["division"] else ""),
+                   f"Location: {match['location'] or ''}",
+                   f"Amount: ${match['amount'] or 0:.2f}"]
+    lines = [
+        "BEGIN:VEVENT",
+        f"UID:match-{match['id']}@refsys",
+        f"DTSTAMP:{stamp}",
+        f"SEQUENCE:{match['row_version'] or 0}",
+        f"DTSTART:{start:%Y%m%dT%H%M%S}",
+        f"DTEND:{end:%Y%m%dT%H%M%S}",
+        f"SUMMARY:{escape(match['subject'])} ({escape(match['role'])})",
+        f"LOCATION:{escape(match['location'])}",
+        f"DESCRIPTION:{escape(chr(10).join(description))}",
+        "END:VEVENT",
+    ]
+    return "".join(fold(line) for line in lines)
+
+class IcsFeed:
+    """Month fragments of the feed, kept in step with matches.db by row_version."""
+
+    def __init__(self, name="Referee assignments"):
+        self.name = name
+        self.version = None  # data_version the cache reflects
+        self.events = {}     # id -> (month, sort key, text)
+        self.months = {}     # "YYYY-MM" -> {id: (sort key, text)}
+        self.fragments = {}  # "YYYY-MM" -> joined text, rebuilt lazily
+        self.last_rendered = 0
+
+    def _drop(self, match_id, dirty):
+        old = self.events.pop(match_id, None)
+        if old:
+            month = old[0]
+            self.months[month].pop(match_id, None)
+            if not self.months[month]:
+                del self.months[month]
+            dirty.add(month)
+
+    def _add(self, row, stamp, dirty):
+        self._drop(row[0], dirty)
+        text = render_event(row, stamp)
+        if text is None:
+            return
+        month, key = row[1][:7], (row[1], (row[2] or "").zfill(5), row[0])
+        self.events[row[0]] = (month, key, text)
+        self.months.setdefault(month, {})[row[0]] = (key, text)
+        dirty.add(month)
+
+    def refresh(self, conn, chunk_size=1000):
+        """Bring the cache up to the database's data_version; returns how many events were re-rendered."""
+        version = storage.read_data_version(conn)
+        if version == self.version:
+            return 0
+        if self.version is None or version < self.version:  # first run, or a different/restored database
+            self.events, self.months, self.fragments = {}, {}, {}
+            since = -1
+        else:
+            since = self.version
+        stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+        dirty = set()
+        for (match_id,) in conn.execute("SELECT id FROM deleted_matches WHERE version>?", (since,)):
+            self._drop(match_id, dirty)
+        query = f"SELECT {', '.join(COLUMNS)} FROM matches"
+        cur = conn.execute(query) if since < 0 else conn.execute(query + " WHERE row_version>?", (since,))
+        rendered = 0
+        while True:
+            rows = cur.fetchmany(chunk_size)
+            if not rows:
+                break
+            for row in rows:
+                self._add(row, stamp, dirty)
+                rendered += 1
+        for month in dirty:
+            self.fragments.pop(month, None)
+        self.version = version
+        self.last_rendered = rendered
+        return rendered
+
+    def fragment(self, month):
+        text = self.fragments.get(month)
+        if text is None:
+            events = self.months.get(month, {})
+            text = "".join(t for _, t in sorted(events.values()))
+            self.fragments[month] = text
+        return text
+
+    def iter_feed(self, date_from=None, date_to=None):
+        """Yields the calendar in pieces: header, one fragment per month, footer."""
+        yield HEADER.format(name=escape(self.name))
+        for month in sorted(self.months):
+            if date_from and month < date_from[:7] or date_to and month > date_to[:7]:
+                continue
+            yield self.fragment(month)
+        yield FOOTER
+
+    def text(self):
+        return "".join(self.iter_feed())
+
+    # ---------- On-disk cache ----------
+    def save(self, path):
+        data = {"format": FORMAT, "name": self.name, "version": self.version,
+                "events": {str(i): [m, list(k), t] for i, (m, k, t) in self.events.items()}}
+        tmp = path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, separators=(",", ":"))
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path, name="Referee assignments"):
+        feed = cls(name)
+        try:
+            with open(path, encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return feed
+        if data.get("format") != FORMAT or data.get("name") != name:
+            return feed
+        for match_id, (month, key, text) in data["events"].items():
+            match_id, key = int(match_id), tuple(key)
+            feed.events[match_id] = (month, key, text)
+            feed.months.setdefault(month, {})[match_id] = (key, text)
+        feed.version = data["version"]
+        return feed
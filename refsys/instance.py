@@ -0,0 +1,111 @@
+"""One running window per matches.db: later launches hand their request to it and exit.
+
+    instance = SingleInstance("tk")
+    if not instance.acquire():
+        instance.send({"action": "show", "files": handoff_files(sys.argv[1:])})
+        sys.exit(0)
+    ...
+    for message in instance.pending():   # from the GUI's own timer
+        ...
+
+The first instance listens on a named pipe (Windows) or a user-only Unix socket named after the
+user and the database path, so two databases, or two users, each get their own window. Messages
+are small JSON objects; the listener runs on a daemon thread and only queues them, the GUI drains
+the queue on its own thread. A socket file left behind by a crash is noticed and replaced.
+"""
+import getpass
+import hashlib
+import json
+import os
+import queue
+import sys
+import tempfile
+import threading
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Client, Listener
+
+from refsys import storage
+
+
+def handoff_files(argv):
+    """Absolute paths of the existing files among command-line arguments (flags are skipped)."""
+    return [os.path.abspath(a) for a in argv if not a.startswith("-") and os.path.isfile(a)]
+
+
+class SingleInstance:
+    def __init__(self, app, path=None):
+        database = os.path.abspath(path or storage.DB_PATH)
+        key = hashlib.sha1(f"{getpass.getuser()}\0{database}".encode("utf-8")).hexdigest()[:16]
+        name = f"refsys-{app}-{key}"
+        if sys.platform == "win32":
+            self.address = rf"\\.\pipe\{name}"
+        else:
+            self.address = os.path.join(tempfile.gettempdir(), name + ".sock")
+        self.authkey = key.encode("ascii")
+        self._messages = queue.Queue()
+        self._listener = None
+
+    def acquire(self):
+        """True when no other instance is running; this one then takes the messages of later launches."""
+        try:
+            self._listener = self._listen()
+        except OSError:
+            # the address is taken: a live instance, or a socket file left behind by a crash
+            if self.send({"action": "ping"}):
+                return False
+            try:
+                if sys.platform != "win32":
+                    os.unlink(self.address)
+                self._listener = self._listen()
+            except OSError:
+                # can't tell; better two windows than none
+                return True
+        threading.Thread(target=self._serve, name="refsys-instance", daemon=True).start()
+        return True
+
+    def _listen(self):
+        if sys.platform == "win32":
+            return Listener(self.address, authkey=self.authkey)
+        # nobody else may connect, not even between bind() and chmod()
+        umask = os.umask(0o077)
+        try:
+            return Listener(self.address, family="AF_UNIX", authkey=self.authkey)
+        finally:
+            os.umask(umask)
+
+    def _serve(self):
+        while True:
+            try:
+                with self._listener.accept() as conn:
+                    message = json.loads(conn.recv_bytes(1 << 16))
+            except (OSError, EOFError, ValueError, AuthenticationError):
+                if self._listener is None:
+                    return
+                continue
+            except AttributeError:  # close() ran
+                return
+            if isinstance(message, dict) and message.get("action") != "ping":
+                self._messages.put(message)
+
+    def send(self, message):
+        """Deliver message to the running instance; False if there is none to talk to."""
+        try:
+            with Client(self.address, authkey=self.authkey) as conn:
+                conn.send_bytes(json.dumps(message).encode("utf-8"))
+            return True
+        except (OSError, EOFError, AuthenticationError):
+            return False
+
+    def pending(self):
+        """Messages received since the last call, oldest first."""
+        messages = []
+        while True:
+            try:
+                messages.append(self._messages.get_nowait())
+            except queue.Empty:
+                return messages
+
+    def close(self):
+        listener, self._listener = self._listener, None
+        if listener is not None:
+            listener.close()
@@ -0,0 +1,316 @@
+"""Parsers for pasted assignment text (Spappz, COMET, Assignr, RefCentre)."""
+import logging
+import re
+from datetime import datetime
+
+from refsys.conflicts import BREAK_MINUTES, MATCH_MINUTES, calculate_end_time
+from refsys.pricing import infer_match_amount
+
+logger = logging.getLogger(__name__)
+
+def parse_datetime(text):
+    # dateparser loads its language data on import, keep it off the startup path
+    import dateparser
+    return dateparser.parse(text)
+
+def normalize_text(text):
+    # pasted e-mails carry non-breaking spaces, zero-width spaces and CRLFs
+    return text.replace('\xa0', ' ').replace('\u200b', '').replace('\r\n', '\n')
+
+def parse_text_to_match_data(text):
+    """Match dicts found in pasted assignment text; [] when the format isn't recognized."""
+    text = normalize_text(text)
+    if "Schedule date/time" in text:
+        match = parse_spappz_format(text)
+        return [match] if match else []
+    elif "appointed as" in text and "Match Date" in text:
+        return parse_comet_format(text)
+    elif "Referee:" in text or "Assistant Referee" in text:
+        return parse_assignr_format(text)
+    #elif "Game #" in text and "-v-" in text and ("BC Assignments" in text or "Canwest" in text):
+    #    return parse_refcenter_format(text)
+    return []
+
+def parse_refcenter_format(text):       
+    lines = [line.strip() for line in text.strip().splitlines() if line.strip()]
+    if len(lines) == 1:
+        line = lines[0]
+        try:
+            #  League name
+            league_match = re.search(r"(BC Assignments\s+)?(Canwest Women|BC Soccer)", line)
+            league = league_match.group(2).strip() if league_match else "League"
+
+            # match name
+            match_match = re.search(r"Game #\d+\s+(.+?)\s+-v-\s+(.+?)\s+(.*?)\s+(?:Jan|Feb|Mar|Apr|May|Jun|Jul|Aug|Sep|Oct|Nov|Dec)", line)
+            if not match_match:
+                raise ValueError("Match pattern not found")
+            team1 = match_match.group(1).strip()
+            team2 = match_match.group(2).strip()
+            location = match_match.group(3).strip()
+
+            # time
+            date_match = re.search(r"(Jan|Feb|Mar|Apr|May|Jun|Jul|Aug|Sep|Oct|Nov|Dec)\s+\d{1,2},\s+\d{4}\s+at\s+\d{1,2}:\d{2}", line)
+            dt_str = date_match.group(0) if date_match else None
+            dt = parse_datetime(dt_str)
+
+            return [{
+                "league": league,
+                "role": "",
+                "match_name": f"{team1} -v- {team2}",
+                "date": dt.strftime("%Y-%m-%d"),
+                "start_time": dt.strftime("%H:%M"),
+                "end_time": calculate_end_time(dt),
+                "location": location
+            }]
+        except Exception as e:
+            logger.warning("RefCenter parsing failed: %s", e)
+            return []
+    matches = []
+    block = []
+    for line in lines:
+        if "Game #" in line and block:
+            matches.append(block)
+            block = []
+        block.append(line)
+    if block:
+        matches.append(block)
+
+    parsed = []
+    for block in matches:
+        try:
+            if len(block) < 6:
+                raise ValueError("Block too short")
+
+            league = block[1].strip()
+            match_name = block[3].strip()
+            location = block[4].strip()
+            dt = parse_datetime(block[5].strip())
+
+            parsed.append({
+                "league": league,
+                "role": "",
+                "match_name": match_name,
+                "date": dt.strftime("%Y-%m-%d"),
+                "start_time": dt.strftime("%H:%M"),
+                "end_time": calculate_end_time(dt),
+                "location": location
+            })
+        except Exception as e:
+            logger.warning("RefCenter parsing error: %s %s", e, block)
+
+    return parsed
+
+def parse_spappz_format(text):
+    try:
+        role = re.search(r"Role:\s*(.*)", text).group(1)
+        division = re.search(r"Division:\s*(.*)", text).group(1).strip()
+        schedule = re.search(r"Schedule date/time:\s*(.*)", text).group(1)
+        field_name = re.search(r"Field Name:\s*(.*)", text).group(1)
+        city = re.search(r"City:\s*(.*)", text).group(1)
+        home_team = re.search(r"Home Team:\s*(.*)", text).group(1)
+        visiting_team = re.search(r"Visiting Team:\s*(.*)", text).group(1)
+        # the official the assignment is for; "Field Name:" must not match
+        name_match = re.search(r"^\s*Name:\s*(.*)", text, re.MULTILINE)
+        dt = parse_datetime(schedule)
+        date = dt.strftime("%Y-%m-%d")
+        start_time = dt.strftime("%H:%M")
+        end_time = calculate_end_time(dt)
+        match_name = f"{home_team} vs {visiting_team}"
+        role_clean = "AR" if "Assistant" in role else "Referee"
+        # 🏷️ League
+        if "Metro Women's Soccer League" in text or "MWSL" in text:
+            league = "MWSL"
+        elif "Fraser Valley Soccer League" in text or "FVSL" in text:
+            league = "FVSL"
+        elif "Vancouver Metro Soccer League" in text or "VMSL" in text :
+            league = "VMSL"
+        else:
+            league = "League"
+        if any(kw in division for kw in ["Premier", "Imperial Cup", "Prime"]):
+            amount = 110 if role_clean == "Referee" else 70
+        else:
+            amount = 100 if role_clean == "Referee" else 60
+        return {
+            "league": league,
+            "division": division,
+            "role": role_clean,
+            "match_name": match_name,
+            "date": date,
+            "start_time": start_time,
+            "end_time": end_time,
+            "location": f"{field_name}, {city}",
+            "amount": amount,
+            "referee": name_match.group(1).strip() if name_match else "",
+        }
+    except (AttributeError, TypeError) as e:
+        # a field is missing or the date didn't parse
+        logger.warning("Spappz parsing failed: %s", e)
+        return None
+
+def parse_comet_format(text):
+    try:
+        text = text.replace('\xa0', ' ').replace('\u200b', '').replace('\r\n', '\n')
+        logger.debug("COMET text: %s", text)
+        role_match = re.search(r"appointed as (.*?) of the match", text)
+        match_teams = re.search(r"of the match (.*?) and the status", text)
+        match_date = re.search(r"Match Date:\s*(\d{2}\.\d{2}\.\d{4}) (\d{2}:\d{2})", text)
+        stadium = re.search(r"Stadium:\s*(.*?)\s*\(", text)
+        city = re.search(r"Stadium:.*\((.*?)\)", text)
+        league_match = re.search(r"Competition:\s*(.*)", text)
+        amount = 0.0  
+        text = text.replace('\xa0', ' ').replace('\u200b', '').replace('\r\n', '\n')
+
+        if not all([role_match, match_teams, match_date, stadium, city, league_match]):
+            logger.warning("Some parts missing in COMET match.")
+            return []
+
+        league_match = re.search(r"Competition:\s*(.*?)(?:\s*Comment:|$)", text)
+        league_raw = league_match.group(1).strip()
+        known_leagues = ["BCSPL", "BCCSL", "VMSL", "MWSL", "FVSL", "BC Soccer"]
+        parts = league_raw.split()
+        if len(parts) >= 2:
+            candidate_league = " ".join(parts[:2])
+            if candidate_league in known_leagues:
+                league = candidate_league
+                division = " ".join(parts[2:]).strip()
+            elif parts[0] in known_leagues:
+                league = parts[0]
+                division = " ".join(parts[1:]).strip()
+            else:
+                league = league_raw
+                division = ""
+        else:
+            league = league_raw
+            division = ""
+
+        # ✅ role
+        role_raw = role_match.group(1).strip().lower()
+        if "4th official" in role_raw:
+            role = "4th"
+        elif "assistant" in role_raw:
+            role = "AR"
+        elif "referee" in role_raw:
+            role = "Referee"
+        else:
+            role = "Official"
+
+        # ✅ match info 
+        teams = match_teams.group(1).strip().split(" - ")
+        match_name = f"{teams[0].strip()} vs {teams[1].strip() if len(teams) > 1 else 'TBD'}"
+
+        # ✅ date and time
+        date = datetime.strptime(match_date.group(1), "%d.%m.%Y").strftime("%Y-%m-%d")
+        start_time = match_date.group(2)
+        end_time = calculate_end_time(start_time)
+
+        # ✅ amount
+        if "BC Soccer" in league and "Cup" in division:
+            amount = 100 if role == "Referee" else 60
+        elif "BCSPL" in league:
+            division = league_raw.split()[-1]  # 例如 U16
+            amount = infer_match_amount("BCSPL", role, division)
+
+        return [{
+            "league": league,
+            "division": division,
+            "role": role,
+            "match_name": match_name,
+            "date": date,
+            "start_time": start_time,
+            "end_time": end_time,
+            "location": f"{stadium.group(1).strip()}, {city.group(1).strip()}",
+            "amount": amount
+        }]
+
+    except Exception as e:
+        logger.warning("parse_comet_format error: %s", e)
+        return []
+
+def parse_assignr_format(text):
+    matches = []
+    lines = [line.strip() for line in text.strip().splitlines() if line.strip()]
+    blocks = []
+    current_block = []
+
+    for line in lines:
+        if re.match(r"(Referee|Assistant Referee(?: \d*)?):", line):
+            if current_block:
+                blocks.append(current_block)
+                current_block = []
+        current_block.append(line)
+    if current_block:
+        blocks.append(current_block)
+
+    for block in blocks:
+        try:
+            header = block[0]
+            desc_line = next((l for l in block if l.startswith("#")), "")
+            details = desc_line.replace("#", "").strip()
+
+            logger.debug("Raw details: %s", details)
+
+            role_match = re.match(r"(Referee|Assistant Referee(?: \d*)?):\s*(.*?)\s*@\s*(.+)", header)
+            if not role_match:
+                logger.warning("Invalid header: %s", header)
+                continue
+
+            role_label, dt_str, location = role_match.groups()
+            dt = parse_datetime(dt_str)
+            if not dt:
+                logger.warning("Invalid datetime: %s", dt_str)
+                continue
+
+            # ⏱️ time
+            half_duration = MATCH_MINUTES // 2
+            halftime_break = BREAK_MINUTES
+            duration_match = re.search(r"Two x (\d+)min/(\d+)min HT", details)
+            if duration_match:
+                half_duration = int(duration_match.group(1))
+                halftime_break = int(duration_match.group(2))
+
+            start_time = dt.strftime("%H:%M")
+            end_time = calculate_end_time(dt, 2 * half_duration, halftime_break)
+            date = dt.strftime("%Y-%m-%d")
+
+            role = "AR" if "Assistant" in role_label else "Referee"
+
+            # BCCSL / BCSPL / League
+            if "Cup" in details:
+                cup_match = re.search(r"([ABC]) Cup", details)
+                cup = cup_match.group(1) if cup_match else "Unknown"
+                league = "BCCSL"
+            else:
+                league_match = re.search(r"\b([A-Z]+SPL|BCCSL)\b", details)
+                league = league_match.group(1) if league_match else "League"
+
+            div_match = re.search(r"U\s*(\d{2})\s*([A-Z0-9]+)?", details, re.IGNORECASE)
+            if div_match:
+                age = div_match.group(1)
+                level = div_match.group(2) or ''
+                level = re.sub(r'\W+', '', level)
+                division = f"U{age}{level}"
+            else:
+                logger.debug("Division match: No match")
+                division = "Unknown"
+
+            if "Cup" in details:
+                match_name = f"{league} {cup} Cup ({division})"
+            else:
+                match_name = f"{league} ({division})"
+            amount = infer_match_amount(league, role, division)
+            matches.append({
+                "league": league,
+                "division": division,
+                "role": role,
+                "match_name": match_name,
+                "date": date,
+                "start_time": start_time,
+                "end_time": end_time,
+                "location": location.strip(),
+                "amount": amount
+            })
+
+        except Exception as e:
+            logger.warning("Assignr parsing failed: %s %s", e, block)
+
+    return matches
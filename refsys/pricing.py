@@ -0,0 +1,186 @@
+"""Referee payment rates, amount inference and bulk re-pricing."""
+import argparse
+import json
+import re
+from datetime import datetime
+
+from refsys.storage import connect, notify_matches_changed, write_transaction
+
+# === Referee Payment Rates ===
+BCCR_RATES = {
+    "BCCSL": {
+        "Referee": {
+            "U8": 20, "U9": 23, "U10": 25,
+            "U11D3": 30, "U12D3": 30,
+            "U11": 35, "U12": 35, "U13": 40,
+            "U14": 65, "U15": 65, "U16": 65,
+            "U17": 75, "U18": 75,
+        },
+        "AR": {
+            "U14": 40, "U15": 40, "U16": 40,
+            "U17": 45, "U18": 45,
+        }
+    },
+    "BCSPL": {
+        "Referee": {
+            "U14": 65, "U15": 65, "U16": 65,
+            "U17": 75, "U18": 75,
+        },
+        "AR": {
+            "U14": 40, "U15": 40, "U16": 40,
+            "U17": 50, "U18": 50,
+        }
+    }
+}
+
+# lowest referee grade allowed in the centre for each rate tier; ARs may be one grade lower
+TIER_GRADES = {
+    "U8": 1, "U9": 1, "U10": 1,
+    "U11D3": 1, "U12D3": 1,
+    "U11": 2, "U12": 2, "U13": 2,
+    "U14": 3, "U15": 3, "U16": 3,
+    "U17": 4, "U18": 4,
+}
+
+def division_tier(division):
+    """Rate tier of a division ("U13", "U12D3", ...), or "" when it has no U-age."""
+    age_match = re.search(r"U(\d{2})", (division or "").upper())
+    if not age_match:
+        return ""
+    age = f"U{age_match.group(1)}"
+    if "D3" in division.upper():
+        age = age + "D3"
+    return age
+
+def required_grade(role, division):
+    grade = TIER_GRADES.get(division_tier(division), 1)
+    return max(grade - 1, 1) if role == "AR" else grade
+
+def infer_match_amount(league, role, division, rates=BCCR_RATES):
+    league = league.upper()
+    role = role if role in ["Referee", "AR"] else "Referee"
+    age = division_tier(division)
+    if not age:
+        return 0.0
+
+    league_rates = rates.get(league, {})
+    role_rates = league_rates.get(role, {})
+    return float(role_rates.get(age, 0.0))
+
+def load_rate_table(path):
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+def reprice_matches(rates=BCCR_RATES, date_from=None, date_to=None, league=None, dry_run=False, chunk_size=500):
+    """Recompute amounts from a rate table; returns (batch, [(id, date, subject, old, new), ...])."""
+    query = "SELECT id, date, subject, league, role, division, amount FROM matches WHERE 1=1"
+    params = []
+    if date_from:
+        query += " AND date>=?"
+        params.append(date_from)
+    if date_to:
+        query += " AND date<=?"
+        params.append(date_to)
+    if league:
+        query += " AND league=?"
+        params.append(league)
+
+    if dry_run:
+        conn = connect()
+        try:
+            return None, price_changes(conn, query, params, rates, chunk_size)
+        finally:
+            conn.close()
+
+    batch = datetime.now().strftime("%Y%m%d%H%M%S%f")
+
+    def apply(conn):
+        # amounts are read under the write lock, so an edit from another process can't slip in between
+        changes = price_changes(conn, query, params, rates, chunk_size)
+        conn.executemany("UPDATE matches SET amount=? WHERE id=?",
+                         [(new, match_id) for match_id, _, _, _, new in changes])
+        conn.executemany(
+            "INSERT INTO reprice_log (batch, match_id, old_amount, new_amount) VALUES (?, ?, ?, ?)",
+            [(batch, match_id, old, new) for match_id, _, _, old, new in changes])
+        return changes
+
+    changes = write_transaction(apply)
+    if not changes:
+        return None, changes
+    notify_matches_changed(*{date for _, date, _, _, _ in changes})
+    return batch, changes
+
+def price_changes(conn, query, params, rates, chunk_size):
+    cur = conn.execute(query, params)
+    # rows share a handful of (league, role, division) keys, so price each key once
+    prices = {}
+    changes = []
+    while True:
+        rows = cur.fetchmany(chunk_size)
+        if not rows:
+            break
+        for match_id, date, subject, lg, role, division, amount in rows:
+            key = (lg or "", role or "", division or "")
+            if key not in prices:
+                prices[key] = infer_match_amount(*key, rates=rates)
+            new_amount = prices[key]
+            old_amount = amount or 0.0
+            if new_amount and new_amount != old_amount:
+                changes.append((match_id, date, subject, old_amount, new_amount))
+    return changes
+
+def rollback_reprice(batch):
+    """Restore the amounts a re-price batch overwrote; rows edited since then are left alone."""
+    def rollback(conn):
+        dates = [row[0] for row in conn.execute(
+            "SELECT DISTINCT date FROM matches WHERE id IN (SELECT match_id FROM reprice_log WHERE batch=?)",
+            (batch,))]
+        restored = conn.execute(
+            """UPDATE matches SET amount=(SELECT old_amount FROM reprice_log
+                                          WHERE batch=? AND match_id=matches.id)
+               WHERE id IN (SELECT match_id FROM reprice_log WHERE batch=?)
+                 AND amount=(SELECT new_amount FROM reprice_log
+                             WHERE batch=? AND match_id=matches.id)""",
+            (batch, batch, batch)).rowcount
+        conn.execute("""DELETE FROM reprice_log WHERE batch=? AND match_id IN
+                        (SELECT id FROM matches WHERE amount=reprice_log.old_amount)""", (batch,))
+        return dates, restored
+
+    dates, restored = write_transaction(rollback)
+    notify_matches_changed(*dates)
+    return restored
+
+def add_reprice_arguments(parser, rollback_flag="--rollback-reprice"):
+    parser.add_argument("--from", dest="date_from", help="first date (YYYY-MM-DD)")
+    parser.add_argument("--to", dest="date_to", help="last date (YYYY-MM-DD)")
+    parser.add_argument("--league", help="only re-price this league")
+    parser.add_argument("--rates", help="JSON rate table, same shape as BCCR_RATES")
+    parser.add_argument("--dry-run", action="store_true", help="show the diff without writing")
+    parser.add_argument(rollback_flag, dest="rollback_reprice", metavar="BATCH", help="undo a previous re-price batch")
+
+def reprice_command(args):
+    if args.rollback_reprice:
+        restored = rollback_reprice(args.rollback_reprice)
+        print(f"Restored {restored} match(es) from batch {args.rollback_reprice}")
+        return 0
+
+    rates = load_rate_table(args.rates) if args.rates else BCCR_RATES
+    batch, changes = reprice_matches(rates, args.date_from, args.date_to, args.league, dry_run=args.dry_run)
+    for match_id, date, subject, old, new in changes:
+        print(f"{match_id:>6}  {date}  {subject:<40.40}  ${old:>7.2f} -> ${new:>7.2f}")
+    total = sum(new - old for _, _, _, old, new in changes)
+    if args.dry_run:
+        print(f"[dry run] {len(changes)} match(es) would change, total delta ${total:+.2f}")
+    elif batch:
+        print(f"Re-priced {len(changes)} match(es), total delta ${total:+.2f} (batch {batch})")
+    else:
+        print("Nothing to re-price.")
+    return 0
+
+def run_reprice_cli(argv, prog="RefSys_PySide6.py --reprice"):
+    # kept for the GUI's --reprice flag; `python -m refsys reprice` is the same command
+    parser = argparse.ArgumentParser(prog=prog,
+                                     description="Recompute match amounts from a rate table.")
+    parser.add_argument("--reprice", action="store_true")
+    add_reprice_arguments(parser)
+    return reprice_command(parser.parse_args(argv))
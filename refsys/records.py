@@ -0,0 +1,286 @@
+"""CSV / JSON Lines match records: column mapping, validation and batched import.
+
+Reads our own `refsys export` files as well as assignors' spreadsheet exports; headers are
+matched case-insensitively against COLUMN_ALIASES and can be overridden with a mapping.
+"""
+import csv
+import json
+import re
+from datetime import datetime
+
+from refsys import storage
+from refsys.conflicts import calculate_end_time, times_overlap, week_bounds, workload_limits
+from refsys.pricing import infer_match_amount
+
+COLUMN_ALIASES = {
+    "date": ("date", "game date", "match date", "day"),
+    "start_time": ("start_time", "start time", "time", "start", "kickoff", "kick off"),
+    "end_time": ("end_time", "end time", "end"),
+    "league": ("league", "competition", "organization"),
+    "division": ("division", "age group", "level", "age"),
+    "role": ("role", "position", "assignment"),
+    "subject": ("subject", "match", "match_name", "game", "teams"),
+    "home": ("home", "home team"),
+    "away": ("away", "away team", "visiting team", "visitor"),
+    "location": ("location", "venue", "field", "field name", "site"),
+    "amount": ("amount", "fee", "pay", "game fee"),
+    "content": ("content", "notes", "details"),
+    "referee": ("referee", "official", "name", "referee name", "assigned to"),
+}
+DATE_FORMATS = ("%Y-%m-%d", "%m/%d/%Y", "%m/%d/%y", "%d.%m.%Y", "%b %d, %Y", "%B %d, %Y", "%a %b %d, %Y")
+TIME_FORMATS = ("%H:%M", "%H:%M:%S", "%I:%M %p", "%I:%M%p", "%I %p")
+# "2025-03-01 10:00", "May 4, 2024 10:00 AM", "2025-03-01T10:00:00": date and kickoff in one column
+DATE_TIME_RE = re.compile(r"^(.+?)[\sT]+(\d{1,2}:\d\d(?::\d\d)?\s*(?:[AP]M)?)$", re.IGNORECASE)
+
+class RecordError(ValueError):
+    pass
+
+# ---------- Reading ----------
+def iter_csv(f):
+    """(line number, {header: value}) for every data row."""
+    reader = csv.DictReader(f)
+    for row in reader:
+        yield reader.line_num, row
+
+def iter_jsonl(f):
+    for number, line in enumerate(f, 1):
+        if line.strip():
+            try:
+                record = json.loads(line)
+            except ValueError as e:
+                raise RecordError(f"line {number}: not JSON ({e})")
+            yield number, record
+
+def iter_json(f):
+    data = json.load(f)
+    for number, record in enumerate(data if isinstance(data, list) else [data], 1):
+        yield number, record
+
+READERS = {"csv": iter_csv, "jsonl": iter_jsonl, "json": iter_json}
+
+def guess_format(path):
+    name = path.lower()
+    if name.endswith(".csv"):
+        return "csv"
+    if name.endswith((".jsonl", ".ndjson")):
+        return "jsonl"
+    if name.endswith(".json"):
+        return "json"
+    return "text"
+
+# ---------- Mapping & validation ----------
+def column_map(headers, overrides=None):
+    """{field: header} for the headers present; overrides are field=header pairs."""
+    by_name = {str(h).strip().lower(): h for h in headers}
+    mapping = {}
+    for field, aliases in COLUMN_ALIASES.items():
+        for alias in aliases:
+            if alias in by_name:
+                mapping[field] = by_name[alias]
+                break
+    for field, header in (overrides or {}).items():
+        if field not in COLUMN_ALIASES:
+            raise RecordError(f"unknown field in mapping: {field}")
+        mapping[field] = header
+    return mapping
+
+def parse_date(text):
+    text = text.strip()
+    for fmt in DATE_FORMATS:
+        try:
+            return datetime.strptime(text, fmt).strftime("%Y-%m-%d")
+        except ValueError:
+            pass
+    raise RecordError(f"unreadable date: {text!r}")
+
+def parse_time(text):
+    text = text.strip().upper()
+    for fmt in TIME_FORMATS:
+        try:
+            return datetime.strptime(text, fmt).strftime("%H:%M")
+        except ValueError:
+            pass
+    raise RecordError(f"unreadable time: {text!r}")
+
+def parse_role(text):
+    """'Referee' or 'AR' from however the sheet spells it ("Assistant Referee", "AR 1", "Centre", ...)."""
+    name = re.sub(r"[^a-z]+", " ", text.lower()).strip()  # "AR 1" -> "ar", "A.R." -> "a r"
+    if not name:
+        return "Referee"
+    if name in ("ar", "a r") or name.startswith(("assistant", "asst", "lines")):
+        return "AR"
+    if name in ("ref", "r", "cr") or name.startswith(("referee", "centre", "center", "main")):
+        return "Referee"
+    raise RecordError(f"unknown role: {text!r}")
+
+def to_match(record, mapping):
+    """Validated match dict (the same shape the text parsers produce) from one mapped record."""
+    def get(field):
+        value = record.get(mapping[field]) if field in mapping else None
+        return "" if value is None else str(value).strip()
+
+    if not get("date"):
+        raise RecordError("missing date")
+    combined = DATE_TIME_RE.match(get("date"))
+    date_text, time_text = combined.groups() if combined else (get("date"), "")
+    date = parse_date(date_text)
+    if get("start_time"):
+        start_time = parse_time(get("start_time"))
+    elif time_text:
+        start_time = parse_time(time_text)
+    else:
+        raise RecordError("missing start time")
+    end_time = parse_time(get("end_time")) if get("end_time") else calculate_end_time(start_time)
+
+    subject = get("subject")
+    if not subject and get("home") and get("away"):
+        subject = f"{get('home')} vs {get('away')}"
+    if not subject:
+        raise RecordError("missing match/teams")
+
+    league, role, division = get("league"), parse_role(get("role")), get("division")
+    if get("amount"):
+        try:
+            amount = float(get("amount").replace("$", "").replace(",", ""))
+        except ValueError:
+            raise RecordError(f"unreadable amount: {get('amount')!r}")
+    else:
+        amount = infer_match_amount(league, role, division)
+    return {
+        "league": league,
+        "division": division,
+        "role": role,
+        "match_name": subject,
+        "date": date,
+        "start_time": start_time,
+        "end_time": end_time,
+        "location": get("location"),
+        "amount": amount,
+        "content": get("content") or f"{subject} details",
+        "referee": get("referee"),
+    }
+
+# ---------- Import ----------
+class ImportResult:
+    def __init__(self):
+        self.added = 0
+        self.duplicates = []  # (line, match)
+        self.conflicts = []   # (line, match, reason)
+        self.invalid = []     # (line, reason, record)
+        self.dates = set()
+
+class DayIndex:
+    """Each referee's matches on one date, from the db plus those accepted from this file."""
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.dates = {}   # date -> {referee_id: [(start, end, subject, role)]}
+        self.weeks = {}   # (referee_id, monday) -> games
+        self.limits = {}  # referee_id -> (max per day, max per week)
+
+    def get(self, referee_id, date):
+        """The referee's own matches on date (referee_id None: the unassigned ones)."""
+        by_referee = self.dates.get(date)
+        if by_referee is None:
+            by_referee = self.dates[date] = {}
+            for referee, s, e, subject, role in self.conn.execute(
+                    "SELECT referee_id, start_time, end_time, subject, role FROM matches WHERE date=?", (date,)):
+                if s and e:
+                    by_referee.setdefault(referee, []).append((s.zfill(5), e.zfill(5), subject, role))
+        return by_referee.setdefault(referee_id, [])
+
+    def clashing(self, referee_id, date):
+        """The matches on date a match of this referee can overlap, as in conflicts.find_time_conflicts."""
+        own = self.get(referee_id, date)
+        if referee_id is None:
+            return [game for day in self.dates[date].values() for game in day]
+        return own + self.dates[date].get(None, [])
+
+    def week_key(self, referee_id, date):
+        monday, sunday = week_bounds(date)
+        key = (referee_id, monday)
+        if key not in self.weeks:
+            self.weeks[key] = self.conn.execute(
+                "SELECT COUNT(*) FROM matches WHERE referee_id IS ? AND date BETWEEN ? AND ?",
+                (referee_id, monday, sunday)).fetchone()[0]
+        return key
+
+    def over_limit(self, referee_id, date):
+        if referee_id not in self.limits:
+            self.limits[referee_id] = workload_limits(self.conn, referee_id)
+        max_day, max_week = self.limits[referee_id]
+        if max_day is not None and len(self.get(referee_id, date)) >= max_day:
+            return f"daily limit {max_day} reached"
+        if max_week is not None and self.weeks[self.week_key(referee_id, date)] >= max_week:
+            return f"weekly limit {max_week} reached"
+        return None
+
+    def add(self, referee_id, match):
+        self.get(referee_id, match["date"]).append(
+            (match["start_time"], match["end_time"], match["match_name"], match["role"]))
+        self.weeks[self.week_key(referee_id, match["date"])] += 1
+
+def import_records(conn, records, mapping=None, overrides=None, allow_conflicts=False, dry_run=False,
+                   batch_size=1000, on_problem=None, check_limits=True):
+    """Validates and inserts (line, record) pairs in one transaction; returns an ImportResult.
+
+    Checks are per referee. A match the referee already has (same date, start, subject and
+    role) is a duplicate and skipped; one overlapping another of their matches that day, or an
+    unassigned one, is a conflict and skipped unless allow_conflicts; one over their daily/weekly limit is a
+    conflict unless check_limits is False. A dry run rolls the transaction back.
+    """
+    result = ImportResult()
+    index = DayIndex(conn)
+    pending = []
+
+    def report(kind, line, *details):
+        if on_problem:
+            on_problem(kind, line, *details)
+
+    try:
+        for line, record in records:
+            if mapping is None:
+                mapping = column_map(record.keys(), overrides)
+            try:
+                match = to_match(record, mapping)
+            except RecordError as e:
+                result.invalid.append((line, str(e), record))
+                report("invalid", line, str(e))
+                continue
+            # new referees are added here, inside the transaction
+            referee_id = match["referee_id"] = storage.match_referee(conn, match)
+            day = index.get(referee_id, match["date"])
+            start, end = match["start_time"], match["end_time"]
+            if any(s == start and subject == match["match_name"] and role == match["role"]
+                   for s, _, subject, role in day):
+                result.duplicates.append((line, match))
+                report("duplicate", line, match)
+                continue
+            clash = None
+            if not allow_conflicts:
+                clash = next((f"overlaps {subject}" for s, e, subject, _ in index.clashing(referee_id, match["date"])
+                              if times_overlap(start, end, s, e)), None)
+            if clash is None and check_limits:
+                clash = index.over_limit(referee_id, match["date"])
+            if clash is not None:
+                result.conflicts.append((line, match, clash))
+                report("conflict", line, match, clash)
+                continue
+            index.add(referee_id, match)
+            result.added += 1
+            result.dates.add(match["date"])
+            if not dry_run:
+                pending.append(match)
+                if len(pending) >= batch_size:
+                    storage.insert_matches(conn, pending)
+                    pending.clear()
+        if pending:
+            storage.insert_matches(conn, pending)
+    except BaseException:
+        conn.rollback()
+        raise
+    if dry_run:
+        conn.rollback()
+    else:
+        conn.commit()
+    return result
@@ -0,0 +1,405 @@
+"""Local HTTP/JSON API over matches.db, built on asyncio with no extra dependencies.
+
+GET  /matches?from=YYYY-MM-DD&to=YYYY-MM-DD[&league=&role=&referee=&limit=]   matches in a date range
+GET  /day/YYYY-MM-DD[?referee=]           the calendar tab's day view, with the day's total
+GET  /stats?by=month[&year=&referee=]     the same rollups as `python -m refsys stats`
+GET  /version                             current data version
+GET  /calendar.ics[?from=&to=]            iCalendar feed of the matches (see refsys.ics)
+POST /ingest                              pasted assignment text; body is the text itself
+POST /sync                                change-log exchange with another device (see refsys.sync)
+
+Every GET answers with an ETag taken from the database's data_version counter (bumped by
+triggers on any write, from any process), so a client holding current data gets a 304.
+Reads run on a small pool of connections in worker threads; ingests are queued and
+committed together, one transaction per batch.
+"""
+import asyncio
+import json
+import logging
+import re
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs, urlsplit
+
+from refsys import storage
+
+logger = logging.getLogger(__name__)
+
+MATCH_COLUMNS = ("id", "date", "start_time", "end_time", "league", "division", "role", "subject", "location", "amount",
+                 "referee")
+MATCH_SELECT = (", ".join("COALESCE(r.name, '')" if c == "referee" else f"m.{c}" for c in MATCH_COLUMNS)
+                + " FROM matches m LEFT JOIN referees r ON r.id=m.referee_id")
+REFEREE_CLAUSE = " AND m.referee_id=(SELECT id FROM referees WHERE name=?)"
+DATE_RE = re.compile(r"^\d{4}-\d{2}-\d{2}$")
+MAX_BODY = 8 << 20
+STATUS_TEXT = {200: "OK", 201: "Created", 304: "Not Modified", 400: "Bad Request", 401: "Unauthorized",
+               404: "Not Found", 405: "Method Not Allowed", 409: "Conflict", 413: "Payload Too Large",
+               422: "Unprocessable Entity", 500: "Internal Server Error"}
+
+class HTTPError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+def dump(payload):
+    return json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+# ---------- Queries (run on pool threads) ----------
+def query_matches(conn, date_from, date_to, league=None, role=None, referee=None, limit=1000):
+    query = f"SELECT {MATCH_SELECT} WHERE m.date BETWEEN ? AND ?"
+    params = [date_from, date_to]
+    if league:
+        query += " AND m.league=?"
+        params.append(league)
+    if role:
+        query += " AND m.role=?"
+        params.append(role)
+    if referee:
+        query += REFEREE_CLAUSE
+        params.append(referee)
+    rows = conn.execute(query + " ORDER BY m.date, m.start_time, m.id LIMIT ?", params + [limit + 1]).fetchall()
+    return dump({
+        "matches": [dict(zip(MATCH_COLUMNS, row)) for row in rows[:limit]],
+        "truncated": len(rows) > limit,
+    })
+
+def query_day(conn, date, referee=None):
+    query = f"SELECT {MATCH_SELECT} WHERE m.date=?"
+    params = [date]
+    if referee:
+        query += REFEREE_CLAUSE
+        params.append(referee)
+    rows = conn.execute(query + " ORDER BY m.start_time, m.id", params).fetchall()
+    matches = [dict(zip(MATCH_COLUMNS, row)) for row in rows]
+    return dump({
+        "date": date,
+        "matches": matches,
+        "count": len(matches),
+        "total": round(sum(m["amount"] or 0 for m in matches), 2),
+    })
+
+_stats_lock = threading.Lock()
+
+def query_stats(conn, by, year, referee=None):
+    from refsys.cli import plain, stats_rows
+    referee_id = storage.find_referee(conn, referee, create=False) if referee else None
+    if referee and referee_id is None:
+        return dump({"by": by, "year": year, "referee": referee, "rows": []})
+    # STATS_ENGINE keeps its own caches; one thread at a time
+    with _stats_lock:
+        headers, rows = stats_rows(by, year, referee_id)
+        return dump({"by": by, "year": year, "referee": referee,
+                     "rows": [dict(zip(headers, map(plain, row))) for row in rows]})
+
+_feed_lock = threading.Lock()
+_feed = None
+
+def query_calendar(conn, date_from, date_to):
+    global _feed
+    from refsys.ics import IcsFeed
+    with _feed_lock:
+        if _feed is None:
+            _feed = IcsFeed()
+        _feed.refresh(conn)
+        return "".join(_feed.iter_feed(date_from, date_to)).encode("utf-8")
+
+# ---------- Connection pools ----------
+class ReadPool:
+    """A fixed set of read connections, each used by one worker thread at a time."""
+
+    def __init__(self, path, size=4):
+        self._executor = ThreadPoolExecutor(max_workers=size, thread_name_prefix="refsys-read")
+        self._connections = asyncio.Queue()
+        for _ in range(size):
+            self._connections.put_nowait(storage.connect(path, check_same_thread=False))
+
+    async def run(self, func, *args):
+        conn = await self._connections.get()
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._executor, func, conn, *args)
+        finally:
+            self._connections.put_nowait(conn)
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+        while not self._connections.empty():
+            self._connections.get_nowait().close()
+
+class WriteBatcher:
+    """Collects ingest requests for up to `delay` seconds and commits them in one transaction."""
+
+    def __init__(self, path, max_batch=200, delay=0.01):
+        self.path = path
+        self.max_batch = max_batch
+        self.delay = delay
+        self._queue = asyncio.Queue()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="refsys-write")
+        self._conn = None
+        self._task = None
+
+    def start(self):
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def submit(self, matches):
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((matches, future))
+        return await future
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.delay
+            while len(batch) < self.max_batch:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+                except asyncio.TimeoutError:
+                    break
+            try:
+                results = await loop.run_in_executor(self._executor, self._commit, [m for m, _ in batch])
+            except Exception as e:
+                logger.exception("Ingest batch failed")
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            for (_, future), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
+
+    def _commit(self, requests):
+        # conflict checks and inserts both run under the write lock, retried if another process holds it
+        results = storage.write_transaction(self._insert_batch, requests, path=self.path)
+        logger.info("Committed %d ingest request(s)", len(requests))
+        return results
+
+    @staticmethod
+    def _insert_batch(conn, requests):
+        from refsys.conflicts import match_problem
+        results = []
+        for matches in requests:
+            added, conflicts = [], []
+            for match in matches:
+                # earlier inserts in this transaction are visible to the check
+                problem = match_problem(match, conn)
+                if problem:
+                    conflicts.append({"match": match, "problem": problem})
+                else:
+                    storage.insert_matches(conn, [match])
+                    added.append(match)
+            results.append((added, conflicts))
+        return results
+
+    async def run(self, func, *args):
+        """func(conn, *args) on the write thread, between ingest batches."""
+        def call():
+            if self._conn is None:
+                self._conn = storage.connect(self.path)
+            return func(self._conn, *args)
+        return await asyncio.get_running_loop().run_in_executor(self._executor, call)
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+        self._executor.shutdown(wait=True)
+        if self._conn is not None:
+            self._conn.close()
+
+# ---------- Server ----------
+class MatchServer:
+    def __init__(self, path=None, readers=4, token=None, cache_size=256, sync_policies=None):
+        self.path = path or storage.DB_PATH
+        self.token = token
+        self.sync_policies = sync_policies
+        self.reads = ReadPool(self.path, readers)
+        self.writes = WriteBatcher(self.path)
+        self._cache = OrderedDict()  # (target, version) -> body
+        self.cache_size = cache_size
+        # the meta counter is only re-read after some connection commits
+        self._changes = storage.ChangeWatcher(self.path)
+        self.version = self._changes.version
+
+    def current_version(self):
+        if self._changes.poll():
+            self.version = self._changes.version
+            self._cache.clear()
+            # in-process stats caches key on storage.DATA_VERSION
+            storage.notify_matches_changed()
+        return self.version
+
+    async def cached(self, target, compute):
+        version = self.version
+        key = (target, version)
+        body = self._cache.get(key)
+        if body is None:
+            body = await compute()
+            # a write that committed during compute() may or may not be in body; don't file it under version
+            if self.current_version() != version:
+                return body
+            self._cache[key] = body
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        else:
+            self._cache.move_to_end(key)
+        return body
+
+    async def dispatch(self, method, target, headers, body):
+        url = urlsplit(target)
+        path = url.path.rstrip("/") or "/"
+        content_type = "application/json; charset=utf-8"
+        params = {k: v[-1] for k, v in parse_qs(url.query).items()}
+
+        if path == "/ingest":
+            if method != "POST":
+                raise HTTPError(405, "use POST")
+            return await self.ingest(headers, body)
+        if path == "/sync":
+            if method != "POST":
+                raise HTTPError(405, "use POST")
+            return await self.sync(headers, body)
+        if method not in ("GET", "HEAD"):
+            raise HTTPError(405, "use GET")
+
+        if path == "/matches":
+            date_from, date_to = params.get("from"), params.get("to")
+            for value in (date_from, date_to):
+                if not value or not DATE_RE.match(value):
+                    raise HTTPError(400, "from and to are required as YYYY-MM-DD")
+            try:
+                limit = min(int(params.get("limit", 1000)), 10000)
+            except ValueError:
+                raise HTTPError(400, "limit must be a number")
+            compute = lambda: self.reads.run(query_matches, date_from, date_to, params.get("league"),
+                                             params.get("role"), params.get("referee"), limit)
+        elif path.startswith("/day/"):
+            date = path[len("/day/"):]
+            if not DATE_RE.match(date):
+                raise HTTPError(400, "expected /day/YYYY-MM-DD")
+            compute = lambda: self.reads.run(query_day, date, params.get("referee"))
+        elif path == "/stats":
+            by = params.get("by", "month")
+            if by not in ("week", "month", "season", "year", "league", "role", "division", "referee"):
+                raise HTTPError(400, f"unknown breakdown: {by}")
+            year = params.get("year")
+            if year and not year.isdigit():
+                raise HTTPError(400, "year must be a number")
+            compute = lambda: self.reads.run(query_stats, by, year, params.get("referee"))
+        elif path == "/calendar.ics":
+            for value in (params.get("from"), params.get("to")):
+                if value and not DATE_RE.match(value):
+                    raise HTTPError(400, "from and to are YYYY-MM-DD")
+            compute = lambda: self.reads.run(query_calendar, params.get("from"), params.get("to"))
+            content_type = "text/calendar; charset=utf-8"
+        elif path == "/version":
+            compute = None
+        else:
+            raise HTTPError(404, "not found")
+
+        version = self.current_version()
+        etag = f'"{version}"'
+        extra = {"ETag": etag, "Cache-Control": "no-cache", "Content-Type": content_type}
+        if etag in [tag.strip() for tag in headers.get("if-none-match", "").split(",")]:
+            return 304, extra, b""
+        if compute is None:
+            return 200, extra, dump({"data_version": version})
+        return 200, extra, await self.cached(target, compute)
+
+    async def ingest(self, headers, body):
+        if self.token and headers.get("authorization") != f"Bearer {self.token}":
+            raise HTTPError(401, "missing or wrong token")
+        from refsys.parsing import parse_text_to_match_data
+        text = body.decode("utf-8", errors="replace")
+        # dateparser is slow and synchronous, keep it off the event loop
+        matches = await asyncio.get_running_loop().run_in_executor(None, parse_text_to_match_data, text)
+        if not matches:
+            raise HTTPError(422, "no matches recognized in the text")
+        added, conflicts = await self.writes.submit(matches)
+        return 201 if added else 200, {}, dump({"added": added, "conflicts": conflicts})
+
+    async def sync(self, headers, body):
+        from refsys.sync import SyncError, exchange
+        if self.token and headers.get("authorization") != f"Bearer {self.token}":
+            raise HTTPError(401, "missing or wrong token")
+        try:
+            request = json.loads(body)
+        except ValueError:
+            raise HTTPError(400, "body must be JSON")
+        try:
+            answer = await self.writes.run(exchange, request, self.sync_policies)
+        except SyncError as e:
+            raise HTTPError(409, str(e))
+        return 200, {}, dump(answer)
+
+    async def handle(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                try:
+                    method, target, version = request_line.decode("latin-1").split()
+                except ValueError:
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+
+                keep_alive = version == "HTTP/1.1" and headers.get("connection", "").lower() != "close"
+                try:
+                    length = int(headers.get("content-length") or 0)
+                    if length > MAX_BODY:
+                        keep_alive = False
+                        raise HTTPError(413, "body too large")
+                    body = await reader.readexactly(length) if length else b""
+                    status, extra, payload = await self.dispatch(method, target, headers, body)
+                except HTTPError as e:
+                    status, extra, payload = e.status, {}, dump({"error": str(e)})
+                except ValueError:
+                    status, extra, payload = 400, {}, dump({"error": "bad request"})
+                    keep_alive = False
+                except Exception:
+                    logger.exception("%s %s failed", method, target)
+                    status, extra, payload = 500, {}, dump({"error": "internal error"})
+
+                extra.setdefault("Content-Type", "application/json; charset=utf-8")
+                head = [f"HTTP/1.1 {status} {STATUS_TEXT.get(status, '')}",
+                        f"Content-Length: {len(payload)}",
+                        f"Connection: {'keep-alive' if keep_alive else 'close'}"]
+                head += [f"{name}: {value}" for name, value in extra.items()]
+                writer.write(("\r\n".join(head) + "\r\n\r\n").encode("latin-1"))
+                if method != "HEAD":
+                    writer.write(payload)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host="127.0.0.1", port=8765):
+        self.writes.start()
+        server = await asyncio.start_server(self.handle, host, port)
+        for sock in server.sockets:
+            print(f"Serving matches on http://{sock.getsockname()[0]}:{sock.getsockname()[1]}/")
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            await self.writes.close()
+            self.reads.close()
+            self._changes.close()
+
+def serve(host="127.0.0.1", port=8765, readers=4, token=None, sync_policies=None):
+    try:
+        asyncio.run(MatchServer(readers=readers, token=token, sync_policies=sync_policies).serve(host, port))
+    except KeyboardInterrupt:
+        pass
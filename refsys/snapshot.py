@@ -0,0 +1,227 @@
+"""Columnar snapshot of matches.db for notebooks: one .npy file per column, memory-mapped on load.
+
+    snap/
+      manifest.json            data_version, segment list, dictionaries
+      seg-000000/id.npy ...    base segment, ordered by date and start time
+      seg-000001/...           rows changed since the previous snapshot, plus deleted.npy (tombstones)
+
+league, role, division and venue are stored as int32 codes into the manifest's dictionaries,
+which only ever grow, so codes mean the same thing in every segment. Each run appends one
+delta segment; compaction folds the deltas back into a single base segment.
+
+    from refsys.snapshot import load_snapshot
+    snap = load_snapshot("snap")
+    snap["amount"][snap["day"] >= np.datetime64("2024-01-01")].sum()
+    snap.labels("league")      # decoded strings
+"""
+import json
+import os
+import shutil
+
+import numpy as np
+
+from refsys import storage
+
+FORMAT = 1
+MANIFEST = "manifest.json"
+MAX_SEGMENTS = 8
+DICTIONARY_COLUMNS = {"league": "league", "role": "role", "division": "division", "venue": "location"}
+# name -> dtype; day is datetime64[D], times are minutes after midnight (-1 when missing)
+COLUMNS = {
+    "id": np.int64,
+    "day": "datetime64[D]",
+    "start_minute": np.int16,
+    "end_minute": np.int16,
+    "amount": np.float64,
+    "league": np.int32,
+    "role": np.int32,
+    "division": np.int32,
+    "venue": np.int32,
+    "row_version": np.int64,
+}
+QUERY = """SELECT id, date, start_time, end_time, COALESCE(amount, 0), COALESCE(league, ''), COALESCE(role, ''),
+                  COALESCE(division, ''), COALESCE(location, ''), COALESCE(row_version, 0)
+           FROM matches WHERE date GLOB '[0-9][0-9][0-9][0-9]-[0-9][0-9]-[0-9][0-9]'"""
+
+def minutes(text):
+    try:
+        hours, mins = text.split(":")[:2]
+        return int(hours) * 60 + int(mins)
+    except (AttributeError, ValueError):
+        return -1
+
+class Dictionary:
+    def __init__(self, values=()):
+        self.values = list(values)
+        self.codes = {v: i for i, v in enumerate(self.values)}
+
+    def encode(self, value):
+        code = self.codes.get(value)
+        if code is None:
+            code = self.codes[value] = len(self.values)
+            self.values.append(value)
+        return code
+
+def read_manifest(path):
+    try:
+        with open(os.path.join(path, MANIFEST), encoding="utf-8") as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return manifest if manifest.get("format") == FORMAT else None
+
+def write_manifest(path, manifest):
+    tmp = os.path.join(path, MANIFEST + ".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=1)
+    os.replace(tmp, os.path.join(path, MANIFEST))
+
+def write_segment(path, name, columns, deleted=None):
+    directory = os.path.join(path, name)
+    os.makedirs(directory, exist_ok=True)
+    for column, values in columns.items():
+        np.save(os.path.join(directory, column + ".npy"), values)
+    if deleted is not None and len(deleted):
+        np.save(os.path.join(directory, "deleted.npy"), deleted)
+
+def read_rows(cursor, dictionaries, chunk_size=5000):
+    """Column arrays for the rows under cursor, encoding text columns into dictionaries."""
+    buffers = {name: [] for name in COLUMNS}
+    while True:
+        rows = cursor.fetchmany(chunk_size)
+        if not rows:
+            break
+        for match_id, date, start, end, amount, league, role, division, venue, version in rows:
+            buffers["id"].append(match_id)
+            buffers["day"].append(date)
+            buffers["start_minute"].append(minutes(start))
+            buffers["end_minute"].append(minutes(end))
+            buffers["amount"].append(amount)
+            buffers["league"].append(dictionaries["league"].encode(league))
+            buffers["role"].append(dictionaries["role"].encode(role))
+            buffers["division"].append(dictionaries["division"].encode(division))
+            buffers["venue"].append(dictionaries["venue"].encode(venue))
+            buffers["row_version"].append(version)
+    return {name: np.array(values, dtype=COLUMNS[name]) for name, values in buffers.items()}
+
+def ordered(columns):
+    order = np.lexsort((columns["id"], columns["start_minute"], columns["day"]))
+    return {name: values[order] for name, values in columns.items()}
+
+class Snapshot:
+    """Column arrays (memory-mapped when there is a single segment) plus their dictionaries."""
+
+    def __init__(self, columns, dictionaries, version):
+        self.columns = columns
+        self.dictionaries = dictionaries
+        self.version = version
+
+    def __getitem__(self, name):
+        return self.columns[name]
+
+    def __len__(self):
+        return len(self.columns["id"])
+
+    def labels(self, name):
+        return np.array(self.dictionaries[name], dtype=str)[self.columns[name]]
+
+def load_segments(path, manifest, mmap=True):
+    mode = "r" if mmap else None
+    segments = []
+    for segment in manifest["segments"]:
+        directory = os.path.join(path, segment["name"])
+        columns = {name: np.load(os.path.join(directory, name + ".npy"), mmap_mode=mode) for name in COLUMNS}
+        deleted_path = os.path.join(directory, "deleted.npy")
+        deleted = np.load(deleted_path) if os.path.exists(deleted_path) else np.empty(0, np.int64)
+        segments.append((columns, deleted))
+    return segments
+
+def merge_segments(segments):
+    """Latest version of every live row across base + delta segments, ordered by day and start."""
+    if len(segments) == 1:
+        return segments[0][0]
+    ids = np.concatenate([c["id"] for c, _ in segments])
+    seg = np.concatenate([np.full(len(c["id"]), i) for i, (c, _) in enumerate(segments)])
+    # last occurrence of each id: sort by (id, segment) and keep the end of each run
+    order = np.lexsort((seg, ids))
+    last = np.ones(len(order), bool)
+    last[:-1] = ids[order][1:] != ids[order][:-1]
+    keep = order[last]
+
+    tomb_ids = np.concatenate([d for _, d in segments])
+    if len(tomb_ids):
+        tomb_seg = np.concatenate([np.full(len(d), i) for i, (_, d) in enumerate(segments)])
+        t_order = np.lexsort((tomb_seg, tomb_ids))
+        t_last = np.ones(len(t_order), bool)
+        t_last[:-1] = tomb_ids[t_order][1:] != tomb_ids[t_order][:-1]
+        dead_ids, dead_seg = tomb_ids[t_order][t_last], tomb_seg[t_order][t_last]
+        pos = np.minimum(np.searchsorted(dead_ids, ids[keep]), len(dead_ids) - 1)
+        # a tombstone only removes rows from earlier segments; a row in the same segment was re-added
+        dead = (dead_ids[pos] == ids[keep]) & (dead_seg[pos] > seg[keep])
+        keep = keep[~dead]
+
+    return ordered({name: np.concatenate([c[name] for c, _ in segments])[keep] for name in COLUMNS})
+
+def load_snapshot(path, mmap=True):
+    manifest = read_manifest(path)
+    if manifest is None:
+        raise FileNotFoundError(f"no snapshot in {path}")
+    columns = merge_segments(load_segments(path, manifest, mmap))
+    return Snapshot(columns, manifest["dictionaries"], manifest["version"])
+
+def compact(path, manifest):
+    """Rewrites all segments as one base segment; returns the new manifest."""
+    columns = merge_segments(load_segments(path, manifest, mmap=False))
+    name = f"seg-{manifest['next_segment']:06d}"
+    write_segment(path, name, columns)
+    old = [s["name"] for s in manifest["segments"]]
+    manifest = dict(manifest, segments=[{"name": name, "rows": len(columns["id"]), "version": manifest["version"]}],
+                    next_segment=manifest["next_segment"] + 1)
+    write_manifest(path, manifest)
+    for segment in old:
+        shutil.rmtree(os.path.join(path, segment), ignore_errors=True)
+    return manifest
+
+def write_snapshot(path, conn=None, rebuild=False, compact_after=MAX_SEGMENTS):
+    """Brings the snapshot in path up to date; returns (rows written, tombstones written, manifest)."""
+    own = conn is None
+    conn = conn or storage.connect()
+    try:
+        os.makedirs(path, exist_ok=True)
+        version = storage.read_data_version(conn)
+        manifest = None if rebuild else read_manifest(path)
+        if manifest is not None and version < manifest["version"]:
+            manifest = None  # a different or restored database
+        if manifest is not None and version == manifest["version"]:
+            return 0, 0, manifest
+
+        old = None
+        if manifest is None:
+            old = read_manifest(path)
+            dictionaries = {name: Dictionary() for name in DICTIONARY_COLUMNS}
+            columns = ordered(read_rows(conn.execute(QUERY), dictionaries))
+            deleted = None
+            manifest = {"format": FORMAT, "segments": [], "next_segment": old["next_segment"] if old else 0}
+        else:
+            dictionaries = {name: Dictionary(values) for name, values in manifest["dictionaries"].items()}
+            columns = read_rows(conn.execute(QUERY + " AND row_version>? ORDER BY id", (manifest["version"],)),
+                                dictionaries)
+            deleted = np.array([row[0] for row in conn.execute(
+                "SELECT id FROM deleted_matches WHERE version>?", (manifest["version"],))], dtype=np.int64)
+    finally:
+        if own:
+            conn.close()
+
+    name = f"seg-{manifest['next_segment']:06d}"
+    write_segment(path, name, columns, deleted)
+    manifest = dict(manifest, version=version, next_segment=manifest["next_segment"] + 1,
+                    dictionaries={n: d.values for n, d in dictionaries.items()})
+    manifest["segments"] = manifest["segments"] + [{"name": name, "rows": len(columns["id"]), "version": version,
+                                                    "deleted": 0 if deleted is None else len(deleted)}]
+    write_manifest(path, manifest)
+    if old:  # full rebuild over an older snapshot
+        for segment in old["segments"]:
+            shutil.rmtree(os.path.join(path, segment["name"]), ignore_errors=True)
+    if len(manifest["segments"]) > compact_after:
+        manifest = compact(path, manifest)
+    return len(columns["id"]), 0 if deleted is None else len(deleted), manifest
@@ -0,0 +1,304 @@
+"""Earnings statistics over matches.db with NumPy: per-filter frames, period series and the earnings cube."""
+from collections import OrderedDict
+from datetime import datetime
+
+import numpy as np
+
+from refsys import storage
+from refsys.storage import connect
+
+def group_by(labels, amounts):
+    # (keys, totals, counts) for each distinct label
+    keys, inverse = np.unique(labels, return_inverse=True)
+    totals = np.bincount(inverse, weights=amounts, minlength=len(keys))
+    counts = np.bincount(inverse, minlength=len(keys))
+    return keys, totals, counts
+
+class StatsFrame:
+    """Columnar snapshot of the matches behind one stats filter, with every breakdown precomputed."""
+
+    def __init__(self, days, leagues, roles, divisions, amounts, referees=None):
+        self.days = days            # datetime64[D]
+        self.leagues = leagues
+        self.roles = roles
+        self.divisions = divisions
+        self.amounts = amounts
+        self.referees = referees if referees is not None else np.full(len(amounts), "", dtype=str)
+
+        self.count = len(amounts)
+        self.total = float(amounts.sum())
+        self.average = self.total / self.count if self.count else 0.0
+
+        months = days.astype("datetime64[M]")
+        month_keys, self.month_totals, self.month_counts = group_by(months, amounts)
+        self.months = [str(m) for m in month_keys]
+        self.league_names, self.league_totals, self.league_counts = group_by(leagues, amounts)
+        self.role_names, self.role_totals, self.role_counts = group_by(roles, amounts)
+        self.division_names, self.division_totals, self.division_counts = group_by(divisions, amounts)
+        self.referee_names, self.referee_totals, self.referee_counts = group_by(self.referees, amounts)
+
+def load_stats_frame(year=None, referee_id=None):
+    query = """SELECT m.date, COALESCE(m.league, ''), COALESCE(m.role, ''), COALESCE(m.division, ''),
+                      COALESCE(m.amount, 0), COALESCE(r.name, '')
+               FROM matches m LEFT JOIN referees r ON r.id=m.referee_id
+               WHERE m.date GLOB '[0-9][0-9][0-9][0-9]-[0-9][0-9]-[0-9][0-9]'"""
+    params = []
+    if year:
+        query += " AND m.date BETWEEN ? AND ?"
+        params = [f"{year}-01-01", f"{year}-12-31"]
+    if referee_id is not None:
+        query += " AND m.referee_id=?"
+        params.append(referee_id)
+    conn = connect()
+    rows = conn.execute(query, params).fetchall()
+    conn.close()
+
+    if rows:
+        dates, leagues, roles, divisions, amounts, referees = zip(*rows)
+    else:
+        dates = leagues = roles = divisions = amounts = referees = ()
+    return StatsFrame(
+        np.array(dates, dtype="datetime64[D]"),
+        np.array(leagues, dtype=str),
+        np.array(roles, dtype=str),
+        np.array(divisions, dtype=str),
+        np.array(amounts, dtype=float),
+        np.array(referees, dtype=str),
+    )
+
+def window_sums(cum, ends, days):
+    """Sums over the `days` days before each end index, from a cumulative array with a leading 0."""
+    return cum[ends] - cum[np.maximum(ends - days, 0)]
+
+class PeriodStats:
+    """Weekly, season and calendar-year totals plus rolling windows.
+
+    Everything comes from two cumulative sums over a dense per-day array (index 0 is the
+    Monday on or before the first match), so any period total is cum[end] - cum[start].
+    """
+
+    def __init__(self, days, amounts):
+        if len(days):
+            first = days.min()
+            # datetime64 day 0 (1970-01-01) was a Thursday
+            self.start = first - (first.astype(int) + 3) % 7
+            index = (days - self.start).astype(int)
+            size = (int(index.max()) // 7 + 1) * 7
+        else:
+            self.start = np.datetime64("1970-01-05")
+            index = np.zeros(0, dtype=int)
+            size = 0
+        self.size = size
+        self.amount_cum = np.concatenate(([0.0], np.cumsum(np.bincount(index, weights=amounts, minlength=size))))
+        self.count_cum = np.concatenate(([0], np.cumsum(np.bincount(index, minlength=size))))
+
+        # weeks (Monday to Sunday) with trailing 4- and 12-week windows ending on each Sunday
+        bounds = np.arange(0, size + 1, 7)
+        ends = bounds[1:]
+        self.week_starts = self.start + bounds[:-1]
+        self.week_totals = np.diff(self.amount_cum[bounds])
+        self.week_counts = np.diff(self.count_cum[bounds])
+        self.rolling_totals = {w: window_sums(self.amount_cum, ends, w * 7) for w in (4, 12)}
+        self.rolling_counts = {w: window_sums(self.count_cum, ends, w * 7) for w in (4, 12)}
+
+        first_year = int(str(self.start)[:4])
+        last_year = int(str(self.start + max(size - 1, 0))[:4])
+        # seasons run September to June (see season_start_year), so they split on September 1st
+        self.seasons, self.season_totals, self.season_counts = self._split(
+            range(first_year - 1, last_year + 1), "-09-01")
+        self.years, self.year_totals, self.year_counts = self._split(range(first_year, last_year + 1), "-01-01")
+
+    def _split(self, years, boundary):
+        edges = np.array([f"{y:04d}{boundary}" for y in list(years) + [years[-1] + 1]], dtype="datetime64[D]")
+        edges = np.clip((edges - self.start).astype(int), 0, self.size)
+        totals = np.diff(self.amount_cum[edges])
+        counts = np.diff(self.count_cum[edges])
+        keep = counts > 0
+        return [y for y, k in zip(years, keep) if k], totals[keep], counts[keep]
+
+    def weeks_in(self, year=None, last=52):
+        """Week indexes for one calendar year (by week start), or the latest `last` weeks."""
+        if year:
+            starts = self.week_starts.astype("datetime64[Y]").astype(int) + 1970
+            return np.flatnonzero(starts == int(year))
+        return np.arange(max(len(self.week_starts) - last, 0), len(self.week_starts))
+
+    @staticmethod
+    def changes(values):
+        """Relative change against the previous entry; None where there is nothing to compare."""
+        return [None] + [(b - a) / a if a else None for a, b in zip(values[:-1], values[1:])]
+
+class StatsEngine:
+    """One scan per (filter, data version); every table and chart reads the same frame."""
+
+    def __init__(self, capacity=8):
+        self.capacity = capacity
+        self._frames = OrderedDict()
+        self._periods = None
+
+    def frame(self, year=None, referee_id=None):
+        key = (year, referee_id, storage.DATA_VERSION)
+        if key not in self._frames:
+            self._frames[key] = load_stats_frame(year, referee_id)
+            while len(self._frames) > self.capacity:
+                self._frames.popitem(last=False)
+        self._frames.move_to_end(key)
+        return self._frames[key]
+
+    def periods(self, referee_id=None):
+        # always over every year: year-over-year and rolling windows look past the selected year
+        key = (referee_id, storage.DATA_VERSION)
+        if self._periods is None or self._periods[0] != key:
+            frame = self.frame(None, referee_id)
+            self._periods = (key, PeriodStats(frame.days, frame.amounts))
+        return self._periods[1]
+
+STATS_ENGINE = StatsEngine()
+
+# ---------- Earnings cube ----------
+def season_start_year(year, month):
+    # soccer season runs September to June; summer games count toward the season just ended
+    return year if month >= 9 else year - 1
+
+WEEKDAYS = ("Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun")
+CUBE_DIMENSIONS = ("year", "season", "month", "week", "weekday", "league", "division", "role", "venue", "referee")
+# cuboids materialized per month; anything else is answered from the nearest superset or the base rows
+COMMON_CUBOIDS = (
+    (),
+    ("year",),
+    ("year", "month"),
+    ("season",),
+    ("year", "league"),
+    ("year", "role"),
+    ("season", "league", "division", "role"),
+    ("year", "weekday", "league", "division", "role"),
+    ("year", "week"),
+    ("venue",),
+    ("year", "referee"),
+)
+
+def cube_members(date_str, league, division, role, venue, referee=""):
+    day = datetime.strptime(date_str, "%Y-%m-%d").date()
+    iso_year, iso_week, iso_weekday = day.isocalendar()
+    start = season_start_year(day.year, day.month)
+    return (
+        str(day.year),
+        f"{start}/{str(start + 1)[-2:]}",
+        f"{day.year:04d}-{day.month:02d}",
+        f"{iso_year:04d}-W{iso_week:02d}",
+        WEEKDAYS[iso_weekday - 1],
+        league or "",
+        division or "",
+        role or "",
+        venue or "",
+        referee or "",
+    )
+
+class EarningsCube:
+    """Slice and dice earnings by any mix of CUBE_DIMENSIONS.
+
+    Pre-aggregated cuboids are kept per calendar month, so a write only
+    rebuilds the months it touched; queries merge the month partitions of
+    the smallest cuboid that covers the requested dimensions.
+    """
+
+    def __init__(self, cuboids=COMMON_CUBOIDS):
+        self.cuboids = [tuple(c) for c in cuboids]
+        self._positions = {c: tuple(CUBE_DIMENSIONS.index(d) for d in c) for c in self.cuboids}
+        self._partitions = {}   # (year, month) -> {"rows": [...], "cuboids": {dims: {key: [count, total]}}}
+        self._dirty = set()
+        self._built = False
+
+    def _load(self, where="", params=()):
+        conn = connect()
+        rows = conn.execute(
+            f"""SELECT m.date, m.league, m.division, m.role, m.location, r.name, COALESCE(m.amount, 0)
+                FROM matches m LEFT JOIN referees r ON r.id=m.referee_id
+                WHERE m.date GLOB '[0-9][0-9][0-9][0-9]-[0-9][0-9]-[0-9][0-9]' {where}""", params).fetchall()
+        conn.close()
+        partitions = {}
+        for date_str, league, division, role, venue, referee, amount in rows:
+            try:
+                members = cube_members(date_str, league, division, role, venue, referee)
+            except ValueError:
+                continue
+            key = (int(date_str[:4]), int(date_str[5:7]))
+            partitions.setdefault(key, []).append((members, amount))
+        return partitions
+
+    def _aggregate(self, rows):
+        cuboids = {}
+        for dims, positions in self._positions.items():
+            cells = cuboids[dims] = {}
+            for members, amount in rows:
+                cell = cells.setdefault(tuple(members[i] for i in positions), [0, 0.0])
+                cell[0] += 1
+                cell[1] += amount
+        return {"rows": rows, "cuboids": cuboids}
+
+    def build(self):
+        self._partitions = {key: self._aggregate(rows) for key, rows in self._load().items()}
+        self._dirty.clear()
+        self._built = True
+
+    def invalidate_dates(self, *dates):
+        if not dates:
+            # a write from another process: which months it touched is unknown, rebuild on next query
+            self._built = False
+        for date_str in dates:
+            try:
+                day = datetime.strptime(date_str, "%Y-%m-%d")
+            except (TypeError, ValueError):
+                continue
+            self._dirty.add((day.year, day.month))
+
+    def refresh(self):
+        if not self._built:
+            self.build()
+            return
+        for year, month in sorted(self._dirty):
+            rows = self._load("AND m.date BETWEEN ? AND ?",
+                              (f"{year:04d}-{month:02d}-01", f"{year:04d}-{month:02d}-31")).get((year, month))
+            if rows:
+                self._partitions[(year, month)] = self._aggregate(rows)
+            else:
+                self._partitions.pop((year, month), None)
+        self._dirty.clear()
+
+    def query(self, group_by=(), filters=None):
+        """{members of group_by: (count, total)} for rows matching filters ({dimension: value or values})."""
+        self.refresh()
+        filters = {dim: (set(v) if isinstance(v, (list, tuple, set)) else {v})
+                   for dim, v in (filters or {}).items()}
+        for dim in list(group_by) + list(filters):
+            if dim not in CUBE_DIMENSIONS:
+                raise ValueError(f"Unknown dimension: {dim}")
+        needed = set(group_by) | set(filters)
+
+        # smallest materialized cuboid covering every dimension asked about
+        candidates = [c for c in self.cuboids if needed <= set(c)]
+        source = min(candidates, key=self._cuboid_size) if candidates else None
+
+        result = {}
+        for partition in self._partitions.values():
+            if source is not None:
+                cells = partition["cuboids"][source].items()
+                dims = source
+            else:
+                cells = ((members, (1, amount)) for members, amount in partition["rows"])
+                dims = CUBE_DIMENSIONS
+            index = {dim: i for i, dim in enumerate(dims)}
+            for members, (count, total) in cells:
+                if any(members[index[dim]] not in values for dim, values in filters.items()):
+                    continue
+                key = tuple(members[index[dim]] for dim in group_by)
+                cell = result.setdefault(key, [0, 0.0])
+                cell[0] += count
+                cell[1] += total
+        return {key: (count, total) for key, (count, total) in result.items()}
+
+    def _cuboid_size(self, dims):
+        return sum(len(p["cuboids"][dims]) for p in self._partitions.values())
+
+EARNINGS_CUBE = EarningsCube()
+storage.on_matches_changed(EARNINGS_CUBE.invalidate_dates)
@@ -0,0 +1,367 @@
+"""matches.db: connections, schema upgrades and change notification."""
+import hashlib
+import sqlite3
+import time
+from collections import OrderedDict
+from datetime import datetime
+
+DB_PATH = "matches.db"
+
+# QDate.toJulianDay() of date.fromordinal(1)
+JULIAN_DAY_OFFSET = 1721425
+
+# seconds a connection waits for another process's write lock before "database is locked"
+BUSY_TIMEOUT = 10.0
+
+def connect(path=None, **kwargs):
+    return sqlite3.connect(path or DB_PATH, timeout=BUSY_TIMEOUT, **kwargs)
+
+# user-editable columns; a change to any of them gives the row a new row_version
+MATCH_FIELDS = ("league", "role", "subject", "content", "date", "start_time", "end_time", "location", "amount", "division",
+                "referee_id")
+
+# matches columns as they travel between devices (refsys.sync); referee_id goes by the referee's name
+SYNC_FIELDS = tuple("referee" if f == "referee_id" else f for f in MATCH_FIELDS)
+NOW_MS_SQL = "CAST((julianday('now') - 2440587.5) * 86400000 AS INTEGER)"
+# skip logging while refsys.sync applies changes that came from another device
+NOT_APPLYING_SQL = "NOT EXISTS (SELECT 1 FROM meta WHERE key='sync_applying' AND value)"
+
+def sync_value_sql(field, row):
+    if field == "referee":
+        return f"(SELECT name FROM referees WHERE id={row}.referee_id)"
+    return f"{row}.{field}"
+
+def log_change_sql(uid, field, value, base=True):
+    """Trigger statements appending one local change to change_log and making it the field's version.
+
+    The clock is a hybrid logical clock: wall-clock milliseconds, but always past anything seen before.
+    base is the version this change overwrites (the field's, else the row's insert), used to spot
+    concurrent edits when the change reaches another device.
+    """
+    if base:
+        version = "(SELECT {0} FROM field_versions WHERE uid={1} AND field IN ('{2}', '*') ORDER BY field='*' LIMIT 1)"
+        base_device, base_seq = version.format("device", uid, field), version.format("seq", uid, field)
+    else:
+        base_device = base_seq = "NULL"
+    return f'''UPDATE sync_device SET seq=seq+1;
+               UPDATE meta SET value=MAX(value+1, {NOW_MS_SQL}) WHERE key='sync_clock';
+               INSERT INTO change_log (device, seq, uid, field, value, ts, base_device, base_seq)
+                   SELECT id, seq, {uid}, '{field}', {value}, (SELECT value FROM meta WHERE key='sync_clock'),
+                          {base_device}, {base_seq} FROM sync_device;
+               INSERT OR REPLACE INTO field_versions (uid, field, ts, device, seq)
+                   SELECT {uid}, '{field}', (SELECT value FROM meta WHERE key='sync_clock'), id, seq FROM sync_device;'''
+
+START_TS_SQL = "COALESCE(CAST(strftime('%s', {row}.date || ' ' || COALESCE({row}.start_time, '00:00')) AS INTEGER), 0)"
+
+def init_db(path=None):
+    conn = connect(path)
+    cursor = conn.cursor()
+    cursor.execute('''CREATE TABLE IF NOT EXISTS matches
+                      (id INTEGER PRIMARY KEY, league TEXT, role TEXT, subject TEXT, content TEXT,
+                      date TEXT, start_time TEXT, end_time TEXT, location TEXT, amount REAL)''')
+    conn.commit()
+    conn.close()
+
+def update_db_structure(path=None):
+    conn = connect(path)
+    cursor = conn.cursor()
+    # WAL: readers never block the writer and vice versa, so the GUI, the tray app, the CLI and the
+    # server can share matches.db. The mode sticks to the file; if another process holds it right now,
+    # the next start switches it.
+    try:
+        cursor.execute("PRAGMA journal_mode=WAL")
+    except sqlite3.OperationalError:
+        pass
+    try:
+        cursor.execute('ALTER TABLE matches ADD COLUMN amount REAL')
+    except sqlite3.OperationalError:
+        pass
+    try:
+        cursor.execute('ALTER TABLE matches ADD COLUMN division TEXT')
+    except sqlite3.OperationalError:
+        pass
+    cursor.execute('''CREATE TABLE IF NOT EXISTS reprice_log
+                      (id INTEGER PRIMARY KEY, batch TEXT, match_id INTEGER, old_amount REAL, new_amount REAL,
+                      created_at TEXT DEFAULT CURRENT_TIMESTAMP)''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_matches_date ON matches(date)')
+    # start_ts: sortable start timestamp kept in sync by triggers, used by the agenda cursor
+    try:
+        cursor.execute('ALTER TABLE matches ADD COLUMN start_ts INTEGER')
+    except sqlite3.OperationalError:
+        pass
+    cursor.execute(f"UPDATE matches SET start_ts={START_TS_SQL.format(row='matches')} WHERE start_ts IS NULL")
+    cursor.execute(f'''CREATE TRIGGER IF NOT EXISTS matches_start_ts_insert AFTER INSERT ON matches
+                      BEGIN
+                          UPDATE matches SET start_ts={START_TS_SQL.format(row='NEW')} WHERE id=NEW.id;
+                      END''')
+    cursor.execute(f'''CREATE TRIGGER IF NOT EXISTS matches_start_ts_update AFTER UPDATE OF date, start_time ON matches
+                      BEGIN
+                          UPDATE matches SET start_ts={START_TS_SQL.format(row='NEW')} WHERE id=NEW.id;
+                      END''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_matches_start_ts ON matches(start_ts, id)')
+    # data_version: bumped by triggers on every write from any process (GUI, Tk, CLI, server)
+    cursor.execute('CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER)')
+    cursor.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('data_version', 0)")
+    for event in ("INSERT", "UPDATE", "DELETE"):
+        cursor.execute(f'''CREATE TRIGGER IF NOT EXISTS matches_data_version_{event.lower()} AFTER {event} ON matches
+                          BEGIN
+                              UPDATE meta SET value=value+1 WHERE key='data_version';
+                          END''')
+    # row_version: data_version of the row's last change; deleted ids keep theirs in deleted_matches,
+    # so exporters can pick up only what changed since the version they last saw
+    try:
+        cursor.execute('ALTER TABLE matches ADD COLUMN row_version INTEGER DEFAULT 0')
+    except sqlite3.OperationalError:
+        pass
+    cursor.execute('CREATE TABLE IF NOT EXISTS deleted_matches (id INTEGER PRIMARY KEY, version INTEGER)')
+    stamp = '''UPDATE meta SET value=value+1 WHERE key='data_version';
+               UPDATE matches SET row_version=(SELECT value FROM meta WHERE key='data_version') WHERE id=NEW.id;'''
+    cursor.execute(f'''CREATE TRIGGER IF NOT EXISTS matches_row_version_insert AFTER INSERT ON matches
+                      BEGIN
+                          {stamp}
+                      END''')
+    # multi-referee: NULL referee_id is the single-user case (or a game nobody has been given yet)
+    cursor.execute('''CREATE TABLE IF NOT EXISTS referees
+                      (id INTEGER PRIMARY KEY, name TEXT NOT NULL UNIQUE COLLATE NOCASE, email TEXT,
+                      max_per_day INTEGER, max_per_week INTEGER, active INTEGER DEFAULT 1)''')
+    try:
+        cursor.execute('ALTER TABLE matches ADD COLUMN referee_id INTEGER REFERENCES referees(id)')
+    except sqlite3.OperationalError:
+        pass
+    # grade: 1 (grassroots) and up, checked against pricing.TIER_GRADES when assigning; NULL counts as 1
+    try:
+        cursor.execute('ALTER TABLE referees ADD COLUMN grade INTEGER')
+    except sqlite3.OperationalError:
+        pass
+    # availability windows; a referee with no window on a date isn't offered games that day
+    cursor.execute('''CREATE TABLE IF NOT EXISTS availability
+                      (id INTEGER PRIMARY KEY, referee_id INTEGER NOT NULL REFERENCES referees(id),
+                      date TEXT NOT NULL, start_time TEXT NOT NULL, end_time TEXT NOT NULL)''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_availability_date ON availability(date, referee_id)')
+    # per-referee day views / conflict checks, and per-referee agenda paging
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_matches_referee_date ON matches(referee_id, date, start_time)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_matches_referee_start_ts ON matches(referee_id, start_ts)')
+    # recreated so its column list follows MATCH_FIELDS
+    cursor.execute('DROP TRIGGER IF EXISTS matches_row_version_update')
+    cursor.execute(f'''CREATE TRIGGER matches_row_version_update
+                      AFTER UPDATE OF {', '.join(MATCH_FIELDS)} ON matches
+                      BEGIN
+                          {stamp}
+                      END''')
+    cursor.execute('''CREATE TRIGGER IF NOT EXISTS matches_row_version_delete AFTER DELETE ON matches
+                      BEGIN
+                          UPDATE meta SET value=value+1 WHERE key='data_version';
+                          INSERT OR REPLACE INTO deleted_matches (id, version)
+                              VALUES (OLD.id, (SELECT value FROM meta WHERE key='data_version'));
+                      END''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_matches_row_version ON matches(row_version)')
+    # sync: every change to matches goes into change_log under this database's device id and the
+    # next sequence number; rows are identified across devices by uid
+    try:
+        cursor.execute('ALTER TABLE matches ADD COLUMN uid TEXT')
+    except sqlite3.OperationalError:
+        pass
+    # rows from before sync: same id and content give the same uid in every copy of the file
+    conn.create_function('legacy_uid', 4, lambda *parts: hashlib.sha1(
+        "|".join(str(p) for p in parts).encode('utf-8')).hexdigest()[:32])
+    cursor.execute('UPDATE matches SET uid=legacy_uid(id, date, start_time, subject) WHERE uid IS NULL')
+    cursor.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_matches_uid ON matches(uid)')
+    cursor.execute('CREATE TABLE IF NOT EXISTS sync_device (id TEXT PRIMARY KEY, seq INTEGER NOT NULL DEFAULT 0)')
+    cursor.execute("INSERT INTO sync_device (id) SELECT lower(hex(randomblob(8))) WHERE NOT EXISTS (SELECT 1 FROM sync_device)")
+    cursor.execute('''CREATE TABLE IF NOT EXISTS change_log
+                      (id INTEGER PRIMARY KEY, device TEXT NOT NULL, seq INTEGER NOT NULL, uid TEXT NOT NULL,
+                      field TEXT NOT NULL, value, ts INTEGER NOT NULL, base_device TEXT, base_seq INTEGER,
+                      UNIQUE (device, seq))''')
+    cursor.execute('''CREATE TABLE IF NOT EXISTS field_versions
+                      (uid TEXT, field TEXT, ts INTEGER, device TEXT, seq INTEGER, PRIMARY KEY (uid, field))
+                      WITHOUT ROWID''')
+    # highest seq seen from every other device; with sync_device.seq this is the version vector
+    cursor.execute('CREATE TABLE IF NOT EXISTS sync_vv (device TEXT PRIMARY KEY, seq INTEGER NOT NULL)')
+    cursor.execute('CREATE TABLE IF NOT EXISTS sync_peers (peer TEXT PRIMARY KEY, vv TEXT, synced_at TEXT)')
+    cursor.execute('''CREATE TABLE IF NOT EXISTS sync_review
+                      (id INTEGER PRIMARY KEY, uid TEXT, field TEXT, kept_value, other_value, other_device TEXT,
+                      other_ts INTEGER, status TEXT DEFAULT 'open', created_at TEXT DEFAULT CURRENT_TIMESTAMP)''')
+    cursor.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('sync_clock', 0)")
+    cursor.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('sync_applying', 0)")
+    uid = "(SELECT uid FROM matches WHERE id=NEW.id)"
+    row = ", ".join(f"'{f}', {sync_value_sql(f, 'NEW')}" for f in SYNC_FIELDS)
+    cursor.execute(f'''CREATE TRIGGER IF NOT EXISTS matches_log_insert AFTER INSERT ON matches
+                      WHEN {NOT_APPLYING_SQL}
+                      BEGIN
+                          UPDATE matches SET uid=COALESCE(uid, lower(hex(randomblob(16)))) WHERE id=NEW.id;
+                          {log_change_sql(uid, '*', f'json_object({row})', base=False)}
+                      END''')
+    for field, column in zip(SYNC_FIELDS, MATCH_FIELDS):
+        cursor.execute(f'''CREATE TRIGGER IF NOT EXISTS matches_log_{field} AFTER UPDATE OF {column} ON matches
+                          WHEN OLD.{column} IS NOT NEW.{column} AND {NOT_APPLYING_SQL}
+                          BEGIN
+                              {log_change_sql('NEW.uid', field, sync_value_sql(field, 'NEW'))}
+                          END''')
+    cursor.execute(f'''CREATE TRIGGER IF NOT EXISTS matches_log_delete AFTER DELETE ON matches
+                      WHEN {NOT_APPLYING_SQL}
+                      BEGIN
+                          {log_change_sql('OLD.uid', '_deleted', '1', base=False)}
+                      END''')
+    conn.commit()
+    conn.close()
+
+def read_data_version(conn):
+    row = conn.execute("SELECT value FROM meta WHERE key='data_version'").fetchone()
+    return row[0] if row else 0
+
+def julian_day(date_str):
+    return datetime.strptime(date_str, "%Y-%m-%d").toordinal() + JULIAN_DAY_OFFSET
+
+# ---------- Referees ----------
+def find_referee(conn, name, create=True):
+    """Id of the referee called name (case-insensitive), added on first sight unless create is False."""
+    name = " ".join(name.split())
+    row = conn.execute("SELECT id FROM referees WHERE name=?", (name,)).fetchone()
+    if row:
+        return row[0]
+    if not create:
+        return None
+    return conn.execute("INSERT INTO referees (name) VALUES (?)", (name,)).lastrowid
+
+def match_referee(conn, match):
+    """referee_id for a parsed match dict: its referee_id, else its referee name, else None."""
+    if match.get('referee_id') is not None:
+        return match['referee_id']
+    name = (match.get('referee') or '').strip()
+    return find_referee(conn, name) if name else None
+
+def list_referees(conn):
+    return conn.execute("SELECT id, name FROM referees WHERE active ORDER BY name").fetchall()
+
+def insert_matches(conn, matches):
+    """executemany the parsed match dicts on conn; the caller commits and notifies."""
+    conn.executemany(
+        '''INSERT INTO matches (league, role, subject, content, date, start_time, end_time, location, amount, division,
+                                referee_id)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''',
+        [(match['league'], match['role'], match['match_name'], match.get('content') or f"{match['match_name']} details",
+          match['date'], match['start_time'], match['end_time'], match['location'], match.get('amount', 0.0),
+          match.get('division', ''), match_referee(conn, match))
+         for match in matches])
+
+def is_locked(error):
+    return isinstance(error, sqlite3.OperationalError) and ("locked" in str(error) or "busy" in str(error))
+
+# data_version ranges (before, after] committed by this process through write_transaction, per database;
+# lets a ChangeWatcher tell this process's own writes from everyone else's
+_own_writes = OrderedDict()
+OWN_WRITES_KEPT = 1000
+
+def write_transaction(func, *args, path=None, retries=4):
+    """func(conn, *args) in one BEGIN IMMEDIATE transaction, committed; returns what func returns.
+
+    IMMEDIATE takes the write lock up front, so the busy timeout covers the whole transaction instead
+    of failing when a read turns into a write. If another process still holds the lock after
+    BUSY_TIMEOUT, the transaction is rolled back and run again after a short backoff, so func must
+    not have side effects outside conn.
+    """
+    delay = 0.2
+    for attempt in range(retries + 1):
+        conn = connect(path)
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            before = read_data_version(conn)
+            result = func(conn, *args)
+            after = read_data_version(conn)
+            conn.commit()
+            if after != before:
+                _own_writes[(path or DB_PATH, before)] = after
+                while len(_own_writes) > OWN_WRITES_KEPT:
+                    _own_writes.popitem(last=False)
+            return result
+        except sqlite3.OperationalError as e:
+            conn.rollback()
+            if not is_locked(e) or attempt == retries:
+                raise
+        finally:
+            conn.close()
+        time.sleep(delay)
+        delay *= 2
+
+def add_matches_to_db(matches):
+    write_transaction(insert_matches, matches)
+    notify_matches_changed(*(match['date'] for match in matches))
+
+# ---------- Month summaries ----------
+def load_month_summary(year, month, referee_id=None):
+    # {julian day: [(role, league, division), ...]} for a single month, optionally one referee's
+    conn = connect()
+    cur = conn.cursor()
+    query = "SELECT date, league, role, division FROM matches WHERE date BETWEEN ? AND ?"
+    params = [f"{year:04d}-{month:02d}-01", f"{year:04d}-{month:02d}-31"]
+    if referee_id is not None:
+        query += " AND referee_id=?"
+        params.append(referee_id)
+    cur.execute(query, params)
+    rows = cur.fetchall()
+    conn.close()
+
+    summary = {}
+    for date_str, league, role, division in rows:
+        try:
+            jd = julian_day(date_str)
+        except (TypeError, ValueError):
+            continue
+        summary.setdefault(jd, []).append((role, league, division))
+    return summary
+
+# ---------- Change notification ----------
+# bumped on every write; caches that outlive a single query key on it
+DATA_VERSION = 0
+_listeners = []
+
+def on_matches_changed(callback):
+    """Register callback(*dates) to run after every write; returns callback so it can decorate."""
+    _listeners.append(callback)
+    return callback
+
+def notify_matches_changed(*dates):
+    # every write path calls this with the dates it touched
+    global DATA_VERSION
+    DATA_VERSION += 1
+    for callback in list(_listeners):
+        callback(*dates)
+
+class ChangeWatcher:
+    """Notices commits from other connections and processes without reading any table.
+
+    PRAGMA data_version on a connection only moves when someone else commits, so poll() is a single
+    pragma while nothing happens; meta.data_version then says whether matches actually changed.
+    With skip_own, changes made entirely by this process's write_transaction calls (which it has
+    already refreshed for) don't count; anything else committed in between still does.
+    """
+
+    def __init__(self, path=None, skip_own=False):
+        self.path = path or DB_PATH
+        self.skip_own = skip_own
+        self.conn = connect(path)
+        self._pragma = self.conn.execute("PRAGMA data_version").fetchone()[0]
+        self.version = read_data_version(self.conn)
+
+    def poll(self):
+        """True once per batch of matches changes made since the last poll() or mark_seen()."""
+        pragma = self.conn.execute("PRAGMA data_version").fetchone()[0]
+        if pragma == self._pragma:
+            return False
+        self._pragma = pragma
+        version = read_data_version(self.conn)
+        if version == self.version:
+            return False
+        seen, self.version = self.version, version
+        return not (self.skip_own and self._own(seen, version))
+
+    def _own(self, seen, version):
+        # every commit between the two versions has to be one of ours
+        while seen != version:
+            seen = _own_writes.get((self.path, seen))
+            if seen is None:
+                return False
+        return True
+
+    def close(self):
+        self.conn.close()
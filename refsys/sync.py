@@ -0,0 +1,340 @@
+"""Delta sync of matches between devices (desktop, laptop, ...) through a change log.
+
+Triggers in storage.update_db_structure append every insert, field edit and delete of a match
+to change_log as (device, seq): this database's device id and its next sequence number. Rows
+are known across devices by their uid, referees by name. A device's version vector is the
+highest seq it holds from every device, so two peers only exchange the log entries the other
+is missing; a sync costs in proportion to the changes since the last one, not the database size.
+
+    python -m refsys serve --db hub.db --token s3cret        # any machine, or a scratch stand-in
+    python -m refsys sync http://desktop:8765 --token s3cret
+    python -m refsys sync /media/usb/matches.db              # or straight against another file
+
+Each change remembers the version it overwrote. When it reaches a device whose current
+version of that field is something else, the two edits were concurrent: the newer one (hybrid
+logical clock, then device id) wins everywhere, and for fields under the "review" policy the
+losing value goes to sync_review so it can be restored by hand. A delete wins over edits.
+"""
+import heapq
+import json
+import os
+from urllib.parse import urlsplit
+
+from refsys import storage
+
+BATCH = 500
+CHANGE_COLUMNS = ("device", "seq", "uid", "field", "value", "ts", "base_device", "base_seq")
+
+class SyncError(Exception):
+    pass
+
+# ---------- Version vectors ----------
+def device_id(conn):
+    return conn.execute("SELECT id FROM sync_device").fetchone()[0]
+
+def version_vector(conn):
+    """{device: highest seq held}, this device included."""
+    vv = dict(conn.execute("SELECT device, seq FROM sync_vv"))
+    own, seq = conn.execute("SELECT id, seq FROM sync_device").fetchone()
+    vv[own] = seq
+    return vv
+
+def changes_since(conn, vv, limit=BATCH):
+    """Up to limit log entries the holder of vv is missing, in the order this device logged them.
+
+    Every device's entries are read through the (device, seq) index and merged by log id, so
+    the batch is a prefix of the missing changes and never has an edit before the insert it edits.
+    """
+    streams = []
+    for device, top in version_vector(conn).items():
+        if top > vv.get(device, 0):
+            streams.append(conn.execute(
+                f"""SELECT id, {', '.join(CHANGE_COLUMNS)} FROM change_log
+                    WHERE device=? AND seq>? ORDER BY seq LIMIT ?""", (device, vv.get(device, 0), limit)).fetchall())
+    return [list(row[1:]) for _, row in zip(range(limit), heapq.merge(*streams))]
+
+def new_device(conn):
+    """Gives this database a fresh device id, e.g. after copying matches.db to a second machine."""
+    old, seq = conn.execute("SELECT id, seq FROM sync_device").fetchone()
+    with conn:
+        if seq:
+            conn.execute("INSERT OR REPLACE INTO sync_vv (device, seq) VALUES (?, ?)", (old, seq))
+        conn.execute("UPDATE sync_device SET id=lower(hex(randomblob(8))), seq=0")
+    return device_id(conn)
+
+def publish_history(conn):
+    """Logs matches that predate the change log as inserts, once, so peers receive them too."""
+    if conn.execute("SELECT 1 FROM meta WHERE key='sync_published'").fetchone():
+        return 0
+    fields = ", ".join(f"'{f}', {storage.sync_value_sql(f, 'm')}" for f in storage.SYNC_FIELDS)
+    with conn:
+        rows = conn.execute(f"""SELECT m.uid, json_object({fields}) FROM matches m
+                                WHERE NOT EXISTS (SELECT 1 FROM field_versions v WHERE v.uid=m.uid AND v.field='*')
+                                ORDER BY m.id""").fetchall()
+        if rows:
+            own, first = conn.execute("SELECT id, seq + 1 FROM sync_device").fetchone()
+            clock = tick(conn)
+            conn.execute("UPDATE sync_device SET seq=seq+?", (len(rows),))
+            conn.executemany("""INSERT INTO change_log (device, seq, uid, field, value, ts) VALUES (?, ?, ?, '*', ?, ?)""",
+                             [(own, first + i, uid, value, clock) for i, (uid, value) in enumerate(rows)])
+            conn.executemany("INSERT OR REPLACE INTO field_versions (uid, field, ts, device, seq) VALUES (?, '*', ?, ?, ?)",
+                             [(uid, clock, own, first + i) for i, (uid, _) in enumerate(rows)])
+        conn.execute("INSERT INTO meta (key, value) VALUES ('sync_published', 1)")
+    return len(rows)
+
+def tick(conn, seen=0):
+    conn.execute(f"UPDATE meta SET value=MAX(value+1, ?, {storage.NOW_MS_SQL}) WHERE key='sync_clock'", (seen,))
+    return conn.execute("SELECT value FROM meta WHERE key='sync_clock'").fetchone()[0]
+
+# ---------- Applying remote changes ----------
+class ApplyResult:
+    def __init__(self):
+        self.received = 0
+        self.applied = 0
+        self.conflicts = 0
+        self.queued = 0
+        self.dates = set()
+
+def column_value(conn, field, value):
+    if field == "referee":
+        return "referee_id", storage.find_referee(conn, value) if value else None
+    return field, value
+
+def apply_changes(conn, changes, policies=None):
+    """Applies change rows from another device in one transaction; returns an ApplyResult.
+
+    policies maps a field to "lww" (the default) or "review".
+    """
+    policies = policies or {}
+    result = ApplyResult()
+    own = device_id(conn)
+    try:
+        conn.execute("UPDATE meta SET value=1 WHERE key='sync_applying'")
+        for change in changes:
+            change = dict(zip(CHANGE_COLUMNS, change))
+            if change["device"] != own:
+                apply_change(conn, change, policies, result)
+        conn.execute("UPDATE meta SET value=0 WHERE key='sync_applying'")
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    return result
+
+def apply_change(conn, change, policies, result):
+    device, seq, uid, field = change["device"], change["seq"], change["uid"], change["field"]
+    cur = conn.execute(f"INSERT OR IGNORE INTO change_log ({', '.join(CHANGE_COLUMNS)}) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                       [change[c] for c in CHANGE_COLUMNS])
+    if not cur.rowcount:
+        # the same change arriving again carries the same value and clock; anything else is another database
+        known = conn.execute("SELECT uid, field, value, ts FROM change_log WHERE device=? AND seq=?",
+                             (device, seq)).fetchone()
+        if known != (uid, field, change["value"], change["ts"]):
+            raise SyncError(f"device {device} sent a different change {seq}: two databases share that device id "
+                            f"(copied matches.db?); run `python -m refsys sync --new-device` on one of them")
+        return
+    result.received += 1
+    conn.execute("""INSERT INTO sync_vv (device, seq) VALUES (?, ?)
+                    ON CONFLICT (device) DO UPDATE SET seq=MAX(seq, excluded.seq)""", (device, seq))
+    tick(conn, change["ts"])
+    version = (change["ts"], device, seq)
+
+    if conn.execute("SELECT 1 FROM field_versions WHERE uid=? AND field='_deleted'", (uid,)).fetchone():
+        return  # deleted here already; a delete wins over everything
+    row = conn.execute("SELECT id, date FROM matches WHERE uid=?", (uid,)).fetchone()
+    if row:
+        result.dates.add(row[1])
+
+    if field == "_deleted":
+        if row:
+            conn.execute("DELETE FROM matches WHERE id=?", (row[0],))
+            result.applied += 1
+        set_version(conn, uid, field, version)
+        conn.execute("UPDATE sync_review SET status='superseded' WHERE uid=? AND status='open'", (uid,))
+        return
+    if field == "*":
+        if not row:
+            values = json.loads(change["value"])
+            columns = dict(column_value(conn, f, values.get(f)) for f in storage.SYNC_FIELDS)
+            conn.execute(f"INSERT INTO matches (uid, {', '.join(columns)}) VALUES (?{', ?' * len(columns)})",
+                         [uid] + list(columns.values()))
+            result.applied += 1
+            result.dates.add(values.get("date"))
+        if not conn.execute("SELECT 1 FROM field_versions WHERE uid=? AND field='*'", (uid,)).fetchone():
+            set_version(conn, uid, field, version)
+        return
+    if field not in storage.SYNC_FIELDS:
+        return
+
+    local = conn.execute("""SELECT ts, device, seq, field FROM field_versions WHERE uid=? AND field IN (?, '*')
+                            ORDER BY field='*' LIMIT 1""", (uid, field)).fetchone()
+    column, value = column_value(conn, field, change["value"])
+    if local is None or local[1:3] == (change["base_device"], change["base_seq"]) or (
+            # first edit on top of the insert; copies of one file each logged their own insert of the row
+            local[3] == "*" and change["base_device"] is not None and conn.execute(
+                "SELECT field FROM change_log WHERE device=? AND seq=?",
+                (change["base_device"], change["base_seq"])).fetchone() == ("*",)):
+        # a straight successor of what we have
+        write_field(conn, row, column, value, result)
+        set_version(conn, uid, field, version)
+        conn.execute("UPDATE sync_review SET status='superseded' WHERE uid=? AND field=? AND status='open'",
+                     (uid, field))
+        return
+    # concurrent edits of the same field: the later clock wins, on every device alike
+    result.conflicts += 1
+    remote_wins = (change["ts"], device) > (local[0], local[1])
+    current = conn.execute(f"SELECT {storage.sync_value_sql(field, 'matches')} FROM matches WHERE uid=?",
+                           (uid,)).fetchone() if row else None
+    if remote_wins:
+        write_field(conn, row, column, value, result)
+        set_version(conn, uid, field, version)
+    if policies.get(field) == "review" and current is not None and current[0] != change["value"]:
+        kept, other = (change["value"], current[0]) if remote_wins else (current[0], change["value"])
+        conn.execute("""INSERT INTO sync_review (uid, field, kept_value, other_value, other_device, other_ts)
+                        VALUES (?, ?, ?, ?, ?, ?)""",
+                     (uid, field, kept, other, local[1] if remote_wins else device,
+                      local[0] if remote_wins else change["ts"]))
+        result.queued += 1
+
+def write_field(conn, row, column, value, result):
+    if row is None:
+        return  # its insert hasn't arrived yet; it will carry the current values
+    conn.execute(f"UPDATE matches SET {column}=? WHERE id=?", (value, row[0]))
+    result.applied += 1
+    if column == "date":
+        result.dates.add(value)
+
+def set_version(conn, uid, field, version):
+    conn.execute("INSERT OR REPLACE INTO field_versions (uid, field, ts, device, seq) VALUES (?, ?, ?, ?, ?)",
+                 (uid, field) + version)
+
+# ---------- Protocol ----------
+def exchange(conn, request, policies=None, limit=BATCH):
+    """Server side of one round: take the peer's changes, answer with what the peer is missing.
+
+    request: {"device", "vv", "changes", "limit"}; answer: {"device", "vv", "changes", "more"}.
+    """
+    publish_history(conn)
+    result = apply_changes(conn, request.get("changes") or [], policies)
+    if result.dates:
+        storage.notify_matches_changed(*result.dates)
+    limit = min(int(request.get("limit") or limit), 5000)
+    changes = changes_since(conn, request.get("vv") or {}, limit)
+    return {"device": device_id(conn), "vv": version_vector(conn), "changes": changes, "more": len(changes) == limit}
+
+class FilePeer:
+    """Another matches.db on disk (USB stick, shared folder) used as the sync server."""
+
+    def __init__(self, path, policies=None):
+        self.path = path
+        self.policies = policies
+
+    def __call__(self, request):
+        storage.init_db(self.path)
+        storage.update_db_structure(self.path)
+        conn = storage.connect(self.path)
+        try:
+            return exchange(conn, request, self.policies)
+        finally:
+            conn.close()
+
+class HttpPeer:
+    """`python -m refsys serve` on another machine (POST /sync)."""
+
+    def __init__(self, url, token=None, timeout=60):
+        self.url = urlsplit(url if "://" in url else "http://" + url)
+        self.token = token
+        self.timeout = timeout
+
+    def __call__(self, request):
+        import http.client
+        conn_class = http.client.HTTPSConnection if self.url.scheme == "https" else http.client.HTTPConnection
+        conn = conn_class(self.url.hostname, self.url.port, timeout=self.timeout)
+        headers = {"Content-Type": "application/json"}
+        if self.token:
+            headers["Authorization"] = f"Bearer {self.token}"
+        try:
+            conn.request("POST", self.url.path.rstrip("/") + "/sync", json.dumps(request).encode("utf-8"), headers)
+            response = conn.getresponse()
+            body = response.read()
+        except OSError as e:
+            raise SyncError(f"can't reach {self.url.geturl()}: {e}")
+        finally:
+            conn.close()
+        if response.status != 200:
+            try:
+                message = json.loads(body)["error"]
+            except (ValueError, KeyError):
+                message = body[:200].decode("utf-8", "replace")
+            raise SyncError(f"{self.url.geturl()} answered {response.status}: {message}")
+        return json.loads(body)
+
+def peer_for(target, token=None, policies=None):
+    """(name, peer): a URL or host:port is a `refsys serve`, anything else a database file."""
+    if "://" not in target and (os.path.exists(target) or target.endswith(".db")):
+        return os.path.abspath(target), FilePeer(target, policies)
+    return target, HttpPeer(target, token)
+
+class SyncResult:
+    def __init__(self):
+        self.sent = 0
+        self.received = 0
+        self.applied = 0
+        self.conflicts = 0
+        self.queued = 0
+        self.rounds = 0
+        self.dates = set()
+
+def sync(conn, peer, name, policies=None, batch=BATCH):
+    """Exchanges deltas with peer (FilePeer/HttpPeer or any callable taking a request dict)."""
+    publish_history(conn)
+    row = conn.execute("SELECT vv FROM sync_peers WHERE peer=?", (name,)).fetchone()
+    acked = json.loads(row[0]) if row else {}
+    result = SyncResult()
+    while True:
+        outgoing = changes_since(conn, acked, batch)
+        answer = peer({"device": device_id(conn), "vv": version_vector(conn), "changes": outgoing, "limit": batch})
+        applied = apply_changes(conn, answer["changes"], policies)
+        acked = answer["vv"]
+        with conn:
+            conn.execute("INSERT OR REPLACE INTO sync_peers (peer, vv, synced_at) VALUES (?, ?, CURRENT_TIMESTAMP)",
+                         (name, json.dumps(acked)))
+        result.rounds += 1
+        result.sent += len(outgoing)
+        result.received += applied.received
+        result.applied += applied.applied
+        result.conflicts += applied.conflicts
+        result.queued += applied.queued
+        result.dates |= applied.dates
+        if len(outgoing) < batch and not answer["more"]:
+            break
+    if result.dates:
+        storage.notify_matches_changed(*result.dates)
+    return result
+
+# ---------- Review queue ----------
+def review_items(conn, status="open"):
+    return conn.execute("""SELECT r.id, COALESCE(m.date, ''), COALESCE(m.subject, ''), r.field, r.kept_value,
+                                  r.other_value, r.other_device, r.created_at
+                           FROM sync_review r LEFT JOIN matches m ON m.uid=r.uid
+                           WHERE r.status=? ORDER BY r.id""", (status,)).fetchall()
+
+def resolve_review(conn, review_id, restore):
+    """Dismisses a queued value, or restores it as a new local edit that every device will take."""
+    item = conn.execute("SELECT uid, field, other_value FROM sync_review WHERE id=? AND status='open'",
+                        (review_id,)).fetchone()
+    if item is None:
+        raise SyncError(f"no open review item {review_id}")
+    uid, field, value = item
+    dates = []
+    with conn:
+        if restore:
+            row = conn.execute("SELECT id, date FROM matches WHERE uid=?", (uid,)).fetchone()
+            if row is None:
+                raise SyncError("that match has been deleted")
+            column, value = column_value(conn, field, value)
+            conn.execute(f"UPDATE matches SET {column}=? WHERE id=?", (value, row[0]))
+            dates = [row[1]] + ([value] if column == "date" else [])
+        conn.execute("UPDATE sync_review SET status=? WHERE id=?", ("restored" if restore else "dismissed", review_id))
+    if dates:
+        storage.notify_matches_changed(*dates)
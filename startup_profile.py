@@ -0,0 +1,156 @@
+"""Startup timing for RefSys_PySide6.py --profile-startup / --startup-benchmark.
+
+Kept free of Qt imports so it can be loaded (and start timing imports) before PySide6.
+"""
+import importlib.abc
+import json
+import platform
+import sys
+import time
+from contextlib import contextmanager
+
+
+class _TimedLoader(importlib.abc.Loader):
+    """Wraps a module loader and reports how long exec_module took."""
+
+    def __init__(self, loader, profiler):
+        self._loader = loader
+        self._profiler = profiler
+
+    def create_module(self, spec):
+        return self._loader.create_module(spec)
+
+    def exec_module(self, module):
+        self._profiler._enter()
+        try:
+            self._loader.exec_module(module)
+        finally:
+            self._profiler._leave(module.__name__)
+
+    def __getattr__(self, name):
+        return getattr(self._loader, name)
+
+
+class ImportProfiler(importlib.abc.MetaPathFinder):
+    """In-process equivalent of `python -X importtime`.
+
+    Records self and cumulative microseconds for every module imported while installed;
+    also works in the frozen exe where -X options can't be passed.
+    """
+
+    def __init__(self):
+        self.records = []
+        self._stack = []
+        self._resolving = set()
+
+    @classmethod
+    def install(cls):
+        profiler = cls()
+        sys.meta_path.insert(0, profiler)
+        return profiler
+
+    def uninstall(self):
+        if self in sys.meta_path:
+            sys.meta_path.remove(self)
+
+    def find_spec(self, name, path=None, target=None):
+        if name in self._resolving:
+            return None
+        self._resolving.add(name)
+        try:
+            for finder in sys.meta_path:
+                if finder is self or not hasattr(finder, "find_spec"):
+                    continue
+                spec = finder.find_spec(name, path, target)
+                if spec is not None:
+                    break
+            else:
+                return None
+        finally:
+            self._resolving.discard(name)
+        if spec.loader is not None and hasattr(spec.loader, "exec_module"):
+            spec.loader = _TimedLoader(spec.loader, self)
+        return spec
+
+    def _enter(self):
+        # [start, time spent in nested imports]
+        self._stack.append([time.perf_counter(), 0.0])
+
+    def _leave(self, name):
+        started, nested = self._stack.pop()
+        cumulative = time.perf_counter() - started
+        if self._stack:
+            self._stack[-1][1] += cumulative
+        self.records.append({
+            "module": name,
+            "self_us": round((cumulative - nested) * 1e6),
+            "cumulative_us": round(cumulative * 1e6),
+            "depth": len(self._stack),
+        })
+
+    def top_level(self):
+        """Cumulative time per top-level package, e.g. PySide6, numpy, dateparser."""
+        totals = {}
+        for record in self.records:
+            if record["depth"] == 0:
+                package = record["module"].split(".")[0]
+                totals[package] = totals.get(package, 0) + record["cumulative_us"]
+        return dict(sorted(totals.items(), key=lambda item: -item[1]))
+
+
+class StartupProfile:
+    """Per-phase wall clock, measured from process start (the first line of the app)."""
+
+    def __init__(self, process_start):
+        self.process_start = process_start
+        self.phases = []
+        self.imports = None
+
+    def _ms(self, moment):
+        return round((moment - self.process_start) * 1000, 1)
+
+    def add(self, name, started, finished=None):
+        finished = time.perf_counter() if finished is None else finished
+        self.phases.append({
+            "phase": name,
+            "start_ms": self._ms(started),
+            "ms": round((finished - started) * 1000, 1),
+        })
+        return finished
+
+    @contextmanager
+    def phase(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, started)
+
+    def duration(self, name):
+        return sum(p["ms"] for p in self.phases if p["phase"] == name)
+
+    def report(self, first_paint, top_imports=40):
+        report = {
+            "python": platform.python_version(),
+            "frozen": bool(getattr(sys, "frozen", False)),
+            "platform": platform.platform(),
+            "time_to_first_paint_ms": self._ms(first_paint),
+            "phases": self.phases,
+        }
+        if self.imports is not None:
+            slowest = sorted(self.imports.records, key=lambda r: -r["cumulative_us"])
+            report["imports"] = {
+                "count": len(self.imports.records),
+                "by_package_us": self.imports.top_level(),
+                "slowest": slowest[:top_imports],
+            }
+        return report
+
+    def write(self, path, first_paint):
+        report = self.report(first_paint)
+        if path:
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(report, f, indent=2)
+        elif sys.stdout is not None:
+            print(json.dumps(report, indent=2))
+        return report
@@ -0,0 +1,27 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from refsys import storage  # noqa: E402
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    """A fresh, fully upgraded matches.db in tmp_path, made the default for storage.connect()."""
+    path = str(tmp_path / "matches.db")
+    monkeypatch.setattr(storage, "DB_PATH", path)
+    # listeners a test registers go away with it
+    monkeypatch.setattr(storage, "_listeners", list(storage._listeners))
+    storage.init_db()
+    storage.update_db_structure()
+    return path
+
+
+def make_match(**fields):
+    match = {"league": "BCSPL", "role": "Referee", "match_name": "Home vs Away", "date": "2024-05-04",
+             "start_time": "10:00", "end_time": "11:30", "location": "Park", "amount": 40.0, "division": "U13"}
+    match.update(fields)
+    return match
@@ -0,0 +1,52 @@
+from refsys import storage
+from refsys.assign import Travel, open_slots, save_assignment, set_availability, slots_from_records, solve
+
+DAY = "2025-05-03"
+
+
+def fixture(number, start, division, venue):
+    return number, {"Date": DAY, "Time": start, "Home": f"Home {number}", "Away": f"Away {number}",
+                    "League": "BCSPL", "Division": division, "Venue": venue}
+
+
+def add_referee(conn, name, grade, window=("08:00", "20:00"), max_per_day=None):
+    referee_id = storage.find_referee(conn, name)
+    conn.execute("UPDATE referees SET grade=?, max_per_day=? WHERE id=?", (grade, max_per_day, referee_id))
+    set_availability(conn, referee_id, [DAY], *window)
+    return referee_id
+
+
+def test_solver_respects_grades_windows_travel_and_limits(db):
+    conn = storage.connect()
+    with conn:
+        add_referee(conn, "Senior", 4, max_per_day=2)
+        add_referee(conn, "Junior", 1)
+        add_referee(conn, "Morning", 3, window=("08:00", "12:00"))
+    slots, invalid = slots_from_records([fixture(1, "09:00", "U17", "North"),   # grade 4 referee, grade 3 AR
+                                         fixture(2, "11:00", "U10", "South"),
+                                         fixture(3, "13:00", "U17", "North"),
+                                         fixture(4, "15:00", "U10", "North")], ars=1)
+    assert not invalid and len(slots) == 8
+    travel = Travel({"North": {"South": 60}, "South": {"North": 60}}, default=0)
+    assignment, _ = solve(conn, slots, travel=travel, seconds=1)
+
+    games = {}
+    for slot, referee in zip(assignment.slots, assignment.referee_of):
+        if referee is None:
+            continue
+        assert referee.grade >= slot.grade
+        assert any(s <= slot.start and slot.end <= e for s, e in referee.windows[slot.date])
+        games.setdefault(referee.name, []).append((slot.start, slot.end, slot.venue))
+    for name, day in games.items():
+        day.sort()
+        for (_, end, venue), (start, _, next_venue) in zip(day, day[1:]):
+            assert end + travel(venue, next_venue) <= start, name
+    assert len(games.get("Senior", [])) <= 2
+    # Senior takes the two U17 referee slots; nobody else may, and Morning can't reach 13:00
+    assert games["Senior"] == [(540, 640, "North"), (780, 880, "North")]
+
+    with conn:
+        save_assignment(conn, assignment)
+    filled = len(slots) - assignment.referee_of.count(None)
+    assert len(open_slots(conn, slots)) == len(slots) - filled
+    conn.close()
@@ -0,0 +1,76 @@
+import io
+
+from conftest import make_match
+from refsys import storage
+from refsys.cli import iter_conflicts
+from refsys.conflicts import calculate_end_time, find_time_conflicts, match_problem, times_overlap, week_bounds
+from refsys.records import import_records, iter_csv
+
+
+def test_end_time_and_overlap():
+    assert calculate_end_time("10:00") == "11:40"
+    assert times_overlap("10:00", "11:40", "11:30", "13:00")
+    assert not times_overlap("10:00", "11:40", "11:40", "13:00")
+
+
+def test_week_bounds():
+    assert week_bounds("2024-05-04") == ("2024-04-29", "2024-05-05")
+
+
+def test_conflicts_are_per_referee(db):
+    storage.add_matches_to_db([make_match(referee="Ann Lee"), make_match(referee="Cy Fox", start_time="12:00",
+                                                                         end_time="13:30")])
+    clash = make_match(match_name="Next game", start_time="11:00", end_time="12:30")
+    assert match_problem(dict(clash, referee="Ann Lee")).startswith("overlaps Home vs Away")
+    assert match_problem(dict(clash, referee="Bob Roy")) is None  # never seen, and no unassigned games
+    assert match_problem(dict(clash, start_time="11:30", end_time="13:00", referee="Ann Lee")) is None
+    conn = storage.connect()
+    ann = storage.find_referee(conn, "Ann Lee", create=False)
+    assert [row[1] for row in find_time_conflicts("2024-05-04", "09:00", "10:30", conn, ann)] == ["Home vs Away"]
+    assert list(iter_conflicts(conn)) == []
+    conn.close()
+
+
+def test_unassigned_matches_clash_with_every_referee(db):
+    # the single-user setup: a Spappz paste names the referee, an Assignr one doesn't
+    storage.add_matches_to_db([make_match(referee="Jane Doe", start_time="10:00", end_time="11:40"),
+                               make_match(match_name="Solo game", start_time="14:00", end_time="15:40")])
+    unassigned = make_match(match_name="Assignr game", start_time="10:30", end_time="12:10")
+    assert match_problem(unassigned).startswith("overlaps Home vs Away")
+    named = make_match(match_name="Next game", start_time="15:00", end_time="16:30")
+    assert match_problem(dict(named, referee="Jane Doe")).startswith("overlaps Solo game")
+    assert match_problem(dict(named, referee="Bob Roy")).startswith("overlaps Solo game")  # not in the db yet
+
+    storage.add_matches_to_db([unassigned, dict(named, referee="Ann Lee")])
+    conn = storage.connect()
+    pairs = [(date, referee, first, second) for date, referee, _, _, first, _, _, second in iter_conflicts(conn)]
+    assert pairs == [("2024-05-04", "Jane Doe", "Home vs Away", "Assignr game"),
+                     ("2024-05-04", "Ann Lee", "Solo game", "Next game")]
+    ann = storage.find_referee(conn, "Ann Lee", create=False)
+    assert [pair[4] for pair in iter_conflicts(conn, referee_id=ann)] == ["Solo game"]
+    conn.close()
+
+
+def test_import_checks_unassigned_matches(db):
+    storage.add_matches_to_db([make_match(match_name="Solo game")])
+    csv = "Date,Time,Match,League,Division,Referee\n2024-05-04,10:30,Other game,BCSPL,U15,Ann Lee\n"
+    conn = storage.connect()
+    result = import_records(conn, iter_csv(io.StringIO(csv)))
+    conn.close()
+    assert [reason for _, _, reason in result.conflicts] == ["overlaps Solo game"]
+
+
+def test_workload_limits(db):
+    storage.add_matches_to_db([make_match(referee="Ann Lee"),
+                               make_match(date="2024-05-01", start_time="18:00", end_time="19:30", referee="Ann Lee")])
+    conn = storage.connect()
+    with conn:
+        conn.execute("UPDATE referees SET max_per_day=1, max_per_week=3 WHERE name='Ann Lee'")
+    later = make_match(match_name="Later", start_time="15:00", end_time="16:30", referee="Ann Lee")
+    assert match_problem(later, conn).startswith("daily limit 1")
+    assert match_problem(later, conn, check_limits=False) is None
+    with conn:
+        conn.execute("UPDATE referees SET max_per_day=NULL, max_per_week=2 WHERE name='Ann Lee'")
+    assert match_problem(later, conn).startswith("weekly limit 2")
+    assert match_problem(dict(later, date="2024-05-06"), conn) is None
+    conn.close()
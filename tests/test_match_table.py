@@ -0,0 +1,40 @@
+import os
+
+import pytest
+
+pytest.importorskip("PySide6")
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+from PySide6.QtCore import QModelIndex, Qt  # noqa: E402
+from PySide6.QtWidgets import QApplication  # noqa: E402
+
+import RefSys_PySide6 as gui  # noqa: E402
+from conftest import make_match  # noqa: E402
+from refsys import storage  # noqa: E402
+
+
+@pytest.fixture
+def model(db, monkeypatch):
+    QApplication.instance() or QApplication([])
+    gui.QUERY_MEMO.clear()
+    monkeypatch.setattr(gui.MatchTableModel, "PAGE_SIZE", 2)
+    return gui.MatchTableModel()
+
+
+def fetch_all(model):
+    while model.canFetchMore(QModelIndex()):
+        model.fetchMore(QModelIndex())
+    return [model.match_id(row) for row in range(model.rowCount())]
+
+
+@pytest.mark.parametrize("column", [gui.MatchTableModel.DATE_COLUMN, 5, 6])
+@pytest.mark.parametrize("order", [Qt.AscendingOrder, Qt.DescendingOrder])
+def test_paging_crosses_null_times(model, column, order):
+    # NULL start/end times at both ends and in the middle of the sort order
+    times = [None, "09:00", None, "11:00", "12:00", None, "15:00"]
+    storage.add_matches_to_db([make_match(date=f"2024-05-{day:02d}", start_time=t, end_time=t, match_name=f"Game {day}")
+                               for day, t in enumerate(times, 1)])
+    model.sort(column, order)
+    model.set_filters("2024-05-01", "2024-05-31")
+    ids = fetch_all(model)
+    assert sorted(ids) == list(range(1, len(times) + 1))
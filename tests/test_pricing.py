@@ -0,0 +1,38 @@
+from conftest import make_match
+from refsys import storage
+from refsys.pricing import infer_match_amount, reprice_matches, rollback_reprice
+
+
+def amounts():
+    conn = storage.connect()
+    rows = [row[0] for row in conn.execute("SELECT amount FROM matches ORDER BY id")]
+    conn.close()
+    return rows
+
+
+def test_reprice_dry_run_writes_nothing(db):
+    storage.add_matches_to_db([make_match(division="U15", amount=1.0)])
+    batch, changes = reprice_matches(dry_run=True)
+    assert batch is None and len(changes) == 1
+    assert amounts() == [1.0]
+
+
+def test_reprice_and_rollback(db):
+    expected = infer_match_amount("BCSPL", "Referee", "U15")
+    storage.add_matches_to_db([make_match(division="U15", amount=1.0), make_match(division="U15", start_time="14:00", end_time="15:30", amount=2.0)])
+    batch, changes = reprice_matches()
+    assert batch and len(changes) == 2
+    assert amounts() == [expected, expected]
+
+    # a row edited after the re-price keeps its edit
+    conn = storage.connect()
+    with conn:
+        conn.execute("UPDATE matches SET amount=99 WHERE id=2")
+    conn.close()
+    assert rollback_reprice(batch) == 1
+    assert amounts() == [1.0, 99.0]
+
+
+def test_reprice_without_changes_makes_no_batch(db):
+    storage.add_matches_to_db([make_match(division="U15", amount=infer_match_amount("BCSPL", "Referee", "U15"))])
+    assert reprice_matches() == (None, [])
@@ -0,0 +1,123 @@
+import io
+
+import pytest
+
+from conftest import make_match
+from refsys import storage
+from refsys.records import (RecordError, column_map, import_records, iter_csv, parse_date, parse_role, parse_time,
+                            to_match)
+
+CSV = """Game Date,Time,Home Team,Away Team,League,Age Group,Position,Venue,Fee,Referee
+05/04/2024,10:00 AM,Lions,Tigers,BCSPL,U15,Referee,Park 1,$65.00,Ann Lee
+2024-05-04,,Bears,Wolves,BCSPL,U15,AR,Park 2,,Ann Lee
+not a date,10:00,Hawks,Owls,BCSPL,U15,AR,Park 2,,Ann Lee
+2024-05-04,10:30,Foxes,Crows,BCSPL,U15,AR,Park 3,40,Ann Lee
+2024-05-04,10:00 AM,Lions,Tigers,BCSPL,U15,Referee,Park 1,$65.00,Ann Lee
+2024-05-04,13:00,Sharks,Eels,BCSPL,U16,AR,Park 4,,Bob Roy
+"""
+
+
+def records():
+    return list(iter_csv(io.StringIO(CSV)))
+
+
+def count(sql):
+    conn = storage.connect()
+    value = conn.execute(sql).fetchone()[0]
+    conn.close()
+    return value
+
+
+def test_column_map_aliases_and_overrides():
+    mapping = column_map(["Game Date", "Kickoff", "Teams", "Custom"], {"location": "Custom"})
+    assert mapping == {"date": "Game Date", "start_time": "Kickoff", "subject": "Teams", "location": "Custom"}
+    with pytest.raises(RecordError):
+        column_map(["Date"], {"colour": "Date"})
+
+
+def test_parse_date_and_time_formats():
+    assert parse_date("May 4, 2024") == parse_date("05/04/2024") == "2024-05-04"
+    assert parse_time("1:30 PM") == "13:30"
+    with pytest.raises(RecordError):
+        parse_time("noonish")
+
+
+@pytest.mark.parametrize("cell, expected", [
+    ("2024-05-12 10:30", ("2024-05-12", "10:30")),
+    ("2024-05-12T10:30:00", ("2024-05-12", "10:30")),
+    ("05/12/2024 1:30 PM", ("2024-05-12", "13:30")),
+    ("May 12, 2024 10:30 AM", ("2024-05-12", "10:30")),
+])
+def test_date_and_time_in_one_cell(cell, expected):
+    match = to_match({"Date": cell, "Match": "Home vs Away"}, column_map(["Date", "Match"]))
+    assert (match["date"], match["start_time"]) == expected
+    # a separate time column still wins
+    match = to_match({"Date": cell, "Time": "18:00", "Match": "Home vs Away"}, column_map(["Date", "Time", "Match"]))
+    assert (match["date"], match["start_time"]) == (expected[0], "18:00")
+
+
+def test_roles_are_stored_and_priced_under_their_canonical_name():
+    for text in ("Assistant Referee", "AR 1", "assistant", "AR2", "Linesman"):
+        assert parse_role(text) == "AR"
+    for text in ("referee", "Referee", "Centre Referee", "CR", ""):
+        assert parse_role(text) == "Referee"
+    with pytest.raises(RecordError):
+        parse_role("Fourth Official")
+    mapping = column_map(["Date", "Time", "Match", "League", "Division", "Role"])
+    match = to_match({"Date": "2024-05-04", "Time": "10:00", "Match": "Home vs Away", "League": "BCSPL",
+                      "Division": "U15", "Role": "Assistant Referee 2"}, mapping)
+    assert match["role"] == "AR"
+    assert match["amount"] == to_match({"Date": "2024-05-04", "Time": "10:00", "Match": "Home vs Away",
+                                        "League": "BCSPL", "Division": "U15", "Role": "AR"}, mapping)["amount"]
+
+
+def test_import_validates_and_reports(db):
+    conn = storage.connect()
+    result = import_records(conn, records())
+    conn.close()
+    assert result.added == 2
+    assert [(line, reason) for line, reason, _ in result.invalid] == [(3, "missing start time"),
+                                                                     (4, "unreadable date: 'not a date'")]
+    assert [line for line, _, _ in result.conflicts] == [5]  # overlaps Lions vs Tigers for Ann Lee
+    assert [line for line, _ in result.duplicates] == [6]
+    assert count("SELECT COUNT(*) FROM matches") == 2
+    assert count("SELECT COUNT(*) FROM referees") == 2
+    assert count("SELECT amount FROM matches WHERE subject='Lions vs Tigers'") == 65.0
+
+
+def test_dry_run_rolls_everything_back(db):
+    conn = storage.connect()
+    result = import_records(conn, records(), dry_run=True)
+    conn.close()
+    assert result.added == 2
+    assert count("SELECT COUNT(*) FROM matches") == 0
+    # referees met along the way were added inside the transaction, and went with it
+    assert count("SELECT COUNT(*) FROM referees") == 0
+
+
+def test_import_checks_against_existing_matches(db):
+    storage.add_matches_to_db([make_match(start_time="12:45", end_time="14:15", referee="Bob Roy")])
+    conn = storage.connect()
+    result = import_records(conn, records())
+    conn.close()
+    assert [line for line, _, _ in result.conflicts] == [5, 7]
+
+
+def test_import_checks_workload_limits(db):
+    conn = storage.connect()
+    with conn:
+        storage.find_referee(conn, "Ann Lee")
+        conn.execute("UPDATE referees SET max_per_day=1 WHERE name='Ann Lee'")
+    result = import_records(conn, records(), allow_conflicts=True)
+    assert [(line, reason) for line, _, reason in result.conflicts] == [(5, "daily limit 1 reached")]
+    result = import_records(conn, records(), allow_conflicts=True, check_limits=False)
+    conn.close()
+    # the rest went in the first time
+    assert result.added == 1 and [line for line, _ in result.duplicates] == [2, 6, 7]
+
+
+def test_allow_conflicts(db):
+    conn = storage.connect()
+    result = import_records(conn, records(), allow_conflicts=True)
+    conn.close()
+    assert result.added == 3 and not result.conflicts
@@ -0,0 +1,54 @@
+import asyncio
+import sqlite3
+import threading
+
+from conftest import make_match
+from refsys import storage
+from refsys.server import MatchServer, WriteBatcher
+
+
+def test_batch_checks_conflicts_inside_its_transaction(db):
+    batcher = WriteBatcher(db)
+    first, clash = make_match(), make_match(match_name="Other vs Game", start_time="10:30", end_time="12:00")
+    (added, conflicts), (added2, conflicts2) = batcher._commit([[first], [clash]])
+    assert added == [first] and not conflicts
+    assert not added2 and conflicts2[0]["match"] == clash
+
+
+def test_batch_waits_out_a_locked_database(db, monkeypatch):
+    monkeypatch.setattr(storage, "BUSY_TIMEOUT", 0.05)
+    holder = sqlite3.connect(db, check_same_thread=False)
+    holder.execute("BEGIN IMMEDIATE")
+    release = threading.Timer(0.3, holder.commit)
+    release.start()
+    try:
+        [(added, conflicts)] = WriteBatcher(db)._commit([[make_match()]])
+    finally:
+        release.join()
+        holder.close()
+    assert len(added) == 1 and not conflicts
+    conn = storage.connect()
+    assert conn.execute("SELECT COUNT(*) FROM matches").fetchone()[0] == 1
+    conn.close()
+
+
+def test_answer_computed_across_a_write_is_not_cached(db):
+    async def run():
+        server = MatchServer(db, readers=1)
+        try:
+            async def racing_write():
+                storage.add_matches_to_db([make_match()])
+                return b"before"
+
+            async def quiet():
+                return b"after"
+
+            assert await server.cached("/day/2024-05-04", racing_write) == b"before"
+            assert not server._cache
+            assert await server.cached("/day/2024-05-04", quiet) == b"after"
+            assert list(server._cache.values()) == [b"after"]
+        finally:
+            await server.writes.close()
+            server.reads.close()
+
+    asyncio.run(run())
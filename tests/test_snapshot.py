@@ -0,0 +1,82 @@
+import os
+
+import numpy as np
+import pytest
+
+from conftest import make_match
+from refsys import storage
+from refsys.snapshot import MANIFEST, load_snapshot, write_snapshot
+
+
+def expected(conn):
+    """{id: (day, start, amount, league)} straight from the database."""
+    return {row[0]: row[1:] for row in conn.execute(
+        "SELECT id, date, start_time, amount, league FROM matches ORDER BY id")}
+
+
+def snapshot_rows(path):
+    snap = load_snapshot(path)
+    leagues = snap.labels("league")
+    return {int(i): (str(day), f"{m // 60:02d}:{m % 60:02d}", float(amount), str(league))
+            for i, day, m, amount, league in zip(snap["id"], snap["day"], snap["start_minute"],
+                                                  snap["amount"], leagues)}
+
+
+@pytest.fixture
+def seeded(db):
+    storage.add_matches_to_db([make_match(date=f"2024-05-{day:02d}", start_time=f"{8 + day % 10:02d}:00",
+                                          league="BCSPL" if day % 2 else "BCCSL", match_name=f"Game {day}")
+                               for day in range(1, 21)])
+    conn = storage.connect()
+    yield conn
+    conn.close()
+
+
+def test_deltas_merge_to_the_database_contents(seeded, tmp_path):
+    conn, path = seeded, str(tmp_path / "snap")
+    rows, deleted, manifest = write_snapshot(path, conn)
+    assert (rows, deleted, len(manifest["segments"])) == (20, 0, 1)
+    assert snapshot_rows(path) == expected(conn)
+
+    with conn:
+        conn.execute("UPDATE matches SET amount=99, date='2024-06-01' WHERE id=3")
+        conn.execute("DELETE FROM matches WHERE id IN (5, 6)")
+        storage.insert_matches(conn, [make_match(league="NEW", date="2024-04-30", match_name="Early")])
+    rows, deleted, manifest = write_snapshot(path, conn)
+    assert (rows, deleted, len(manifest["segments"])) == (2, 2, 2)
+    assert snapshot_rows(path) == expected(conn)
+    # rows stay ordered by day across segments
+    days = load_snapshot(path)["day"]
+    assert (np.diff(days.astype(np.int64)) >= 0).all()
+
+    # nothing changed: no new segment
+    assert write_snapshot(path, conn)[:2] == (0, 0)
+
+
+def test_deleted_then_reinserted_id_survives(seeded, tmp_path):
+    conn, path = seeded, str(tmp_path / "snap")
+    write_snapshot(path, conn)
+    with conn:
+        conn.execute("DELETE FROM matches WHERE id=20")
+    write_snapshot(path, conn)
+    with conn:
+        storage.insert_matches(conn, [make_match(match_name="Replacement", amount=12.0)])  # reuses id 20
+    write_snapshot(path, conn)
+    assert snapshot_rows(path) == expected(conn)
+
+
+def test_compaction_and_rebuild_keep_the_same_rows(seeded, tmp_path):
+    conn, path = seeded, str(tmp_path / "snap")
+    write_snapshot(path, conn)
+    for i in range(1, 4):
+        with conn:
+            conn.execute("UPDATE matches SET amount=? WHERE id=?", (10.0 * i, i))
+            conn.execute("DELETE FROM matches WHERE id=?", (10 + i,))
+        manifest = write_snapshot(path, conn, compact_after=2)[2]
+    # the third segment triggered compaction into a new base; the fourth write is a delta on top of it
+    assert len(manifest["segments"]) == 2
+    assert sorted(os.listdir(path)) == sorted([MANIFEST] + [s["name"] for s in manifest["segments"]])
+    assert snapshot_rows(path) == expected(conn)
+    manifest = write_snapshot(path, conn, rebuild=True)[2]
+    assert len(manifest["segments"]) == 1
+    assert snapshot_rows(path) == expected(conn)
@@ -0,0 +1,33 @@
+import sqlite3
+
+from conftest import make_match
+from refsys import storage
+from refsys.stats import EarningsCube
+
+
+def test_cube_picks_up_writes_from_another_connection(db):
+    cube = EarningsCube()
+    storage.on_matches_changed(cube.invalidate_dates)
+    storage.add_matches_to_db([make_match(amount=40.0)])
+    watcher = storage.ChangeWatcher()
+    assert cube.query(("year",)) == {("2024",): (1, 40.0)}
+
+    # another process writes; this one only hears about it from the watcher, without dates
+    conn = sqlite3.connect(db)
+    with conn:
+        conn.execute("""INSERT INTO matches (league, role, subject, date, start_time, end_time, location, amount)
+                        VALUES ('BCSPL', 'AR', 'C vs D', '2024-06-01', '12:00', '13:30', 'Park', 25.0)""")
+    conn.close()
+    assert watcher.poll()
+    watcher.close()
+    storage.notify_matches_changed()
+    assert cube.query(("year",)) == {("2024",): (2, 65.0)}
+
+
+def test_cube_rebuilds_touched_month(db):
+    cube = EarningsCube()
+    storage.on_matches_changed(cube.invalidate_dates)
+    storage.add_matches_to_db([make_match(date="2024-05-04", amount=40.0), make_match(date="2024-07-06", amount=30.0)])
+    assert cube.query(("month",)) == {("2024-05",): (1, 40.0), ("2024-07",): (1, 30.0)}
+    storage.add_matches_to_db([make_match(date="2024-07-13", amount=30.0)])
+    assert cube.query(("month",))[("2024-07",)] == (2, 60.0)
@@ -0,0 +1,67 @@
+import sqlite3
+
+import pytest
+
+from conftest import make_match
+from refsys import storage
+
+
+def outside_insert(path, date="2024-06-01"):
+    conn = sqlite3.connect(path)
+    with conn:
+        conn.execute("INSERT INTO matches (league, role, subject, date, start_time, end_time, location, amount) "
+                     "VALUES ('BCSPL', 'AR', 'C vs D', ?, '12:00', '13:30', 'Park', 25.0)", (date,))
+    conn.close()
+
+
+def test_database_runs_in_wal_mode(db):
+    conn = storage.connect()
+    assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+    conn.close()
+
+
+def test_watcher_skips_only_own_writes(db):
+    watcher = storage.ChangeWatcher(skip_own=True)
+    try:
+        assert not watcher.poll()
+        storage.add_matches_to_db([make_match()])
+        storage.add_matches_to_db([make_match(start_time="14:00", end_time="15:30")])
+        assert not watcher.poll()
+
+        outside_insert(db)
+        assert watcher.poll()
+        assert not watcher.poll()
+    finally:
+        watcher.close()
+
+
+def test_outside_write_between_own_writes_is_seen(db):
+    watcher = storage.ChangeWatcher(skip_own=True)
+    try:
+        storage.add_matches_to_db([make_match()])
+        outside_insert(db)
+        storage.add_matches_to_db([make_match(start_time="14:00", end_time="15:30")])
+        assert watcher.poll()
+    finally:
+        watcher.close()
+
+
+def test_watcher_without_skip_own_sees_everything(db):
+    watcher = storage.ChangeWatcher()
+    try:
+        storage.add_matches_to_db([make_match()])
+        assert watcher.poll()
+    finally:
+        watcher.close()
+
+
+def test_write_transaction_rolls_back_on_error(db):
+    def fail(conn):
+        storage.insert_matches(conn, [make_match()])
+        raise ValueError("boom")
+
+    with pytest.raises(ValueError):
+        storage.write_transaction(fail)
+    conn = storage.connect()
+    assert conn.execute("SELECT COUNT(*) FROM matches").fetchone()[0] == 0
+    conn.close()
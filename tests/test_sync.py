@@ -0,0 +1,144 @@
+import json
+import time
+
+import pytest
+
+from conftest import make_match
+from refsys import storage
+from refsys.sync import FilePeer, SyncError, new_device, resolve_review, review_items, sync
+
+
+@pytest.fixture
+def devices(db, tmp_path):
+    """(laptop connection, desktop connection, desktop as a FilePeer); the laptop is the default db."""
+    desktop = str(tmp_path / "desktop.db")
+    storage.init_db(desktop)
+    storage.update_db_structure(desktop)
+    laptop_conn, desktop_conn = storage.connect(db), storage.connect(desktop)
+    yield laptop_conn, desktop_conn, FilePeer(desktop)
+    laptop_conn.close()
+    desktop_conn.close()
+
+
+def rows(conn):
+    return conn.execute("SELECT uid, subject, location, amount FROM matches ORDER BY uid").fetchall()
+
+
+def edit(conn, sql):
+    with conn:
+        conn.execute(sql)
+    time.sleep(0.005)  # keep the clocks of the two edits apart
+
+
+def test_inserts_and_edits_travel_both_ways(devices):
+    laptop, desktop, peer = devices
+    storage.add_matches_to_db([make_match()])
+    with desktop:
+        storage.insert_matches(desktop, [make_match(match_name="Desk game", start_time="15:00", end_time="16:30")])
+    sync(laptop, peer, "desktop")
+    assert rows(laptop) == rows(desktop) and len(rows(laptop)) == 2
+
+    edit(desktop, "UPDATE matches SET amount=55 WHERE subject='Home vs Away'")
+    result = sync(laptop, peer, "desktop")
+    assert result.applied == 1 and result.conflicts == 0
+    assert rows(laptop) == rows(desktop)
+    # nothing new: nothing sent or applied
+    result = sync(laptop, peer, "desktop")
+    assert (result.sent, result.received) == (0, 0)
+
+
+def test_concurrent_edits_last_writer_wins_everywhere(devices):
+    laptop, desktop, peer = devices
+    storage.add_matches_to_db([make_match()])
+    sync(laptop, peer, "desktop")
+    edit(laptop, "UPDATE matches SET location='Laptop Park'")
+    edit(desktop, "UPDATE matches SET location='Desk Park', amount=70")
+    result = sync(laptop, peer, "desktop")
+    assert result.conflicts == 1
+    sync(laptop, peer, "desktop")
+    # the desktop's edit is later; fields edited on one side only are simply taken
+    assert rows(laptop) == rows(desktop)
+    assert rows(laptop)[0][2:] == ("Desk Park", 70.0)
+
+
+def test_delete_wins_over_a_concurrent_edit(devices):
+    laptop, desktop, peer = devices
+    storage.add_matches_to_db([make_match()])
+    sync(laptop, peer, "desktop")
+    edit(desktop, "UPDATE matches SET location='Desk Park'")
+    edit(laptop, "DELETE FROM matches")
+    sync(laptop, peer, "desktop")
+    assert rows(laptop) == rows(desktop) == []
+
+
+def test_review_queue_keeps_and_restores_the_losing_value(devices):
+    laptop, desktop, peer = devices
+    storage.add_matches_to_db([make_match()])
+    sync(laptop, peer, "desktop")
+    edit(laptop, "UPDATE matches SET location='Laptop Park'")
+    edit(desktop, "UPDATE matches SET location='Desk Park'")
+    result = sync(laptop, peer, "desktop", policies={"location": "review"})
+    assert result.queued == 1
+    [item] = review_items(laptop)
+    assert item[3:6] == ("location", "Desk Park", "Laptop Park")
+
+    resolve_review(laptop, item[0], restore=True)
+    assert review_items(laptop) == [] and len(review_items(laptop, "restored")) == 1
+    sync(laptop, peer, "desktop")
+    # restoring is a new edit, so every device takes it
+    assert rows(laptop)[0][2] == rows(desktop)[0][2] == "Laptop Park"
+    with pytest.raises(SyncError):
+        resolve_review(laptop, item[0], restore=False)
+
+
+def copy_of(conn, path):
+    target = storage.connect(path)
+    conn.backup(target)
+    return target
+
+
+def test_copied_database_sharing_a_device_id_is_refused(devices, tmp_path):
+    laptop, desktop, peer = devices
+    storage.add_matches_to_db([make_match()])
+    copy = copy_of(laptop, str(tmp_path / "copy.db"))
+    try:
+        edit(laptop, "UPDATE matches SET amount=1")
+        edit(copy, "UPDATE matches SET amount=2")  # same device id, same seq, another value
+        sync(laptop, peer, "desktop")
+        with pytest.raises(SyncError):
+            sync(copy, peer, "desktop")
+        assert rows(desktop)[0][3] == 1.0
+    finally:
+        copy.close()
+
+
+def test_copied_database_with_a_new_device_id_syncs(devices, tmp_path):
+    laptop, desktop, peer = devices
+    storage.add_matches_to_db([make_match()])
+    copy = copy_of(laptop, str(tmp_path / "copy.db"))
+    try:
+        new_device(copy)
+        edit(laptop, "UPDATE matches SET amount=1")
+        edit(copy, "UPDATE matches SET location='Copy Park'")
+        for conn in (laptop, copy, laptop):
+            sync(conn, peer, "desktop")
+        assert rows(laptop) == rows(desktop) == rows(copy)
+        assert rows(laptop)[0][2:] == ("Copy Park", 1.0)
+    finally:
+        copy.close()
+
+
+def test_changes_sent_again_over_json_are_ignored(devices):
+    laptop, desktop, peer = devices
+
+    def over_json(request):  # what HttpPeer and POST /sync do to both directions
+        return json.loads(json.dumps(peer(json.loads(json.dumps(request)))))
+
+    storage.add_matches_to_db([make_match(amount=0.1)])
+    edit(laptop, "UPDATE matches SET amount=55.5, location='Laptop Park'")
+    sync(laptop, over_json, "desktop")
+    # forget what the desktop acknowledged, so everything goes out a second time
+    edit(laptop, "DELETE FROM sync_peers")
+    result = sync(laptop, over_json, "desktop")
+    assert result.sent > 0 and result.received == 0
+    assert rows(laptop) == rows(desktop)